@@ -0,0 +1,162 @@
+# answers.py | stream of graded answers and what is learned from it
+# Copyright (C) 2019  EraserBird, person_v1.32, hmmm
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import csv
+import secrets
+import time
+
+from data.data import database, fossils_index, logger
+from keys import CLUSTER_MODE, CONFUSION_GLOBAL, confusion_server_key
+
+# answer format = {
+#    "answers":stream of {"user", "channel", "guild", "fossil", "guess", "correct", "latency"}
+#        guild is "" in DMs, correct is 1 or 0, latency is seconds since the fossil was sent or ""
+#    "answers.last":id of the last answer aggregated
+# }
+# aggregate format = {
+#    "confusion:global":["fossil|fossil guessed instead", # of times]
+#    "confusion.server:server_id":["fossil|fossil guessed instead", # of times]
+#    "accuracy.total:global":{fossil: # answered}
+#    "accuracy.correct:global":{fossil: # answered correctly}
+# }
+
+STREAM = "answers"
+# the stream is trimmed to about this many answers
+MAX_ANSWERS = 100000
+# answers aggregated per database call
+BATCH_SIZE = 500
+# only one process aggregates at a time
+LOCK_KEY = "answers.lock"
+LOCK_EXPIRY = 60
+
+CSV_FIELDS = ("time", "user", "channel", "guild", "fossil", "guess", "correct", "latency")
+
+# adds an answer to the stream
+# sent - time the fossil was sent, or None if unknown
+# pipe - pipeline to add the write to, so it doesn't need its own round trip
+def record_answer(ctx, fossil, guess, correct, sent, pipe):
+    answer = {
+        "user": str(ctx.author.id),
+        "channel": str(ctx.channel.id),
+        "guild": str(ctx.guild.id) if ctx.guild is not None else "",
+        "fossil": str(fossil),
+        "guess": guess,
+        "correct": int(correct),
+        "latency": f"{time.time() - sent:.1f}" if sent else ""
+    }
+    pipe.xadd(STREAM, answer, maxlen=MAX_ANSWERS, approximate=True)
+
+# the lock scripts for the memory database
+def _renew_lock(client, keys, args):
+    if client.get(keys[0]) != args[0].encode("utf-8"):
+        return 0
+    return int(client.expire(keys[0], args[1]))
+
+def _release_lock(client, keys, args):
+    if client.get(keys[0]) != args[0].encode("utf-8"):
+        return 0
+    return client.delete(keys[0])
+
+# extends the lock if this run still holds it, returns 1 if it does
+# KEYS[1] - lock, ARGV[1] - this run's token, ARGV[2] - seconds
+RENEW_LOCK_SCRIPT = database.register_script(
+    """
+if redis.call("GET", KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+return redis.call("EXPIRE", KEYS[1], ARGV[2])
+""",
+    fallback=_renew_lock
+)
+
+# deletes the lock if this run still holds it, it could have expired and been taken by another process
+# KEYS[1] - lock, ARGV[1] - this run's token
+RELEASE_LOCK_SCRIPT = database.register_script(
+    """
+if redis.call("GET", KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+return redis.call("DEL", KEYS[1])
+""",
+    fallback=_release_lock
+)
+
+# aggregates answers since the last run, returns how many were aggregated
+# blocking, run it in an executor
+def aggregate_answers():
+    token = secrets.token_hex(16)
+    if not database.set(LOCK_KEY, token, nx=True, ex=LOCK_EXPIRY):
+        return 0
+    try:
+        total = 0
+        while True:
+            last = database.get(f"{STREAM}.last") or b"0-0"
+            answers = database.xread({STREAM: last}, count=BATCH_SIZE)
+            if not answers:
+                return total
+            # a run that took longer than the lock lasts stops, another process could be aggregating the same answers
+            if not RENEW_LOCK_SCRIPT(keys=[LOCK_KEY], args=[token, LOCK_EXPIRY]):
+                logger.warning("lost the answers lock, stopping after %s answers", total)
+                return total
+            entries = answers[0][1]
+            # a cluster can't run a transaction over keys on different nodes
+            pipe = database.pipeline(transaction=not CLUSTER_MODE)
+            for _, answer in entries:
+                _aggregate(pipe, {key.decode("utf-8"): value.decode("utf-8") for key, value in answer.items()})
+            pipe.set(f"{STREAM}.last", entries[-1][0])
+            pipe.execute()
+            total += len(entries)
+            logger.info(f"aggregated {len(entries)} answers")
+    finally:
+        RELEASE_LOCK_SCRIPT(keys=[LOCK_KEY], args=[token])
+
+def _aggregate(pipe, answer):
+    fossil = answer["fossil"]
+    pipe.hincrby("accuracy.total:global", fossil, 1)
+    if answer["correct"] == "1":
+        pipe.hincrby("accuracy.correct:global", fossil, 1)
+        return
+    
+    # only count guesses that were another fossil
+    matches = fossils_index.lookup(answer["guess"], k=1)
+    if not matches or matches[0] == fossil:
+        return
+    pair = f"{fossil}|{matches[0]}"
+    pipe.zincrby(CONFUSION_GLOBAL, 1, pair)
+    if answer["guild"]:
+        pipe.zincrby(confusion_server_key(answer['guild']), 1, pair)
+
+# writes a user's answers to f as csv, reading the stream a chunk at a time
+# answers aren't indexed by user, so this reads all of the stream's answers for every export
+# blocking, run it in an executor
+def export_answers(user_id, f):
+    writer = csv.writer(f)
+    writer.writerow(CSV_FIELDS)
+    start = "-"
+    rows = 0
+    while True:
+        entries = database.xrange(STREAM, min=start, max="+", count=BATCH_SIZE)
+        for answer_id, answer in entries:
+            answer = {key.decode("utf-8"): value.decode("utf-8") for key, value in answer.items()}
+            if answer["user"] == str(user_id):
+                answered = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(int(answer_id.split(b"-")[0]) / 1000))
+                writer.writerow((answered, ) + tuple(answer[field] for field in CSV_FIELDS[1:]))
+                rows += 1
+        if len(entries) < BATCH_SIZE:
+            return rows
+        # start just after the last answer read
+        milliseconds, sequence = entries[-1][0].decode("utf-8").split("-")
+        start = f"{milliseconds}-{int(sequence) + 1}"
@@ -0,0 +1,406 @@
+# commands.py | benchmark of whole commands against a database, without discord
+# Copyright (C) 2019  EraserBird, person_v1.32, hmmm
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# run from the repository root against a scratch redis, it writes channel, user and leaderboard keys:
+# REDIS_URL=redis://localhost:6379 python -m benchmarks.commands [--iterations 200] [--log]
+# or against the in-process database, to compare backends:
+# DATABASE_BACKEND=memory python -m benchmarks.commands
+#
+# Commands run through their callbacks with fake contexts, so cooldowns and checks are skipped.
+# Each run is appended to benchmarks/results/commands.jsonl and compared with the last run on the same backend.
+
+import argparse
+import asyncio
+import datetime
+import io
+import json
+import logging
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+
+import redis
+
+from cogs.check import Check
+from cogs.get_fossils import Fossils
+from cogs.hint import Hint
+from cogs.score import Score
+from cogs.sessions import Sessions
+from cogs.skip import Skip
+from data.data import DATABASE_BACKEND, database, fossils_list, logger
+from keys import (
+    CLUSTER_MODE, SCORE_GLOBAL, USERS_GLOBAL, channel_key, deck_key, incorrect_server_key,
+    incorrect_user_key, review_interval_key, review_key, session_data_key, session_history_key, users_server_key
+)
+
+RESULTS_FILE = "benchmarks/results/commands.jsonl"
+
+# fake ids, far from real discord ids
+GUILD_ID = 1
+BASE_ID = 100
+# channels and users the iterations rotate through, one user per channel
+CONTEXTS = 20
+# size of the fake images sent with fossils
+IMAGE_BYTES = 200000
+
+# Redis round trips and bytes sent, counted at the connection
+class RedisCounter:
+    def __init__(self):
+        self.round_trips = 0
+        self.bytes_sent = 0
+        self._send = redis.connection.Connection.send_packed_command
+    
+    def install(self):
+        counter = self
+        send = self._send
+        
+        # a pipeline or script call is sent with one call, and its replies are read before the next one
+        def counted_send(connection, command, *args, **kwargs):
+            counter.round_trips += 1
+            if isinstance(command, (bytes, str, memoryview)):
+                counter.bytes_sent += len(command)
+            else:
+                counter.bytes_sent += sum(len(part) for part in command)
+            return send(connection, command, *args, **kwargs)
+        
+        redis.connection.Connection.send_packed_command = counted_send
+    
+    def uninstall(self):
+        redis.connection.Connection.send_packed_command = self._send
+    
+    def snapshot(self):
+        return self.round_trips, self.bytes_sent
+
+# Fake discord objects with only what the commands use
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.name = f"bench{user_id}"
+        self.discriminator = "0001"
+        self.mention = f"<@{user_id}>"
+        self.bot = False
+    
+    def __str__(self):
+        return f"{self.name}#{self.discriminator}"
+
+class FakePermissions:
+    send_messages = embed_links = attach_files = add_reactions = manage_messages = read_message_history = True
+
+class FakeChannel:
+    def __init__(self, channel_id):
+        self.id = channel_id
+    
+    def permissions_for(self, member):
+        return FakePermissions()
+
+class FakeGuild:
+    def __init__(self, guild_id, members):
+        self.id = guild_id
+        self.members = members
+    
+    def get_member(self, user_id):
+        return self.members.get(user_id)
+
+class FakeMessage:
+    def __init__(self, message_id, sent):
+        self.id = message_id
+        self._sent = sent
+    
+    async def delete(self):
+        self._sent.api_calls += 1
+    
+    async def add_reaction(self, emoji):
+        self._sent.api_calls += 1
+    
+    async def remove_reaction(self, emoji, member):
+        self._sent.api_calls += 1
+    
+    async def edit(self, content=None, embed=None):
+        self._sent.api_calls += 1
+        self._sent.bytes += _payload_size(content, embed, ())
+
+# what commands sent to discord
+class Sent:
+    def __init__(self):
+        self.api_calls = 0
+        self.bytes = 0
+    
+    def snapshot(self):
+        return self.api_calls, self.bytes
+
+def _payload_size(content, embed, files):
+    size = len(str(content).encode("utf-8")) if content is not None else 0
+    if embed is not None:
+        size += len(json.dumps(embed.to_dict()).encode("utf-8"))
+    for file in files:
+        file.fp.seek(0, io.SEEK_END)
+        size += file.fp.tell()
+    return size
+
+class FakeContext:
+    def __init__(self, bot, guild, channel, author, sent):
+        self.bot = bot
+        self.guild = guild
+        self.channel = channel
+        self.author = author
+        self.message = FakeMessage(0, sent)
+        self.invoked_subcommand = None
+        self._sent = sent
+    
+    async def send(self, content=None, *, file=None, files=None, embed=None, delete_after=None):
+        files = list(files or ()) + ([file] if file is not None else [])
+        self._sent.api_calls += 1
+        self._sent.bytes += _payload_size(content, embed, files)
+        return FakeMessage(self._sent.api_calls, self._sent)
+
+class FakeBot:
+    def __init__(self):
+        self.user = FakeUser(BASE_ID - 1)
+        self.user.bot = True
+    
+    def get_user(self, user_id):
+        return FakeUser(user_id)
+    
+    async def fetch_user(self, user_id):
+        return FakeUser(user_id)
+    
+    # nobody reacts, so paged commands stop after their first page
+    async def wait_for(self, event, *, check=None, timeout=None):
+        raise asyncio.TimeoutError()
+
+# fake fossil images in a temporary cache/images, so sending fossils doesn't download anything
+def make_image_cache(directory):
+    image = os.urandom(IMAGE_BYTES)
+    for fossil in fossils_list:
+        os.makedirs(os.path.join(directory, "cache", "images", fossil))
+        with open(os.path.join(directory, "cache", "images", fossil, "0.jpg"), "wb") as f:
+            f.write(image)
+    # check sends achievement images from here
+    os.symlink(os.path.abspath("achievements"), os.path.join(directory, "achievements"))
+
+# cached wikipedia urls, so answers don't look pages up
+def seed_wiki_urls():
+    pipe = database.pipeline(transaction=False)
+    for fossil in fossils_list:
+        pipe.set(f"wikipedia:{fossil.lower()}", f"https://en.wikipedia.org/wiki/{fossil.replace(' ', '_')}", ex=3600)
+    pipe.execute()
+
+# the current answer in the channel, or a wrong guess
+def guess(ctx, correct):
+    if correct:
+        fossil = database.hget(channel_key(ctx.channel.id), "fossil")
+        return fossil.decode("utf-8") if fossil else "nothing"
+    return "not a fossil"
+
+# deletes the keys of the fake channels, users and servers
+# the global incorrect counts and answer stream keep the bench answers
+def cleanup(contexts):
+    pipe = database.pipeline(transaction=False)
+    for ctx in contexts:
+        user, channel = ctx.author.id, ctx.channel.id
+        for key in (
+            channel_key(channel), deck_key(channel), incorrect_user_key(user), review_key(user),
+            review_interval_key(user), session_data_key(user), session_history_key(user)
+        ):
+            pipe.delete(key)
+        pipe.zrem(USERS_GLOBAL, str(user))
+        pipe.zrem(SCORE_GLOBAL, str(channel))
+        pipe.zrem("sessions.active", str(user))
+    for guild_id in {ctx.guild.id for ctx in contexts if ctx.guild is not None}:
+        pipe.delete(incorrect_server_key(guild_id))
+        pipe.delete(users_server_key(guild_id))
+    pipe.execute()
+
+class Bench:
+    def __init__(self, counter):
+        self.counter = counter
+        self.sent = Sent()
+        self.bot = FakeBot()
+        members = {}
+        self.guild = FakeGuild(GUILD_ID, members)
+        self.contexts = []
+        for i in range(CONTEXTS):
+            author = FakeUser(BASE_ID + i)
+            members[author.id] = author
+            channel = FakeChannel(BASE_ID + i)
+            self.contexts.append(FakeContext(self.bot, self.guild, channel, author, self.sent))
+        
+        self.fossils = Fossils(self.bot)
+        self.check = Check(self.bot)
+        self.skip = Skip(self.bot)
+        self.hint = Hint(self.bot)
+        self.score = Score(self.bot)
+        self.sessions = Sessions(self.bot)
+        # command name: list of (seconds, redis round trips, redis bytes, discord calls, discord bytes)
+        self.samples = {}
+    
+    def close(self):
+        self.sessions.cog_unload()
+    
+    # one round of commands in a channel, the way people play
+    async def round(self, ctx, correct, record=True):
+        steps = (
+            ("session start", self.sessions, Sessions.start),
+            ("fossil", self.fossils, Fossils.fossil),
+            ("hint", self.hint, Hint.hint),
+            ("check", self.check, Check.check),
+            ("fossil", self.fossils, Fossils.fossil),
+            ("skip", self.skip, Skip.skip),
+            ("leaderboard", self.score, Score.leaderboard),
+            ("session view", self.sessions, Sessions.view),
+            ("session stop", self.sessions, Sessions.stop),
+        )
+        for name, cog, command in steps:
+            kwargs = {}
+            if name == "check":
+                # the answer is read outside the measurement
+                kwargs["guess"] = guess(ctx, correct)
+            await self._measure(name, record, cog, command, ctx, **kwargs)
+    
+    async def _measure(self, name, record, cog, command, ctx, **kwargs):
+        redis_before = self.counter.snapshot()
+        sent_before = self.sent.snapshot()
+        start = time.perf_counter()
+        await command.callback(cog, ctx, **kwargs)
+        elapsed = time.perf_counter() - start
+        if record:
+            redis_after = self.counter.snapshot()
+            sent_after = self.sent.snapshot()
+            self.samples.setdefault(name, []).append((
+                elapsed, redis_after[0] - redis_before[0], redis_after[1] - redis_before[1],
+                sent_after[0] - sent_before[0], sent_after[1] - sent_before[1]
+            ))
+    
+    async def run(self, iterations):
+        # the first round sets up channels and users and loads images, it isn't counted
+        for ctx in self.contexts:
+            await self.round(ctx, True, record=False)
+        for i in range(iterations):
+            await self.round(self.contexts[i % CONTEXTS], i % 2 == 0)
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+def summarize(samples):
+    summary = {}
+    for name, runs in samples.items():
+        times = [run[0] for run in runs]
+        summary[name] = {
+            "runs": len(runs),
+            "p50_ms": round(statistics.median(times) * 1000, 3),
+            "p99_ms": round(percentile(times, 99) * 1000, 3),
+            "per_second": round(len(times) / sum(times), 1),
+            "round_trips": round(statistics.mean(run[1] for run in runs), 2),
+            "redis_bytes": round(statistics.mean(run[2] for run in runs), 1),
+            "discord_calls": round(statistics.mean(run[3] for run in runs), 2),
+            "discord_bytes": round(statistics.mean(run[4] for run in runs), 1),
+        }
+    return summary
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _backend():
+    if DATABASE_BACKEND == "memory":
+        return "memory"
+    return "redis-cluster" if CLUSTER_MODE else "redis"
+
+def previous_result(backend):
+    if not os.path.exists(RESULTS_FILE):
+        return None
+    previous = None
+    with open(RESULTS_FILE) as f:
+        for line in f:
+            result = json.loads(line)
+            if result["backend"] == backend:
+                previous = result
+    return previous
+
+def save_result(result):
+    os.makedirs(os.path.dirname(RESULTS_FILE), exist_ok=True)
+    with open(RESULTS_FILE, "a") as f:
+        f.write(json.dumps(result) + "\n")
+
+def _change(new, old):
+    if not old:
+        return ""
+    return f"{(new - old) / old * 100:+.0f}%"
+
+def report(result, previous):
+    print(f"backend: {result['backend']}, {result['iterations']} rounds, commit {result['commit']}")
+    if previous is not None:
+        print(f"compared with {previous['time']}, commit {previous['commit']}")
+    print(
+        f"{'command':<14}  {'p50 ms':>8}  {'p99 ms':>8}  {'per s':>8}  {'redis rt':>8}  {'redis B':>8}  "
+        f"{'api calls':>9}  {'api B':>8}  {'p50':>5}  {'rt':>5}"
+    )
+    for name, stats in result["commands"].items():
+        old = (previous or {}).get("commands", {}).get(name, {})
+        print(
+            f"{name:<14}  {stats['p50_ms']:>8.2f}  {stats['p99_ms']:>8.2f}  {stats['per_second']:>8.1f}  "
+            f"{stats['round_trips']:>8.2f}  {stats['redis_bytes']:>8.0f}  {stats['discord_calls']:>9.2f}  "
+            f"{stats['discord_bytes']:>8.0f}  {_change(stats['p50_ms'], old.get('p50_ms')):>5}  "
+            f"{_change(stats['round_trips'], old.get('round_trips')):>5}"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark commands against the configured database.")
+    parser.add_argument("--iterations", type=int, default=200, help="rounds of commands to measure")
+    parser.add_argument("--log", action="store_true", help="keep logging on, it is part of the cost of a command")
+    parser.add_argument("--no-save", action="store_true", help="don't add the run to the results file")
+    options = parser.parse_args()
+    
+    if not options.log:
+        logger.setLevel(logging.WARNING)
+    
+    root = os.getcwd()
+    counter = RedisCounter()
+    seed_wiki_urls()
+    with tempfile.TemporaryDirectory() as directory:
+        make_image_cache(directory)
+        os.chdir(directory)
+        bench = Bench(counter)
+        counter.install()
+        try:
+            asyncio.get_event_loop().run_until_complete(bench.run(options.iterations))
+        finally:
+            counter.uninstall()
+            bench.close()
+            os.chdir(root)
+            cleanup(bench.contexts)
+    
+    result = {
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit(),
+        "backend": _backend(),
+        "iterations": options.iterations,
+        "commands": summarize(bench.samples),
+    }
+    previous = previous_result(result["backend"])
+    report(result, previous)
+    if not options.no_save:
+        save_result(result)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# fuzzy_search.py | benchmark of fossil name lookups as the list grows
+# Copyright (C) 2019  EraserBird, person_v1.32, hmmm
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# run from the repository root with: python -m benchmarks.fuzzy_search
+
+import difflib
+import random
+import string
+import time
+
+from matching import FuzzyIndex, normalize
+from benchmarks.spellcheck import load_fossils, typos
+
+SIZES = (131, 1000, 5000, 20000)
+QUERIES = 200
+
+# makes up extra taxa by splicing real names together
+def grow(fossils, size, rng):
+    names = list(fossils)
+    seen = set(names)
+    while len(names) < size:
+        first, second = rng.sample(fossils, 2)
+        name = string.capwords(first[:rng.randint(2, len(first))] + second[rng.randint(0, len(second) - 2):])
+        if name not in seen:
+            seen.add(name)
+            names.append(name)
+    return names
+
+def score(query, matches):
+    if not matches:
+        return 0
+    return difflib.SequenceMatcher(None, query, normalize(matches[0])).ratio()
+
+def main():
+    rng = random.Random(0)
+    fossils = load_fossils()
+    queries = [rng.choice(list(typos(fossil.lower()))) for fossil in rng.choices(fossils, k=QUERIES)]
+    
+    print(f"{'names':>6}  {'build ms':>8}  {'difflib us':>10}  {'index us':>8}  {'as good':>8}")
+    for size in SIZES:
+        names = grow(fossils, size, rng)
+        start = time.perf_counter()
+        index = FuzzyIndex(names)
+        build = time.perf_counter() - start
+        
+        # the old lookup, on normalized names so both see the same text
+        normalized = {normalize(name): name for name in names}
+        start = time.perf_counter()
+        old = [[normalized[match] for match in difflib.get_close_matches(query, normalized, n=1)] for query in queries]
+        old_time = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        new = [index.lookup(query, k=1) for query in queries]
+        new_time = time.perf_counter() - start
+        
+        # ties can be broken either way, so compare how good the best match is
+        same = sum(1 for query, a, b in zip(queries, old, new) if score(query, a) == score(query, b)) / len(queries)
+        print(
+            f"{size:>6}  {build * 1e3:>8.1f}  {old_time * 1e6 / len(queries):>10.0f}  " +
+            f"{new_time * 1e6 / len(queries):>8.0f}  {same:>8.1%}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+# load.py | load generator simulating study sessions in many channels at once
+# Copyright (C) 2019  EraserBird, person_v1.32, hmmm
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# run from the repository root against a scratch redis:
+# REDIS_URL=redis://localhost:6379 python -m benchmarks.load [--channels 2000] [--start-rate 50] [--rate-step 50]
+#
+# Commands arrive at a fixed rate whether or not earlier ones are done, like messages from users would,
+# and the rate goes up every stage until the bot can't keep up or --max-rate is reached.
+# Each channel follows a study session script, one command at a time, with the same fakes as benchmarks.commands.
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.commands import (
+    BASE_ID, FakeBot, FakeChannel, FakeContext, FakeGuild, FakeUser, RedisCounter, Sent, cleanup, guess,
+    make_image_cache, percentile, seed_wiki_urls
+)
+from cogs.check import Check
+from cogs.get_fossils import Fossils
+from cogs.hint import Hint
+from cogs.score import Score
+from cogs.sessions import Sessions
+from cogs.skip import Skip
+from data.data import DATABASE_BACKEND, database, logger
+from keys import CLUSTER_MODE
+
+# chances of each step in a round of the study script
+HINT_CHANCE = 0.3
+SKIP_CHANCE = 0.15
+WRONG_CHANCE = 0.25
+LEADERBOARD_CHANCE = 0.05
+# rounds in a session
+SESSION_ROUNDS = (5, 30)
+
+# seconds between event loop lag measurements
+LAG_INTERVAL = 0.05
+# seconds between launching due commands
+TICK = 0.005
+# a stage is saturated if fewer commands than this part of the rate finish
+SATURATED_THROUGHPUT = 0.9
+
+# the commands a channel sends, forever
+def study_script(rng):
+    while True:
+        yield "session start"
+        for _ in range(rng.randint(*SESSION_ROUNDS)):
+            yield "fossil"
+            if rng.random() < HINT_CHANCE:
+                yield "hint"
+            roll = rng.random()
+            if roll < SKIP_CHANCE:
+                yield "skip"
+            elif roll < SKIP_CHANCE + WRONG_CHANCE:
+                yield "check wrong"
+            else:
+                yield "check right"
+            if rng.random() < LEADERBOARD_CHANCE:
+                yield "leaderboard"
+        yield "session stop"
+
+class Load:
+    def __init__(self, channels, guilds, seed):
+        self.rng = random.Random(seed)
+        self.bot = FakeBot()
+        self.sent = Sent()
+        cogs = {
+            "fossils": Fossils(self.bot),
+            "check": Check(self.bot),
+            "skip": Skip(self.bot),
+            "hint": Hint(self.bot),
+            "score": Score(self.bot),
+            "sessions": Sessions(self.bot),
+        }
+        self.sessions = cogs["sessions"]
+        # script step: (name to report it as, cog, command, correct answer or None)
+        self.commands = {
+            "session start": ("session start", cogs["sessions"], Sessions.start, None),
+            "session stop": ("session stop", cogs["sessions"], Sessions.stop, None),
+            "fossil": ("fossil", cogs["fossils"], Fossils.fossil, None),
+            "hint": ("hint", cogs["hint"], Hint.hint, None),
+            "skip": ("skip", cogs["skip"], Skip.skip, None),
+            "check right": ("check", cogs["check"], Check.check, True),
+            "check wrong": ("check", cogs["check"], Check.check, False),
+            "leaderboard": ("leaderboard", cogs["score"], Score.leaderboard, None),
+        }
+        
+        guild_list = [FakeGuild(BASE_ID + i, {}) for i in range(guilds)]
+        self.contexts = []
+        self.scripts = []
+        self.locks = []
+        for i in range(channels):
+            author = FakeUser(BASE_ID + i)
+            guild = guild_list[i % guilds]
+            guild.members[author.id] = author
+            self.contexts.append(FakeContext(self.bot, guild, FakeChannel(BASE_ID + i), author, self.sent))
+            self.scripts.append(study_script(random.Random(self.rng.random())))
+            # people in a channel wait for the bot to answer before the next command
+            self.locks.append(asyncio.Lock())
+        
+        # (stage, command name, seconds from arriving to done)
+        self.samples = []
+        self.completed = 0
+        self.errors = 0
+        # commands that arrived and aren't done
+        self.pending = set()
+    
+    def close(self):
+        self.sessions.cog_unload()
+    
+    # runs the next command of a channel's script, stage None isn't recorded
+    async def step(self, channel, stage):
+        arrived = time.perf_counter()
+        async with self.locks[channel]:
+            ctx = self.contexts[channel]
+            name, cog, command, correct = self.commands[next(self.scripts[channel])]
+            kwargs = {} if correct is None else {"guess": guess(ctx, correct)}
+            try:
+                await command.callback(cog, ctx, **kwargs)
+            except Exception:
+                logger.exception(f"{name} failed")
+                self.errors += 1
+        self.completed += 1
+        if stage is not None:
+            self.samples.append((stage, name, time.perf_counter() - arrived))
+    
+    # the first commands in each channel set it up and start a session, they aren't measured
+    async def warm_up(self):
+        for channel in range(len(self.contexts)):
+            await self.step(channel, None)
+            await self.step(channel, None)
+
+async def monitor_lag(lags):
+    loop = asyncio.get_event_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(LAG_INTERVAL)
+        lags.append(loop.time() - start - LAG_INTERVAL)
+
+# commands the redis server has processed, None for the memory database
+def server_commands():
+    if DATABASE_BACKEND == "memory":
+        return None
+    if not CLUSTER_MODE:
+        return database.info("stats")["total_commands_processed"]
+    info = database.info("stats", target_nodes="primaries")
+    return sum(node["total_commands_processed"] for node in info.values())
+
+def _percentile(values, percent):
+    return percentile(values, percent) if values else 0.0
+
+# sends commands at rate per second for seconds, returns the stage stats
+async def run_stage(load, counter, rate, seconds):
+    loop = asyncio.get_event_loop()
+    lags = []
+    monitor = asyncio.ensure_future(monitor_lag(lags))
+    completed = load.completed
+    errors = load.errors
+    round_trips = counter.round_trips
+    processed = server_commands()
+    
+    launched = 0
+    start = loop.time()
+    while loop.time() - start < seconds:
+        due = int((loop.time() - start) * rate)
+        while launched < due:
+            task = asyncio.ensure_future(load.step(load.rng.randrange(len(load.contexts)), rate))
+            load.pending.add(task)
+            task.add_done_callback(load.pending.discard)
+            launched += 1
+        await asyncio.sleep(TICK)
+    elapsed = loop.time() - start
+    monitor.cancel()
+    
+    processed_after = server_commands()
+    latencies = [sample[2] for sample in load.samples if sample[0] == rate]
+    return {
+        "rate": rate,
+        "done": (load.completed - completed) / elapsed,
+        "backlog": len(load.pending),
+        "errors": load.errors - errors,
+        "lag_p50": _percentile(lags, 50),
+        "lag_p99": _percentile(lags, 99),
+        "lag_max": max(lags, default=0.0),
+        "p50": _percentile(latencies, 50),
+        "p99": _percentile(latencies, 99),
+        "round_trips": (counter.round_trips - round_trips) / elapsed,
+        "redis_ops": None if processed is None else (processed_after - processed) / elapsed,
+    }
+
+def report_stage(stats):
+    redis_ops = "-" if stats["redis_ops"] is None else f"{stats['redis_ops']:.0f}"
+    print(
+        f"{stats['rate']:>6}  {stats['done']:>7.1f}  {stats['backlog']:>7}  {stats['errors']:>6}  "
+        f"{stats['lag_p50'] * 1000:>7.1f}  {stats['lag_p99'] * 1000:>7.1f}  {stats['lag_max'] * 1000:>7.1f}  "
+        f"{stats['p50'] * 1000:>7.1f}  {stats['p99'] * 1000:>8.1f}  {stats['round_trips']:>8.0f}  {redis_ops:>9}",
+        flush=True
+    )
+
+# p99 latency of each command at each rate
+def report_commands(load, rates):
+    print(f"\np99 ms by rate\n{'command':<14}" + "".join(f"  {rate:>7}" for rate in rates))
+    names = sorted({sample[1] for sample in load.samples})
+    for name in names:
+        row = f"{name:<14}"
+        for rate in rates:
+            latencies = [sample[2] for sample in load.samples if sample[0] == rate and sample[1] == name]
+            row += f"  {_percentile(latencies, 99) * 1000:>7.1f}" if latencies else f"  {'-':>7}"
+        print(row)
+
+async def ramp(load, counter, options):
+    print(f"warming up {len(load.contexts)} channels", flush=True)
+    await load.warm_up()
+    print(
+        f"{'rate/s':>6}  {'done/s':>7}  {'backlog':>7}  {'errors':>6}  {'lag p50':>7}  {'lag p99':>7}  "
+        f"{'lag max':>7}  {'cmd p50':>7}  {'cmd p99':>8}  {'rt/s':>8}  {'redis/s':>9}"
+    )
+    rates = []
+    rate = options.start_rate
+    while rate <= options.max_rate:
+        stats = await run_stage(load, counter, rate, options.stage_seconds)
+        rates.append(rate)
+        report_stage(stats)
+        if stats["done"] < rate * SATURATED_THROUGHPUT or stats["lag_p99"] > options.lag_limit:
+            print(f"saturated at {rate} commands/s")
+            break
+        rate += options.rate_step
+    
+    if load.pending:
+        print(f"waiting for {len(load.pending)} commands", flush=True)
+        await asyncio.wait(load.pending)
+    report_commands(load, rates)
+
+def main():
+    parser = argparse.ArgumentParser(description="Ramp up simulated study sessions until the bot saturates.")
+    parser.add_argument("--channels", type=int, default=2000, help="channels with a user studying in each")
+    parser.add_argument("--guilds", type=int, default=50, help="servers the channels are spread over")
+    parser.add_argument("--start-rate", type=int, default=50, help="commands per second in the first stage")
+    parser.add_argument("--rate-step", type=int, default=50, help="commands per second added each stage")
+    parser.add_argument("--max-rate", type=int, default=5000, help="commands per second to stop at")
+    parser.add_argument("--stage-seconds", type=float, default=10.0, help="length of each stage")
+    parser.add_argument(
+        "--lag-limit", type=float, default=0.5, help="event loop lag p99 in seconds that counts as saturated"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log", action="store_true", help="keep logging on, it is part of the cost of a command")
+    options = parser.parse_args()
+    
+    if not options.log:
+        logger.setLevel(logging.WARNING)
+    
+    root = os.getcwd()
+    counter = RedisCounter()
+    seed_wiki_urls()
+    with tempfile.TemporaryDirectory() as directory:
+        make_image_cache(directory)
+        os.chdir(directory)
+        load = Load(options.channels, options.guilds, options.seed)
+        counter.install()
+        try:
+            asyncio.get_event_loop().run_until_complete(ramp(load, counter, options))
+        finally:
+            counter.uninstall()
+            load.close()
+            os.chdir(root)
+            cleanup(load.contexts)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+# log_cost.py | what logging adds to each command
+# Copyright (C) 2019  EraserBird, person_v1.32, hmmm
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# run from the repository root against a scratch redis, like benchmarks.commands:
+# REDIS_URL=redis://localhost:6379 python -m benchmarks.log_cost [--iterations 200]
+#
+# Runs the command benchmark with logging set up in different ways and compares each with logging off.
+# The modes run in turns, in a different order each time, so drift over the run hits all of them.
+# "sync" writes from the event loop like the bot used to, "queue" hands records to a background thread.
+# "queue configured" uses the levels from LOG_LEVEL and LOG_LEVELS, the others log everything.
+# Logs go to files in a temporary directory, not the terminal.
+
+import argparse
+import asyncio
+import logging
+import logging.handlers
+import os
+import queue
+import statistics
+import tempfile
+
+from benchmarks.commands import Bench, RedisCounter, cleanup, make_image_cache, seed_wiki_urls
+from data.data import BatchedQueueListener, file_handler, logger, stream_handler
+
+MODES = ("off", "sync debug", "queue debug", "queue configured")
+
+# the file and stream handlers the bot uses, writing into the directory
+def _handlers(directory):
+    to_file = logging.handlers.TimedRotatingFileHandler(
+        os.path.join(directory, "log.txt"), backupCount=4, when="midnight"
+    )
+    to_file.setFormatter(file_handler.formatter)
+    to_stream = logging.StreamHandler(open(os.path.join(directory, "stream.txt"), "w"))
+    to_stream.setFormatter(stream_handler.formatter)
+    return to_file, to_stream
+
+# sets the logger up for the mode, returns a function that undoes it
+def _configure(mode, directory):
+    handlers, level, filters = logger.handlers[:], logger.level, logger.filters[:]
+    listener = None
+    for handler in handlers:
+        logger.removeHandler(handler)
+    
+    if mode == "off":
+        logger.setLevel(logging.CRITICAL + 1)
+    else:
+        to_file, to_stream = _handlers(directory)
+        if mode == "sync debug":
+            logger.addHandler(to_file)
+            logger.addHandler(to_stream)
+        else:
+            records = queue.SimpleQueue()
+            listener = BatchedQueueListener(records, to_file, to_stream)
+            listener.start()
+            logger.addHandler(logging.handlers.QueueHandler(records))
+        if mode != "queue configured":
+            logger.setLevel(logging.DEBUG)
+            logger.filters = []
+    
+    def restore():
+        for handler in logger.handlers[:]:
+            logger.removeHandler(handler)
+            handler.close()
+        if listener is not None:
+            listener.stop()
+            for handler in listener.handlers:
+                handler.close()
+        for handler in handlers:
+            logger.addHandler(handler)
+        logger.setLevel(level)
+        logger.filters = filters
+    
+    return restore
+
+# counts the records that get past the logger's level and filters
+class _RecordCounter(logging.Filter):
+    def __init__(self):
+        super().__init__()
+        self.records = 0
+    
+    def filter(self, record):
+        self.records += 1
+        return True
+
+def run_mode(mode, iterations, counter, samples):
+    with tempfile.TemporaryDirectory() as logs:
+        restore = _configure(mode, logs)
+        records = _RecordCounter()
+        logger.addFilter(records)
+        bench = Bench(counter)
+        measure = bench._measure
+        
+        async def counted_measure(name, record, *args, **kwargs):
+            before = records.records
+            await measure(name, record, *args, **kwargs)
+            if record:
+                samples.setdefault(name, {"seconds": [], "records": []})["records"].append(records.records - before)
+        
+        bench._measure = counted_measure
+        try:
+            asyncio.get_event_loop().run_until_complete(bench.run(iterations))
+        finally:
+            restore()
+            bench.close()
+            cleanup(bench.contexts)
+    for name, runs in bench.samples.items():
+        samples[name]["seconds"].extend(run[0] for run in runs)
+
+def report(results):
+    off = {name: statistics.median(runs["seconds"]) * 1000 for name, runs in results["off"].items()}
+    print("p50 ms per command, what logging adds over off, and records logged")
+    print(f"{'command':<14}  {'off':>8}" + "".join(f"  {mode:>28}" for mode in MODES[1:]))
+    for name in off:
+        cells = []
+        for mode in MODES[1:]:
+            runs = results[mode][name]
+            p50 = statistics.median(runs["seconds"]) * 1000
+            records = statistics.mean(runs["records"])
+            cells.append(f"{p50:>8.3f} ({p50 - off[name]:+7.3f}) {records:>5.1f}")
+        print(f"{name:<14}  {off[name]:>8.3f}" + "".join(f"  {cell:>28}" for cell in cells))
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure what logging adds to each command.")
+    parser.add_argument("--iterations", type=int, default=100, help="rounds of commands in each run of a mode")
+    parser.add_argument("--repeats", type=int, default=5, help="runs of each mode, taken in turns so drift hits all of them")
+    options = parser.parse_args()
+    
+    root = os.getcwd()
+    counter = RedisCounter()
+    seed_wiki_urls()
+    results = {mode: {} for mode in MODES}
+    with tempfile.TemporaryDirectory() as directory:
+        make_image_cache(directory)
+        os.chdir(directory)
+        try:
+            for repeat in range(options.repeats):
+                # each mode takes its turn going first
+                start = repeat % len(MODES)
+                for mode in MODES[start:] + MODES[:start]:
+                    run_mode(mode, options.iterations, counter, results[mode])
+        finally:
+            os.chdir(root)
+    report(results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# permissions.py | microbenchmark of the global permission check
+# Copyright (C) 2019  EraserBird, person_v1.32, hmmm
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# run from the repository root, it doesn't need a database or a connection to discord:
+# python -m benchmarks.permissions [--roles 30] [--overwrites 8]
+#
+# Builds a server from gateway payloads, like discord.py does, with a channel the bot can use,
+# and times what the permission check costs each command with and without the cache.
+
+import argparse
+import timeit
+
+import discord
+
+from permissions import PermissionCache, missing_permissions
+
+BOT_ID = 1000
+OWNER_ID = 1001
+GUILD_ID = 2000
+CHANNEL_ID = 3000
+CATEGORY_ID = 3001
+# the ids of the extra roles start here
+ROLE_ID = 4000
+
+# permission bits
+VIEW_CHANNEL = 1 << 10
+SEND_MESSAGES = 1 << 11
+EMBED_LINKS = 1 << 14
+ATTACH_FILES = 1 << 15
+EVERYONE = 104324161
+
+# the parts of discord.py's connection state building a server uses
+class FakeState:
+    def __init__(self):
+        self.self_id = BOT_ID
+        self.user = None
+        self.shard_count = None
+    
+    def store_user(self, data):
+        return discord.User(state=self, data=data)
+    
+    def store_emoji(self, guild, data):
+        return discord.Emoji(guild=guild, state=self, data=data)
+    
+    def _get_voice_client(self, guild_id):
+        return None
+
+def _user(user_id, bot=False):
+    return {"id": str(user_id), "username": f"user{user_id}", "discriminator": "0001", "avatar": None, "bot": bot}
+
+def _role(role_id, position, permissions):
+    return {
+        "id": str(role_id), "name": f"role{role_id}", "permissions": permissions, "position": position, "color": 0,
+        "hoist": False, "managed": False, "mentionable": False
+    }
+
+# a server with roles, the bot in a few of them and a text channel in a category, both with overwrites
+def make_guild(roles, overwrites):
+    state = FakeState()
+    role_data = [_role(GUILD_ID, 0, EVERYONE)]
+    role_data.extend(_role(ROLE_ID + i, i + 1, VIEW_CHANNEL | SEND_MESSAGES) for i in range(roles))
+    bot_roles = [str(ROLE_ID + i) for i in range(0, roles, max(roles // 3, 1))]
+    channel_overwrites = [{"id": str(GUILD_ID), "type": "role", "allow": 0, "deny": SEND_MESSAGES}]
+    channel_overwrites.extend({
+        "id": str(ROLE_ID + i),
+        "type": "role",
+        "allow": SEND_MESSAGES | EMBED_LINKS | ATTACH_FILES,
+        "deny": 0
+    } for i in range(min(overwrites, roles)))
+    channel_overwrites.append({"id": str(BOT_ID), "type": "member", "allow": EMBED_LINKS, "deny": 0})
+    data = {
+        "id": str(GUILD_ID),
+        "name": "bench",
+        "owner_id": str(OWNER_ID),
+        "region": "us-east",
+        "member_count": 2,
+        "large": False,
+        "roles": role_data,
+        "emojis": [],
+        "features": [],
+        "members": [
+            {"user": _user(BOT_ID, bot=True), "roles": bot_roles, "joined_at": None, "deaf": False, "mute": False},
+            {"user": _user(OWNER_ID), "roles": [], "joined_at": None, "deaf": False, "mute": False},
+        ],
+        "channels": [
+            {"id": str(CATEGORY_ID), "type": 4, "name": "category", "position": 0, "permission_overwrites": []},
+            {
+                "id": str(CHANNEL_ID), "type": 0, "name": "fossils", "position": 1, "parent_id": str(CATEGORY_ID),
+                "permission_overwrites": channel_overwrites
+            },
+        ],
+    }
+    guild = discord.Guild(data=data, state=state)
+    state.user = guild.get_member(BOT_ID)
+    return guild, guild.get_channel(CHANNEL_ID)
+
+# microseconds per call of function
+def _time(function, number):
+    return min(timeit.repeat(function, number=number, repeat=5)) / number * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the permission check with and without the cache.")
+    parser.add_argument("--roles", type=int, default=30, help="roles in the server")
+    parser.add_argument("--overwrites", type=int, default=8, help="role overwrites on the channel")
+    parser.add_argument("--number", type=int, default=20000, help="checks in each timing")
+    options = parser.parse_args()
+    
+    guild, channel = make_guild(options.roles, options.overwrites)
+    missing = missing_permissions(guild, channel)
+    print(f"{options.roles} roles, {options.overwrites} overwrites, missing: {', '.join(missing) or 'none'}")
+    
+    cache = PermissionCache()
+    cache.missing(guild, channel)
+    
+    def forget_and_check():
+        cache.forget_guild(guild)
+        cache.missing(guild, channel)
+    
+    uncached = _time(lambda: missing_permissions(guild, channel), options.number)
+    cached = _time(lambda: cache.missing(guild, channel), options.number)
+    invalidated = _time(forget_and_check, options.number)
+    print(f"{'uncached':<12} {uncached:>8.2f} us per command")
+    print(f"{'cached':<12} {cached:>8.2f} us per command, {uncached / cached:.0f}x faster")
+    print(f"{'after event':<12} {invalidated:>8.2f} us, the first command after an event clears the cache")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# review.py | benchmark of the spaced repetition schedule
+# Copyright (C) 2019  EraserBird, person_v1.32, hmmm
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# run from the repository root against a scratch redis, it writes review keys:
+# REDIS_URL=redis://localhost:6379 python -m benchmarks.review
+# or against the in-process database, to compare backends:
+# DATABASE_BACKEND=memory python -m benchmarks.review
+
+import random
+import time
+
+from data.data import database, fossils_list
+from keys import review_interval_key, review_key
+from review import next_review, record_review
+
+USERS = (100, 1000, 10000)
+ANSWERS_PER_USER = 20
+LOOKUPS = 5000
+
+def main():
+    rng = random.Random(0)
+    print(f"{'users':>6}  {'record us':>9}  {'next due us':>11}  {'keys':>6}")
+    for users in USERS:
+        # fill the schedules through pipelines, like check does
+        start = time.perf_counter()
+        for user in range(users):
+            pipe = database.pipeline(transaction=False)
+            for fossil in rng.sample(fossils_list, ANSWERS_PER_USER):
+                record_review(f"bench{user}", fossil, rng.random() < 0.7, pipe)
+            pipe.execute()
+        record = (time.perf_counter() - start) / (users * ANSWERS_PER_USER)
+        
+        start = time.perf_counter()
+        for _ in range(LOOKUPS):
+            next_review(f"bench{rng.randrange(users)}")
+        lookup = (time.perf_counter() - start) / LOOKUPS
+        print(f"{users:>6}  {record * 1e6:>9.1f}  {lookup * 1e6:>11.1f}  {database.dbsize():>6}")
+    
+    for user in range(max(USERS)):
+        database.delete(review_key(f"bench{user}"), review_interval_key(f"bench{user}"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+# scripts.py | checks the memory database's script fallbacks against the lua scripts
+# Copyright (C) 2019  EraserBird, person_v1.32, hmmm
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# run from the repository root against a scratch redis, it only writes keys starting with "parity:{parity}":
+# REDIS_URL=redis://localhost:6379 python -m benchmarks.scripts
+#
+# Every script registered with database.register_script has a Python fallback for the memory database.
+# This runs the same calls through the lua script on redis and the fallback on a memory database,
+# and exits with an error if a reply or a key the script touched ends up different.
+# Add a scenario here along with any new script.
+
+import sys
+
+from answers import RELEASE_LOCK_SCRIPT, RENEW_LOCK_SCRIPT
+from cogs.batch import TAKE_BATCH_SCRIPT
+from cooldowns import TAKE_SCRIPT
+from data.data import connect, database
+from functions import DECK_DRAW_SCRIPT
+from memory_database import MemoryDatabase
+from review import RECORD_SCRIPT
+from session_store import FINISH_SCRIPT, INCREMENT_SCRIPT, START_SCRIPT
+
+# the hash tag keeps the keys on one node of a cluster
+PREFIX = "parity:{parity}:"
+# a fixed time, so both backends get the same arguments
+NOW = 1700000000
+# the size of the test decks
+DECK_SIZE = 3
+
+def _key(name):
+    return PREFIX + name
+
+def _deck(*indices):
+    return b"".join(index.to_bytes(2, "big") for index in indices)
+
+# a step is (script, key names, args), or a function setting up keys on the client
+def _call(script, names, args=()):
+    return (script, names, list(args))
+
+# scenario name: ({key name: type}, steps)
+SCENARIOS = {
+    "deck draw":
+        ({"deck": "string", "channel": "hash"}, [
+            _call(DECK_DRAW_SCRIPT, ["deck", "channel"], [DECK_SIZE]),
+            _call(DECK_DRAW_SCRIPT, ["deck", "channel"], [DECK_SIZE, _deck(2, 0, 1)]),
+            _call(DECK_DRAW_SCRIPT, ["deck", "channel"], [DECK_SIZE]),
+            _call(DECK_DRAW_SCRIPT, ["deck", "channel"], [DECK_SIZE, _deck(1, 2, 0)]),
+            _call(DECK_DRAW_SCRIPT, ["deck", "channel"], [DECK_SIZE]),
+            _call(DECK_DRAW_SCRIPT, ["deck", "channel"], [DECK_SIZE]),
+            _call(DECK_DRAW_SCRIPT, ["deck", "channel"], [DECK_SIZE, _deck(0, 1, 2)]),
+        ]),
+    "deck out of date":
+        ({"deck": "string", "channel": "hash"}, [
+            lambda client: client.set(_key("deck"), _deck(0, 1)),
+            lambda client: client.hset(_key("channel"), "cursor", 1),
+            _call(DECK_DRAW_SCRIPT, ["deck", "channel"], [DECK_SIZE]),
+            _call(DECK_DRAW_SCRIPT, ["deck", "channel"], [DECK_SIZE, _deck(1, 0, 2)]),
+        ]),
+    "take batch":
+        ({"channel": "hash"}, [
+            lambda client: client.hset(_key("channel"), mapping={"batch": "Acer\nAgnatha", "batch_sent": "1700000000.5"}),
+            _call(TAKE_BATCH_SCRIPT, ["channel"]),
+            _call(TAKE_BATCH_SCRIPT, ["channel"]),
+        ]),
+    "review":
+        ({"review": "zset", "interval": "hash"}, [
+            _call(RECORD_SCRIPT, ["review", "interval"], ["Acer", 1, NOW]),
+            _call(RECORD_SCRIPT, ["review", "interval"], ["Acer", 1, NOW + 3600]),
+            _call(RECORD_SCRIPT, ["review", "interval"], ["Agnatha", 0, NOW]),
+            _call(RECORD_SCRIPT, ["review", "interval"], ["Acer", 0, NOW + 10800]),
+            _call(RECORD_SCRIPT, ["review", "interval"], ["Acer", 1, NOW + 11400]),
+        ]),
+    "session":
+        ({"data": "hash", "history": "list"}, [
+            _call(INCREMENT_SCRIPT, ["data"], ["correct", 1, NOW]),
+            _call(START_SCRIPT, ["data", "history"], [NOW]),
+            _call(START_SCRIPT, ["data", "history"], [NOW + 5]),
+            _call(INCREMENT_SCRIPT, ["data"], ["correct", 1, NOW + 10]),
+            _call(INCREMENT_SCRIPT, ["data"], ["total", 2, NOW + 20]),
+            _call(FINISH_SCRIPT, ["data", "history"], [NOW + 30, 1]),
+            _call(FINISH_SCRIPT, ["data", "history"], [NOW + 30, 0]),
+            _call(FINISH_SCRIPT, ["data", "history"], [NOW + 40, 0]),
+        ]),
+    "session timeout":
+        ({"data": "hash", "history": "list"}, [
+            _call(START_SCRIPT, ["data", "history"], [NOW]),
+            _call(INCREMENT_SCRIPT, ["data"], ["incorrect", 1, NOW + 100]),
+            _call(INCREMENT_SCRIPT, ["data"], ["incorrect", 1, NOW + 3700]),
+            _call(FINISH_SCRIPT, ["data", "history"], [NOW + 3700, 1]),
+            _call(FINISH_SCRIPT, ["data", "history"], [NOW + 3701, 1]),
+            _call(START_SCRIPT, ["data", "history"], [NOW + 3800]),
+            _call(START_SCRIPT, ["data", "history"], [NOW + 9000]),
+        ]),
+    "session from before timeouts":
+        ({"data": "hash", "history": "list"}, [
+            lambda client: client.hset(_key("data"), mapping={"start": NOW, "correct": 2, "incorrect": 1, "total": 3}),
+            _call(INCREMENT_SCRIPT, ["data"], ["correct", 1, NOW + 90000]),
+            _call(FINISH_SCRIPT, ["data", "history"], [NOW + 90010, 0]),
+            lambda client: client.hset(_key("data"), mapping={"start": NOW, "correct": 2, "incorrect": 1, "total": 3}),
+            _call(START_SCRIPT, ["data", "history"], [NOW + 90000]),
+        ]),
+    "cooldown":
+        ({"bucket": "hash"}, [
+            _call(TAKE_SCRIPT, ["bucket"], [2, 5.0, repr(NOW + 0.0)]),
+            _call(TAKE_SCRIPT, ["bucket"], [2, 5.0, repr(NOW + 0.1)]),
+            _call(TAKE_SCRIPT, ["bucket"], [2, 5.0, repr(NOW + 0.2)]),
+            _call(TAKE_SCRIPT, ["bucket"], [2, 5.0, repr(NOW + 1.7)]),
+            _call(TAKE_SCRIPT, ["bucket"], [2, 5.0, repr(NOW + 3.3)]),
+            _call(TAKE_SCRIPT, ["bucket"], [1, 3.0, repr(NOW + 20.0)]),
+            _call(TAKE_SCRIPT, ["bucket"], [1, 3.0, repr(NOW + 21.0)]),
+        ]),
+    "lock":
+        ({"lock": "string"}, [
+            lambda client: client.set(_key("lock"), "token", ex=60),
+            _call(RENEW_LOCK_SCRIPT, ["lock"], ["token", 120]),
+            _call(RENEW_LOCK_SCRIPT, ["lock"], ["other", 300]),
+            _call(RELEASE_LOCK_SCRIPT, ["lock"], ["other"]),
+            _call(RELEASE_LOCK_SCRIPT, ["lock"], ["token"]),
+            _call(RENEW_LOCK_SCRIPT, ["lock"], ["token", 120]),
+        ]),
+}
+
+# every script that has to be in a scenario
+SCRIPTS = {
+    "DECK_DRAW_SCRIPT": DECK_DRAW_SCRIPT,
+    "TAKE_BATCH_SCRIPT": TAKE_BATCH_SCRIPT,
+    "RECORD_SCRIPT": RECORD_SCRIPT,
+    "START_SCRIPT": START_SCRIPT,
+    "INCREMENT_SCRIPT": INCREMENT_SCRIPT,
+    "FINISH_SCRIPT": FINISH_SCRIPT,
+    "TAKE_SCRIPT": TAKE_SCRIPT,
+    "RENEW_LOCK_SCRIPT": RENEW_LOCK_SCRIPT,
+    "RELEASE_LOCK_SCRIPT": RELEASE_LOCK_SCRIPT,
+}
+
+def read_key(client, name, kind):
+    key = _key(name)
+    if kind == "string":
+        value = client.get(key)
+    elif kind == "hash":
+        value = sorted(client.hgetall(key).items())
+    elif kind == "zset":
+        value = client.zrange(key, 0, -1, withscores=True)
+    else:
+        value = client.lrange(key, 0, -1)
+    # expiries are compared to the second, the backends don't read the clock at the same moment
+    ttl = client.ttl(key)
+    return value, "none" if ttl < 0 else round(ttl, -1)
+
+# runs a scenario on client, returns the reply of each call and the keys after each step
+def run(client, kinds, steps):
+    database.use(client)
+    client.delete(*map(_key, kinds))
+    results = []
+    for step in steps:
+        if callable(step):
+            step(client)
+            reply = "setup"
+        else:
+            script, names, args = step
+            reply = script(keys=list(map(_key, names)), args=args)
+        results.append((reply, {name: read_key(client, name, kind) for name, kind in kinds.items()}))
+    client.delete(*map(_key, kinds))
+    return results
+
+def main():
+    tested = {id(step[0]) for _, steps in SCENARIOS.values() for step in steps if not callable(step)}
+    untested = [name for name, script in SCRIPTS.items() if id(script) not in tested]
+    if untested:
+        sys.exit(f"scripts without a scenario: {', '.join(untested)}")
+    
+    redis_client = connect("redis")
+    differences = 0
+    for scenario, (kinds, steps) in SCENARIOS.items():
+        expected = run(redis_client, kinds, steps)
+        actual = run(MemoryDatabase(), kinds, steps)
+        for number, (step, lua, fallback) in enumerate(zip(steps, expected, actual), start=1):
+            if lua != fallback:
+                differences += 1
+                print(f"{scenario}, step {number}:\n    lua      {lua}\n    fallback {fallback}")
+        print(f"{scenario:<30} {'ok' if expected == actual else 'different'}")
+    if differences:
+        sys.exit(f"{differences} steps differ between the lua scripts and their fallbacks")
+
+if __name__ == "__main__":
+    main()
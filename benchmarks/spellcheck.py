@@ -0,0 +1,153 @@
+# spellcheck.py | benchmark and differential check of answer matching
+# Copyright (C) 2019  EraserBird, person_v1.32, hmmm
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# run from the repository root with: python -m benchmarks.spellcheck
+# exits with an error if the edit distance grades any guess worse than difflib, see check_regressions,
+# or if it doesn't match a plain Damerau-Levenshtein distance, see check_distances
+
+import difflib
+import string
+import sys
+import timeit
+
+from matching import edit_distance, normalize, within_distance
+
+# spellcheck as it was before matching.py, kept here for comparison
+def difflib_spellcheck(worda, wordb, cutoff=3):
+    worda = worda.lower().replace("-", " ").replace("'", "")
+    wordb = wordb.lower().replace("-", " ").replace("'", "")
+    shorterword = min(worda, wordb, key=len)
+    if worda != wordb:
+        if len(list(difflib.Differ().compare(worda, wordb))) - len(shorterword) >= cutoff:
+            return False
+    return True
+
+def edit_spellcheck(worda, wordb, cutoff=3):
+    return within_distance(normalize(worda), normalize(wordb), cutoff)
+
+def load_fossils():
+    with open("data/fossils_list.txt") as f:
+        return [string.capwords(line.strip()) for line in f]
+
+# every single edit of word: deletions, insertions, substitutions and swaps
+def typos(word):
+    for i in range(len(word)):
+        yield word[:i] + word[i + 1:]
+        yield word[:i] + "e" + word[i:]
+        yield word[:i] + "x" + word[i + 1:]
+        if i < len(word) - 1:
+            yield word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+# guess/answer pairs by what the grade should be
+def build_pairs(fossils):
+    answers = [fossil.split(" ")[-1] for fossil in fossils]
+    groups = {"different fossil": [], "one mistake": [], "two mistakes": []}
+    for answer in answers:
+        groups["different fossil"].extend((guess, answer) for guess in answers if guess != answer)
+        for typo in set(typos(answer.lower())) - {answer.lower()}:
+            groups["one mistake"].append((typo, answer))
+            groups["two mistakes"].extend((double, answer) for double in typos(typo))
+    return groups
+
+# Damerau-Levenshtein distance without limits or shortcuts, kept simple to check edit_distance against
+def reference_distance(a, b):
+    n, m = len(a), len(b)
+    infinity = n + m
+    rows = [[infinity] * (m + 2) for _ in range(n + 2)]
+    for i in range(n + 1):
+        rows[i + 1][1] = i
+    for j in range(m + 1):
+        rows[1][j + 1] = j
+    last_row = {}
+    for i in range(1, n + 1):
+        last_column = 0
+        for j in range(1, m + 1):
+            k = last_row.get(b[j - 1], 0)
+            l = last_column
+            cost = 1
+            if a[i - 1] == b[j - 1]:
+                cost = 0
+                last_column = j
+            transposed = rows[k][l] + (i - k - 1) + 1 + (j - l - 1)
+            rows[i + 1][j + 1] = min(rows[i][j] + cost, rows[i + 1][j] + 1, rows[i][j + 1] + 1, transposed)
+        last_row[a[i - 1]] = i
+    return rows[n + 1][m + 1]
+
+# pairs where edit_distance isn't the reference distance capped at limit + 1, for every limit up to 4
+def check_distances(pairs):
+    mismatches = []
+    for guess, answer in pairs:
+        guess, answer = normalize(guess), normalize(answer)
+        distance = reference_distance(guess, answer)
+        for limit in range(5):
+            if edit_distance(guess, answer, limit) != min(distance, limit + 1):
+                mismatches.append((guess, answer, limit, distance))
+    print(f"mismatches with damerau-levenshtein: {len(mismatches)}")
+    for guess, answer, limit, distance in mismatches[:10]:
+        print(f"    {guess!r} vs {answer!r} (limit {limit}): {edit_distance(guess, answer, limit)}, should be {distance}")
+    return mismatches
+
+# guesses the edit distance grades worse than difflib did, over every fossil:
+# one mistake guesses difflib accepted and it rejects, or different fossils difflib rejected and it accepts
+def check_regressions(groups):
+    regressions = []
+    for guess, answer in groups["one mistake"]:
+        if difflib_spellcheck(guess, answer) and not edit_spellcheck(guess, answer):
+            regressions.append((guess, answer, "rejects"))
+    for guess, answer in groups["different fossil"]:
+        if not difflib_spellcheck(guess, answer) and edit_spellcheck(guess, answer):
+            regressions.append((guess, answer, "accepts"))
+    print(f"regressions from difflib: {len(regressions)}")
+    for guess, answer, grade in regressions[:10]:
+        print(f"    {guess!r} vs {answer!r}: edit distance {grade} it")
+    return regressions
+
+def main():
+    fossils = load_fossils()
+    groups = build_pairs(fossils)
+    print(f"{len(fossils)} fossils, {sum(map(len, groups.values()))} guess/answer pairs")
+    
+    print(f"{'':>16}  {'difflib':>9}  {'edit distance':>13}  (% of guesses accepted)")
+    for group, pairs in groups.items():
+        old = sum(map(lambda pair: difflib_spellcheck(*pair), pairs)) / len(pairs)
+        new = sum(map(lambda pair: edit_spellcheck(*pair), pairs)) / len(pairs)
+        print(f"{group:>16}  {old:>9.2%}  {new:>13.2%}")
+    
+    pairs = [pair for group in groups.values() for pair in group]
+    disagreements = [
+        (guess, answer) for guess, answer in pairs if difflib_spellcheck(guess, answer) != edit_spellcheck(guess, answer)
+    ]
+    print(f"disagreements: {len(disagreements)}")
+    for guess, answer in disagreements[:10]:
+        print(f"    {guess!r} vs {answer!r}: edit distance {'accepts' if edit_spellcheck(guess, answer) else 'rejects'}")
+    
+    regressions = check_regressions(groups)
+    # every typo pair, and the different fossils sampled since there are far more of them
+    checked = groups["one mistake"] + groups["two mistakes"] + groups["different fossil"][::50]
+    mismatches = check_distances(checked)
+    
+    sample = pairs[::max(1, len(pairs) // 20000)]
+    for name, function in (("difflib", difflib_spellcheck), ("edit distance", edit_spellcheck)):
+        seconds = min(timeit.repeat(lambda: [function(guess, answer) for guess, answer in sample], number=1, repeat=3))
+        print(f"{name:>16}: {seconds * 1e6 / len(sample):.2f} us per check")
+    
+    if regressions:
+        sys.exit(f"edit distance grades {len(regressions)} guesses worse than difflib")
+    if mismatches:
+        sys.exit(f"edit distance is wrong for {len(mismatches)} pairs and limits")
+
+if __name__ == "__main__":
+    main()
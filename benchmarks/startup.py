@@ -0,0 +1,97 @@
+# startup.py | import time of the bot's entry point
+# Copyright (C) 2019  EraserBird, person_v1.32, hmmm
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# run from the repository root, it doesn't need a database or discord:
+# python -m benchmarks.startup [--runs 5] [--top 15]
+#
+# Imports bot.py and every extension it loads in a new interpreter, like a restart does,
+# and reports the wall time and python's -X importtime breakdown of the slowest imports.
+# The time the bot takes to log in and get ready is logged by the bot itself, see startup.py.
+
+import argparse
+import collections
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+IMPORT_BOT = "import importlib, bot\nfor extension in bot.EXTENSIONS: importlib.import_module(extension)"
+# modules only needed when something isn't cached, importing them at startup is a regression
+DEFERRED = ("wikipedia", "bs4", "lxml", "magic", "aiofiles", "requests", "download_images")
+
+def _import(importtime):
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", IMPORT_BOT]
+    start = time.perf_counter()
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        sys.exit(f"importing the bot failed:\n{result.stderr}")
+    return elapsed, result.stderr
+
+# -X importtime lines, "import time: self [us] | cumulative | imported package"
+# returns (module, self seconds, cumulative seconds, depth) for each import
+def parse_importtime(output):
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), int(own) / 1e6, int(cumulative) / 1e6, depth))
+    return imports
+
+def report(times, imports, top):
+    print(f"python startup and imports: p50 {statistics.median(times):.3f} s, best {min(times):.3f} s, {len(times)} runs")
+    print(f"{len(imports)} modules, {sum(own for _, own, _, _ in imports):.3f} s importing them")
+    print()
+    
+    # the extensions and the modules bot.py imports, with what each one pulled in
+    root = min(depth for name, _, _, depth in imports if name == "bot")
+    direct = [(name, cumulative) for name, _, cumulative, depth in imports if depth <= root + 1 and name != "bot"]
+    print("slowest imports of the entry point (cumulative s)")
+    for name, cumulative in sorted(direct, key=lambda item: item[1], reverse=True)[:top]:
+        print(f"{cumulative:>8.3f}  {name}")
+    print()
+    
+    packages = collections.Counter()
+    for name, own, _, _ in imports:
+        packages[name.split(".")[0]] += own
+    print("packages taking the longest to import (own s)")
+    for name, own in packages.most_common(top):
+        print(f"{own:>8.3f}  {name}")
+    print()
+    
+    imported = {name.split(".")[0] for name, _, _, _ in imports}
+    loaded = [name for name in DEFERRED if name in imported]
+    print("deferred modules imported at startup: " + (", ".join(loaded) if loaded else "none"))
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how long importing the bot takes.")
+    parser.add_argument("--runs", type=int, default=5, help="times to import the bot for the wall time")
+    parser.add_argument("--top", type=int, default=15, help="imports to list")
+    options = parser.parse_args()
+    
+    if not os.path.exists("bot.py"):
+        sys.exit("run this from the repository root")
+    # the first run also writes the bytecode cache, it isn't counted
+    _import(False)
+    times = [_import(False)[0] for _ in range(options.runs)]
+    imports = parse_importtime(_import(True)[1])
+    report(times, imports, options.top)
+
+if __name__ == "__main__":
+    main()
@@ -14,31 +14,56 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+# first, so the startup time includes the other imports
+import startup
+
 import asyncio
 import errno
 import os
 import shutil
 import sys
+import time
 from concurrent.futures import ThreadPoolExecutor
 
 import aiohttp
 import discord
 import redis
-import wikipedia
 from discord.ext import commands, tasks
 
+from cooldowns import SHARED_COOLDOWNS, share_cooldowns
 from data.data import database, logger, bot_name
 from functions import channel_setup, precache, backup_all
+from image_cache import image_cache
+from keys import channel_key
+from metrics import setup_metrics
+from permissions import permission_cache, setup_permissions
+from server import start_server
+from watchdog import watchdog
+from wiki import WikiDisambiguationError, WikiError, WikiPageError, precache_urls
 
 BACKUPS_CHANNEL = 643583771463122946
 
+EXTENSIONS = (
+    'cogs.get_fossils', 'cogs.check', 'cogs.skip', 'cogs.hint', 'cogs.score', 'cogs.sessions', 'cogs.other', 'cogs.batch',
+    'cogs.history', 'cogs.debug'
+)
+
+startup.phase("imports")
+
 if __name__ == '__main__':
     # Initialize bot
     bot = commands.Bot(command_prefix=['f!', 'f.', 'f#'], case_insensitive=True, description=bot_name)
+    setup_metrics(bot)
+    setup_permissions(bot)
+    start_server(bot, int(os.getenv("PORT") or 2000))
+    watchdog.start(bot.loop)
     
     @bot.event
     async def on_ready():
         print("Ready!")
+        report = startup.ready()
+        if report is not None:
+            logger.info("startup: %s", report)
         logger.info("Logged in as:")
         logger.info(bot.user.name)
         logger.info(bot.user.id)
@@ -47,11 +72,16 @@ if __name__ == '__main__':
         
         #refresh_cache.start()
     
-    for extension in ('cogs.get_fossils', 'cogs.check', 'cogs.skip', 'cogs.hint', 'cogs.score', 'cogs.sessions', 'cogs.other'):
+    for extension in EXTENSIONS:
+        start = time.perf_counter()
         try:
             bot.load_extension(extension)
         except (discord.ClientException, ModuleNotFoundError):
             logger.exception(f'Failed to load extension {extension}.')
+        startup.extension_loaded(extension, time.perf_counter() - start)
+    if SHARED_COOLDOWNS:
+        share_cooldowns(bot)
+    startup.phase("setup")
     if sys.platform == 'win32':
         asyncio.set_event_loop(asyncio.ProactorEventLoop())
     
@@ -60,28 +90,24 @@ if __name__ == '__main__':
     ######
     
     # Global check for dms - remove cooldowns
+    # DMs are checked first, so commands in servers don't look at their cooldown twice
     @bot.check
     async def dm_cooldown(ctx):
-        if ctx.command.is_on_cooldown(ctx) and ctx.guild is None:
+        if ctx.guild is None and ctx.command.is_on_cooldown(ctx):
             ctx.command.reset_cooldown(ctx)
         return True
     
     # Global check for correct permissions
+    # the result for each channel is cached until roles or overwrites change, see permissions.py
     @bot.check
     def bot_has_permissions(ctx):
-        # code copied from @commands.bot_has_permissions(send_messages=True, embed_links=True, attach_files=True)
         if ctx.guild is not None:
-            perms = {"send_messages": True, "embed_links": True, "attach_files": True}
-            guild = ctx.guild
-            me = guild.me if guild is not None else ctx.bot.user
-            permissions = ctx.channel.permissions_for(me)
-            
-            missing = [perm for perm, value in perms.items() if getattr(permissions, perm, None) != value]
+            missing = permission_cache.missing(ctx.guild, ctx.channel)
             
             if not missing:
                 return True
             
-            raise commands.BotMissingPermissions(missing)
+            raise commands.BotMissingPermissions(list(missing))
         else:
             return True
     
@@ -129,7 +155,7 @@ if __name__ == '__main__':
         
         elif isinstance(error, commands.CommandInvokeError):
             if isinstance(error.original, redis.exceptions.ResponseError):
-                if database.exists(f"channel:{str(ctx.channel.id)}"):
+                if database.exists(channel_key(ctx.channel.id)):
                     await ctx.send(
                         """**An unexpected ResponseError has occurred.**
 *Please log this message in #support in the support server below, or try again.*
@@ -140,13 +166,13 @@ if __name__ == '__main__':
                     await channel_setup(ctx)
                     await ctx.send("Please run that command again.")
             
-            elif isinstance(error.original, wikipedia.exceptions.DisambiguationError):
+            elif isinstance(error.original, WikiDisambiguationError):
                 await ctx.send("Wikipedia page not found. (Disambiguation Error)")
             
-            elif isinstance(error.original, wikipedia.exceptions.PageError):
+            elif isinstance(error.original, WikiPageError):
                 await ctx.send("Wikipedia page not found. (Page Error)")
             
-            elif isinstance(error.original, wikipedia.exceptions.WikipediaException):
+            elif isinstance(error.original, WikiError):
                 await ctx.send("Wikipedia page unavaliable. Try again later.")
             
             elif isinstance(error.original, aiohttp.ClientOSError):
@@ -183,16 +209,29 @@ if __name__ == '__main__':
     def start_precache():
         asyncio.run(precache())
     
-    @tasks.loop(hours=48.0)
-    async def refresh_cache():
-        logger.info("clear cache")
+    def clear_image_cache():
         try:
             shutil.rmtree(r'cache/images/', ignore_errors=True)
             logger.info("Cleared image cache.")
         except FileNotFoundError:
             logger.info("Already cleared image cache.")
+    
+    async def cache_urls():
+        try:
+            await precache_urls()
+        except Exception:
+            logger.exception("wikipedia caching failed")
+    
+    @tasks.loop(hours=48.0)
+    async def refresh_cache():
+        logger.info("clear cache")
+        loop = asyncio.get_event_loop()
+        # the first run starts with the bot, deleting a big cache on the event loop would hold up the login
+        await loop.run_in_executor(None, clear_image_cache)
+        image_cache.clear()
+        # wikipedia is slow or down sometimes, the images don't wait for it
+        loop.create_task(cache_urls())
         with ThreadPoolExecutor(max_workers=1) as executor:
-            loop = asyncio.get_event_loop()
             await loop.run_in_executor(executor, start_precache)
     
     refresh_cache.start()
@@ -226,4 +265,4 @@ if __name__ == '__main__':
         logger.info("Backup Files Sent!")
 
 def start_backup():
-    asyncio.run(backup_all())
\ No newline at end of file
+    asyncio.run(backup_all())
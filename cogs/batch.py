@@ -0,0 +1,200 @@
+# batch.py | commands for several fossils at once
+# Copyright (C) 2019  EraserBird, person_v1.32, hmmm
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import io
+import re
+import time
+
+import discord
+from discord.ext import commands
+
+from answers import record_answer
+from data.data import GenericError, database, logger
+from functions import (
+    channel_setup, check_answer, draw_fossils, incorrect_increment, load_image, score_increment, session_increment, user_setup
+)
+from keys import channel_key
+from review import record_review
+
+BATCH_MESSAGE = (
+    "*Here you go!* \n**Answer them all at once with `f!batch check 1. guess 2. guess ...`, " +
+    "or use `f!batch skip` to see the answers.**"
+)
+
+# discord limits for one message
+MAX_FILES = 10
+MAX_BYTES = 8000000
+
+# "1. acer 2) amber" or one answer per line/comma
+NUMBERED_ANSWER = re.compile(r"(?:^|[\s,;])(\d{1,2})\s*[.):]\s*")
+
+# splits a numbered answer list into one guess per fossil, blank if missing
+def parse_answers(text, amount):
+    answers = [""] * amount
+    matches = list(NUMBERED_ANSWER.finditer(text))
+    if matches:
+        for match, following in zip(matches, matches[1:] + [None]):
+            number = int(match.group(1))
+            end = following.start() if following is not None else len(text)
+            if 1 <= number <= amount:
+                answers[number - 1] = text[match.end():end].strip(" ,;\n")
+    else:
+        for i, answer in enumerate(re.split(r"[\n,;]+", text)[:amount]):
+            answers[i] = answer.strip()
+    return answers
+
+# sends the images as few messages as discord allows
+async def send_batch(ctx, fossils):
+    try:
+        images = await asyncio.gather(*(load_image(ctx, fossil) for fossil in fossils))
+    except GenericError as e:
+        logger.exception(e)
+        await ctx.send(f"**An error has occurred while fetching images.**\n*Please try again.*\n**Reason:** {str(e)}")
+        return False
+    
+    messages = [[]]
+    size = 0
+    for number, (image, extension) in enumerate(images, start=1):
+        if len(messages[-1]) == MAX_FILES or size + len(image) > MAX_BYTES:
+            messages.append([])
+            size = 0
+        # numbered filenames so answers can refer to them, without spoilers
+        messages[-1].append(discord.File(io.BytesIO(image), filename=f"fossil{number}.{extension}"))
+        size += len(image)
+    
+    for i, files in enumerate(messages):
+        await ctx.send(BATCH_MESSAGE if i == 0 else None, files=files)
+    return True
+
+# the take batch script for the memory database
+def _take_batch(client, keys, args):
+    batch = client.hmget(keys[0], ["batch", "batch_sent"])
+    client.hset(keys[0], "batch", "")
+    return batch
+
+# gets and clears a channel's batch and when it was sent in one call
+# KEYS[1] - channel data
+TAKE_BATCH_SCRIPT = database.register_script(
+    """
+local batch = redis.call("HMGET", KEYS[1], "batch", "batch_sent")
+redis.call("HSET", KEYS[1], "batch", "")
+return batch
+""",
+    fallback=_take_batch
+)
+
+# returns the channel's batch and the time it was sent, and clears it
+def take_batch(ctx):
+    batch, sent = TAKE_BATCH_SCRIPT(keys=[channel_key(ctx.channel.id)])
+    if not batch:
+        return [], None
+    return batch.decode("utf-8").split("\n"), sent and float(sent)
+
+class Batch(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+    
+    # Batch command - argument is number of fossils
+    @commands.group(
+        brief="- Sends several fossils to ID at once",
+        help="- Sends several fossils to ID at once, argument is between 2 and 10, default is 5.",
+        usage="[amount]",
+        aliases=["b"],
+        invoke_without_command=True
+    )
+    @commands.cooldown(1, 5.0, type=commands.BucketType.channel)
+    async def batch(self, ctx, amount: int = 5):
+        logger.info("command: batch")
+        
+        await channel_setup(ctx)
+        await user_setup(ctx)
+        
+        current_batch = database.hget(channel_key(ctx.channel.id), "batch")
+        if current_batch:  # if the last batch wasn't answered, send it again
+            await send_batch(ctx, current_batch.decode("utf-8").split("\n"))
+            return
+        
+        if amount < 2 or amount > MAX_FILES:
+            await ctx.send(f"Not a valid number. Pick one between 2 and {MAX_FILES}!")
+            return
+        
+        session_increment(ctx, "total", amount)
+        
+        fossils = draw_fossils(ctx, amount)
+        logger.debug("batch: %s", fossils)
+        if await send_batch(ctx, fossils):
+            database.hmset(channel_key(ctx.channel.id), {"batch": "\n".join(fossils), "batch_sent": time.time()})
+    
+    # Batch check command - argument is the numbered list of guesses
+    @batch.command(
+        name="check", help="- Checks a numbered list of answers to the batch.", usage="1. guess 2. guess ...", aliases=["c"]
+    )
+    @commands.cooldown(1, 3.0, type=commands.BucketType.channel)
+    async def batch_check(self, ctx, *, guesses):
+        logger.info("command: batch check")
+        
+        await channel_setup(ctx)
+        await user_setup(ctx)
+        
+        fossils, sent = take_batch(ctx)
+        if not fossils:
+            await ctx.send("You must ask for a batch first!")
+            return
+        
+        answers = parse_answers(guesses, len(fossils))
+        results = [bool(guess) and check_answer(guess, fossil) for guess, fossil in zip(answers, fossils)]
+        correct = sum(results)
+        logger.debug("batch correct: %s/%s", correct, len(fossils))
+        
+        pipe = database.pipeline(transaction=False)
+        if correct:
+            score_increment(ctx, correct, pipe)
+        for fossil, guess, right in zip(fossils, answers, results):
+            if not right:
+                incorrect_increment(ctx, fossil, 1, pipe)
+            record_review(ctx.author.id, fossil, right, pipe)
+            record_answer(ctx, fossil, guess, right, sent, pipe)
+        session_increment(ctx, "correct", correct, pipe)
+        session_increment(ctx, "incorrect", len(fossils) - correct, pipe)
+        pipe.execute()
+        
+        lines = []
+        for number, (fossil, guess, right) in enumerate(zip(fossils, answers, results), start=1):
+            if right:
+                lines.append(f"{number}. :white_check_mark: {fossil.lower()}")
+            else:
+                lines.append(f"{number}. :x: {fossil.lower()}" + (f" (you said {guess})" if guess else ""))
+        await ctx.send(f"**You got {correct}/{len(fossils)} correct!**\n" + "\n".join(lines))
+    
+    # Batch skip command - no args
+    @batch.command(name="skip", help="- Skips the batch and shows the answers.", aliases=["s"])
+    @commands.cooldown(1, 5.0, type=commands.BucketType.channel)
+    async def batch_skip(self, ctx):
+        logger.info("command: batch skip")
+        
+        await channel_setup(ctx)
+        await user_setup(ctx)
+        
+        fossils, _ = take_batch(ctx)
+        if fossils:
+            answers = "\n".join(f"{number}. {fossil.lower()}" for number, fossil in enumerate(fossils, start=1))
+            await ctx.send(f"Ok, skipping the batch.\n**Answers:**\n{answers}")
+        else:
+            await ctx.send("You need to ask for a batch first!")
+
+def setup(bot):
+    bot.add_cog(Batch(bot))
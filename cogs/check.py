@@ -15,18 +15,29 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import discord
-import wikipedia
 from discord.ext import commands
 
-from data.data import database, logger
+from answers import record_answer
+from data.data import database, fossils_index, logger
 from functions import (
-    fossil_setup, channel_setup, incorrect_increment, score_increment, session_increment, spellcheck, user_setup
+    check_answer, fossil_setup, channel_setup, incorrect_increment, score_increment, session_increment, user_setup
 )
+from keys import USERS_GLOBAL, channel_key
+from matching import normalize
+from review import record_review
+from wiki import get_wiki_url
 
 #TODO
 achievements = (1, )
 #achievements = (1, 10, 25, 50, 100, 150, 200, 250, 400, 420, 500, 650, 666, 690)
 
+# points out a misspelled fossil name in a wrong guess
+def _suggestion(guess):
+    matches = fossils_index.lookup(guess, k=1)
+    if matches and normalize(matches[0]) != normalize(guess):
+        return f" (Did you mean {matches[0].lower()}?)"
+    return ""
+
 class Check(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
@@ -39,26 +50,27 @@ class Check(commands.Cog):
         
         await channel_setup(ctx)
         await user_setup(ctx)
-        current_fossil = str(database.hget(f"channel:{str(ctx.channel.id)}", "fossil"))[2:-1]
+        current_fossil, sent = database.hmget(channel_key(ctx.channel.id), ["fossil", "sent"])
+        current_fossil = str(current_fossil)[2:-1]
         if current_fossil == "":
             await ctx.send("You must ask for a fossil first!")
         else:  # if there is a fossil, it checks answer
             await fossil_setup(ctx, current_fossil)
-            database.hset(f"channel:{str(ctx.channel.id)}", "fossil", "")
-            database.hset(f"channel:{str(ctx.channel.id)}", "answered", "1")
-            if spellcheck(guess.split(" ")[-1], current_fossil.split(" ")[-1]):
+            database.hset(channel_key(ctx.channel.id), "fossil", "")
+            database.hset(channel_key(ctx.channel.id), "answered", "1")
+            if check_answer(guess, current_fossil):
                 logger.info("correct")
                 
-                if database.exists(f"session.data:{ctx.author.id}"):
-                    logger.info("session active")
-                    session_increment(ctx, "correct", 1)
-                
                 await ctx.send("Correct! Good job!")
-                page = wikipedia.page(current_fossil)
-                await ctx.send(page.url)
-                score_increment(ctx, 1)
-                if int(database.zscore("users:global", str(ctx.author.id))) in achievements:
-                    number = str(int(database.zscore("users:global", str(ctx.author.id))))
+                await ctx.send(await get_wiki_url(current_fossil))
+                pipe = database.pipeline(transaction=False)
+                score_increment(ctx, 1, pipe)
+                session_increment(ctx, "correct", 1, pipe)
+                record_review(ctx.author.id, current_fossil, True, pipe)
+                record_answer(ctx, current_fossil, guess, True, sent and float(sent), pipe)
+                pipe.execute()
+                if int(database.zscore(USERS_GLOBAL, str(ctx.author.id))) in achievements:
+                    number = str(int(database.zscore(USERS_GLOBAL, str(ctx.author.id))))
                     await ctx.send(f"Wow! You have answered {number} fossils correctly!")
                     filename = 'achievements/' + number + ".PNG"
                     with open(filename, 'rb') as img:
@@ -67,16 +79,16 @@ class Check(commands.Cog):
             else:
                 logger.info("incorrect")
                 
-                if database.exists(f"session.data:{ctx.author.id}"):
-                    logger.info("session active")
-                    session_increment(ctx, "incorrect", 1)
-                
-                incorrect_increment(ctx, str(current_fossil), 1)
-                await ctx.send("Sorry, the fossil was actually " + current_fossil.lower() + ".")
-                page = wikipedia.page(current_fossil)
-                await ctx.send(page.url)
-            logger.info("current_fossil: " + str(current_fossil.lower().replace("-", " ")))
-            logger.info("guess: " + str(guess.lower().replace("-", " ")))
+                pipe = database.pipeline(transaction=False)
+                incorrect_increment(ctx, str(current_fossil), 1, pipe)
+                session_increment(ctx, "incorrect", 1, pipe)
+                record_review(ctx.author.id, current_fossil, False, pipe)
+                record_answer(ctx, current_fossil, guess, False, sent and float(sent), pipe)
+                pipe.execute()
+                await ctx.send("Sorry, the fossil was actually " + current_fossil.lower() + "." + _suggestion(guess))
+                await ctx.send(await get_wiki_url(current_fossil))
+            logger.debug("current_fossil: %s", current_fossil)
+            logger.debug("guess: %s", guess)
 
 def setup(bot):
     bot.add_cog(Check(bot))
@@ -0,0 +1,93 @@
+# debug.py | owner commands for finding slow code
+# Copyright (C) 2019  EraserBird, person_v1.32, hmmm
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import io
+import time
+
+import discord
+from discord.ext import commands
+
+from data.data import logger
+from functions import owner_check
+from profiler import MAX_SECONDS, ProfilerBusy, run_profile
+from tracing import SAMPLE_RATE, format_trace, slowest_traces
+from watchdog import watchdog
+
+# longest message sent as text, longer ones are sent as a file
+MAX_MESSAGE = 1900
+
+# sends text in a code block, or as a file if it is too long
+async def send_report(ctx, text, filename):
+    if len(text) > MAX_MESSAGE:
+        await ctx.send(file=discord.File(io.BytesIO(text.encode("utf-8")), filename=filename))
+    else:
+        await ctx.send(f"```\n{text}\n```")
+
+class Debug(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+    
+    # Slowest traces - for testing purposes only
+    @commands.command(help="- slowest recent command traces", hidden=True, usage="[amount] [command]")
+    @commands.check(owner_check)
+    async def traces(self, ctx, amount: int = 5, *, command=None):
+        logger.info("command: traces")
+        
+        traces = slowest_traces(min(max(amount, 1), 50), command)
+        if not traces:
+            await ctx.send(f"No traces yet. {SAMPLE_RATE:.0%} of commands are traced.")
+            return
+        text = "\n\n".join(
+            time.strftime("%H:%M:%S UTC ", time.gmtime(trace["time"])) + format_trace(trace) for trace in traces
+        )
+        await send_report(ctx, text, "traces.txt")
+    
+    # Profiler - for testing purposes only
+    @commands.command(help="- profile the bot for some seconds", hidden=True, usage="[seconds]")
+    @commands.check(owner_check)
+    async def profile(self, ctx, seconds: float = 10.0):
+        logger.info("command: profile")
+        
+        seconds = min(max(seconds, 1.0), MAX_SECONDS)
+        await ctx.send(f"Profiling for {seconds:.0f} s.")
+        try:
+            report = await run_profile(seconds)
+        except ProfilerBusy:
+            await ctx.send("**A profile is already running.** *Try again when it is done.*")
+            return
+        await ctx.send(file=discord.File(io.BytesIO(report.encode("utf-8")), filename="profile.txt"))
+    
+    # Event loop blocking - for testing purposes only
+    @commands.command(help="- code that blocked the event loop the longest", hidden=True, usage="[amount]")
+    @commands.check(owner_check)
+    async def blocking(self, ctx, amount: int = 5):
+        logger.info("command: blocking")
+        
+        worst = watchdog.worst(min(max(amount, 1), 50))
+        if not worst:
+            await ctx.send(f"Nothing has blocked the event loop for over {watchdog.threshold * 1000:.0f} ms.")
+            return
+        sections = []
+        for site, stats in worst:
+            commands_seen = ", ".join(f"{command} {count}x" for command, count in stats.commands.most_common())
+            sections.append(
+                f"{site}\n{stats.count} blocks, {stats.total * 1000:.0f} ms in all, longest {stats.longest * 1000:.0f} ms\n" +
+                f"commands: {commands_seen}\n{stats.stack}"
+            )
+        await send_report(ctx, f"{watchdog.blocks} blocks in all\n\n" + "\n\n".join(sections), "blocking.txt")
+
+def setup(bot):
+    bot.add_cog(Debug(bot))
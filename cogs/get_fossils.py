@@ -14,10 +14,14 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-import random
+import time
+
 from discord.ext import commands
-from data.data import fossils_list, database, logger
-from functions import (channel_setup, error_skip, send_fossil, user_setup, session_increment)
+from data.data import database, logger
+from functions import (channel_setup, draw_fossil, error_skip, send_fossil, user_setup, session_increment)
+from keys import channel_key, incorrect_server_key, incorrect_user_key
+from practice import practice_fossil
+from review import next_review
 
 BASE_MESSAGE = (
     "*Here you go!* \n**Use `f!{new_cmd}` again to get a new {media} of the same fossil, " +
@@ -26,46 +30,65 @@ BASE_MESSAGE = (
 
 FOSSIL_MESSAGE = BASE_MESSAGE.format(media="image", new_cmd="fossil", skip_cmd="skip", check_cmd="check", hint_cmd="hint")
 
+# incorrect set to weight practice fossils by
+def practice_key(ctx, scope):
+    if scope.lower() in ("server", "s") and ctx.guild is not None:
+        return incorrect_server_key(ctx.guild.id)
+    return incorrect_user_key(ctx.author.id)
+
 class Fossils(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
     
-    # Fossil command - no args
+    # Fossil command - optional mode and scope
     # help text
-    @commands.command(help='- Sends a random fossil image for you to ID', aliases=["f"], usage="", ignore_extra=False)
+    @commands.command(
+        brief="- Sends a random fossil image for you to ID",
+        help="- Sends a random fossil image for you to ID. " +
+        "Use `practice` to get the fossils you miss most more often, scope is either me or server. (m, s) " +
+        "Use `review` to get the fossils you are due to review.",
+        aliases=["f"],
+        usage="[practice [me|server]|review]",
+        ignore_extra=False
+    )
     # 5 second cooldown
     @commands.cooldown(1, 3.0, type=commands.BucketType.channel)
-    async def fossil(self, ctx):
+    async def fossil(self, ctx, mode="", scope="me"):
         logger.info("command: fossil")
         
+        mode = mode.lower()
+        if mode not in ("", "practice", "p", "review", "r"):
+            await ctx.send(f"**{mode} is not a valid mode!**\n*Valid Modes:* `practice, review`")
+            return
+        
         await channel_setup(ctx)
         await user_setup(ctx)
-        logger.info("fossil: " + str(database.hget(f"channel:{str(ctx.channel.id)}", "fossil"))[2:-1])
         
-        answered = int(database.hget(f"channel:{str(ctx.channel.id)}", "answered"))
-        logger.info(f"answered: {answered}")
+        answered = int(database.hget(channel_key(ctx.channel.id), "answered"))
+        logger.debug("answered: %s", answered)
         # check to see if previous fossil was answered
         if answered:  # if yes, give a new fossil
-            if database.exists(f"session.data:{ctx.author.id}"):
-                logger.info("session active")
-                session_increment(ctx, "total", 1)
-            logger.info(f"number of fossils: {len(fossils_list)}")
+            session_increment(ctx, "total", 1)
             
-            current_fossil = random.choice(fossils_list)
-            prevB = str(database.hget(f"channel:{str(ctx.channel.id)}", "prevB"))[2:-1]
-            while current_fossil == prevB:
-                current_fossil = random.choice(fossils_list)
-            database.hset(f"channel:{str(ctx.channel.id)}", "prevB", str(current_fossil))
-            database.hset(f"channel:{str(ctx.channel.id)}", "fossil", str(current_fossil))
-            logger.info("current fossil: " + str(current_fossil))
-            await send_fossil(ctx, current_fossil, on_error=error_skip, message=FOSSIL_MESSAGE)
-            database.hset(f"channel:{str(ctx.channel.id)}", "answered", "0")
+            message = FOSSIL_MESSAGE
+            current_fossil = None
+            if mode in ("practice", "p"):
+                prevB = str(database.hget(channel_key(ctx.channel.id), "prevB"))[2:-1]
+                current_fossil = practice_fossil(practice_key(ctx, scope), exclude=prevB)
+            elif mode in ("review", "r"):
+                current_fossil = next_review(ctx.author.id)
+                if current_fossil is None:
+                    message = "*No fossils are due for review, so here's a new one.*\n" + FOSSIL_MESSAGE
+            if current_fossil is None:
+                current_fossil = draw_fossil(ctx)
+            database.hset(channel_key(ctx.channel.id), "prevB", str(current_fossil))
+            database.hset(channel_key(ctx.channel.id), "fossil", str(current_fossil))
+            logger.info("current fossil: %s", current_fossil)
+            await send_fossil(ctx, current_fossil, on_error=error_skip, message=message)
+            database.hmset(channel_key(ctx.channel.id), {"answered": "0", "sent": time.time()})
         else:  # if no, give the same fossil
             await send_fossil(
-                ctx,
-                str(database.hget(f"channel:{str(ctx.channel.id)}", "fossil"))[2:-1],
-                on_error=error_skip,
-                message=FOSSIL_MESSAGE
+                ctx, str(database.hget(channel_key(ctx.channel.id), "fossil"))[2:-1], on_error=error_skip, message=FOSSIL_MESSAGE
             )
 
 def setup(bot):
@@ -18,6 +18,7 @@ from discord.ext import commands
 
 from data.data import database, logger
 from functions import channel_setup, user_setup
+from keys import channel_key
 
 class Hint(commands.Cog):
     def __init__(self, bot):
@@ -32,7 +33,7 @@ class Hint(commands.Cog):
         await channel_setup(ctx)
         await user_setup(ctx)
         
-        current_fossil = str(database.hget(f"channel:{str(ctx.channel.id)}", "fossil"))[2:-1]
+        current_fossil = str(database.hget(channel_key(ctx.channel.id), "fossil"))[2:-1]
         if current_fossil != "":
             await ctx.send(f"The first letter is {current_fossil[0]}")
         else:
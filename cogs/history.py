@@ -0,0 +1,112 @@
+# history.py | commands for answer history and what is often confused
+# Copyright (C) 2019  EraserBird, person_v1.32, hmmm
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import io
+import tempfile
+
+import discord
+from discord.ext import commands, tasks
+
+from answers import MAX_ANSWERS, aggregate_answers, export_answers
+from data.data import database, logger
+from functions import channel_setup, user_setup
+from keys import CONFUSION_GLOBAL, confusion_server_key
+
+# seconds between aggregating the answer stream
+AGGREGATE_INTERVAL = 15.0
+
+class History(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.aggregate.start()
+    
+    def cog_unload(self):
+        self.aggregate.cancel()
+    
+    @tasks.loop(seconds=AGGREGATE_INTERVAL)
+    async def aggregate(self):
+        try:
+            await asyncio.get_event_loop().run_in_executor(None, aggregate_answers)
+        except Exception:
+            logger.exception("aggregating answers failed")
+    
+    # Confused command - fossils most often mistaken for each other
+    @commands.command(
+        brief="- Fossils most often mistaken for another",
+        help="- Fossils most often mistaken for another. Scope is 'global' or 'server'.",
+        usage="[global|server]"
+    )
+    @commands.cooldown(1, 5.0, type=commands.BucketType.channel)
+    async def confused(self, ctx, scope="global"):
+        logger.info("command: confused")
+        
+        await channel_setup(ctx)
+        await user_setup(ctx)
+        
+        scope = scope.lower()
+        if scope in ("server", "s"):
+            if ctx.guild is None:
+                await ctx.send("**Server scopes are not available in DMs.**")
+                return
+            database_key = confusion_server_key(ctx.guild.id)
+            scope = "server"
+        elif scope in ("global", "g"):
+            database_key = CONFUSION_GLOBAL
+            scope = "global"
+        else:
+            await ctx.send("**Invalid scope!** *Use 'global' or 'server'.*")
+            return
+        
+        pairs = database.zrevrange(database_key, 0, 9, withscores=True)
+        if not pairs:
+            await ctx.send("No fossils have been confused yet!")
+            return
+        lines = []
+        for place, (pair, times) in enumerate(pairs, start=1):
+            fossil, guessed = pair.decode("utf-8").split("|")
+            lines.append(f"{place}. **{fossil.lower()}** guessed as **{guessed.lower()}** ({int(times)} times)")
+        await ctx.send(f"**Most confused fossils ({scope}):**\n" + "\n".join(lines))
+    
+    # History command - uploads your answers as csv
+    # every export reads the whole answer stream, the cooldown keeps that rare
+    @commands.command(
+        brief="- Sends a csv file of your recent answers",
+        help=f"- Sends a csv file of your answers among the last {MAX_ANSWERS:,} answered by anyone. " +
+        "Each export reads all of them, so it can be used once a minute.",
+        aliases=["export"]
+    )
+    @commands.cooldown(1, 60.0, type=commands.BucketType.user)
+    async def history(self, ctx):
+        logger.info("command: history")
+        
+        await channel_setup(ctx)
+        await user_setup(ctx)
+        
+        # the file is written a chunk of the stream at a time, so the export isn't built up in memory
+        with tempfile.TemporaryFile() as f:
+            text = io.TextIOWrapper(f, encoding="utf-8", newline="")
+            rows = await asyncio.get_event_loop().run_in_executor(None, export_answers, ctx.author.id, text)
+            text.flush()
+            text.detach()
+            if rows == 0:
+                await ctx.send("You haven't answered any fossils recently!")
+                return
+            f.seek(0)
+            await ctx.send(f"**{rows} answers:**", file=discord.File(f, filename="history.csv"))
+
+def setup(bot):
+    bot.add_cog(History(bot))
@@ -14,14 +14,21 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-from difflib import get_close_matches
-
 import discord
-import wikipedia
 from discord.ext import commands
 
-from data.data import bot_name, database, fossils_list, logger
+from data.data import bot_name, database, fossils_index, logger
 from functions import channel_setup, owner_check, send_fossil, user_setup
+from image_cache import image_cache
+from metrics import api_calls_per_command
+from wiki import WikiDisambiguationError, WikiPageError, get_wiki_url
+
+# suggests a fossil for a search that didn't work
+def _suggestion(arg):
+    matches = fossils_index.lookup(arg, k=1)
+    if matches:
+        return f" Did you mean {matches[0].lower()}?"
+    return ""
 
 class Other(commands.Cog):
     def __init__(self, bot):
@@ -36,13 +43,10 @@ class Other(commands.Cog):
         await channel_setup(ctx)
         await user_setup(ctx)
         
-        matches = get_close_matches(arg, fossils_list, n=1)
+        matches = fossils_index.lookup(arg, k=1)
         if matches:
             fossil = matches[0]
-            
-            delete = await ctx.send("Please wait a moment.")
             await send_fossil(ctx, str(fossil), message="Here's the image!")
-            await delete.delete()
         
         else:
             await ctx.send("Fossil not found. Are you sure it's on the list?")
@@ -57,12 +61,11 @@ class Other(commands.Cog):
         await user_setup(ctx)
         
         try:
-            page = wikipedia.page(arg)
-            await ctx.send(page.url)
-        except wikipedia.exceptions.DisambiguationError:
-            await ctx.send("Sorry, that page was not found. Try being more specific.")
-        except wikipedia.exceptions.PageError:
-            await ctx.send("Sorry, that page was not found.")
+            await ctx.send(await get_wiki_url(arg))
+        except WikiDisambiguationError:
+            await ctx.send("Sorry, that page was not found. Try being more specific." + _suggestion(arg))
+        except WikiPageError:
+            await ctx.send("Sorry, that page was not found." + _suggestion(arg))
     
     # bot info command - gives info on bot
     @commands.command(help="- Gives info on bot, support server invite, stats", aliases=["bot_info", "support", "stats"])
@@ -128,6 +131,22 @@ https://discordapp.com/api/oauth2/authorize?client_id=639279425631813648&permiss
         channel = self.bot.get_channel(channel_id)
         await channel.send(message)
         await ctx.send("Ok, sent!")
+    
+    # Image cache stats - for testing purposes only
+    @commands.command(help="- image cache stats", hidden=True, aliases=["cache"])
+    @commands.check(owner_check)
+    async def cachestats(self, ctx):
+        logger.info("command: cachestats")
+        stats = image_cache.stats()
+        await ctx.send("\n".join(f"**{key}:** {value}" for key, value in stats.items()))
+    
+    # Discord API calls per command - for testing purposes only
+    @commands.command(help="- discord api calls per command", hidden=True, aliases=["api"])
+    @commands.check(owner_check)
+    async def apicalls(self, ctx):
+        logger.info("command: apicalls")
+        calls = sorted(api_calls_per_command().items(), key=lambda item: item[1], reverse=True)
+        await ctx.send("\n".join(f"**{name}:** {average:.2f}" for name, average in calls) or "No commands yet.")
 
 def setup(bot):
     bot.add_cog(Other(bot))
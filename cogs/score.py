@@ -14,11 +14,20 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import asyncio
 import typing
+
 import discord
 from discord.ext import commands
 from data.data import database, logger, bot_name
 from functions import channel_setup, user_setup
+from keys import INCORRECT_GLOBAL, SCORE_GLOBAL, USERS_GLOBAL, incorrect_server_key, incorrect_user_key, users_server_key
+from leaderboards import cache_page, cached_page, name_cache, parse_period, period_key, read_page
+
+# reactions for the previous and next pages of a leaderboard
+PAGE_EMOJIS = ("\u23ea", "\u23e9")
+# seconds to wait for a page change
+PAGE_TIMEOUT = 60.0
 
 class Score(commands.Cog):
     def __init__(self, bot):
@@ -33,7 +42,7 @@ class Score(commands.Cog):
         await channel_setup(ctx)
         await user_setup(ctx)
         
-        totalCorrect = int(database.zscore("score:global", str(ctx.channel.id)))
+        totalCorrect = int(database.zscore(SCORE_GLOBAL, str(ctx.channel.id)))
         await ctx.send(
             f"Wow, looks like a total of {str(totalCorrect)} fossils have been answered correctly in this channel! " +
             "Good job everyone!"
@@ -60,16 +69,16 @@ class Score(commands.Cog):
                 return
             usera = user.id
             logger.info(usera)
-            if database.zscore("users:global", str(usera)) is not None:
-                times = str(int(database.zscore("users:global", str(usera))))
+            if database.zscore(USERS_GLOBAL, str(usera)) is not None:
+                times = str(int(database.zscore(USERS_GLOBAL, str(usera))))
                 user = f"<@{str(usera)}>"
             else:
                 await ctx.send("This user does not exist on our records!")
                 return
         else:
-            if database.zscore("users:global", str(ctx.author.id)) is not None:
+            if database.zscore(USERS_GLOBAL, str(ctx.author.id)) is not None:
                 user = f"<@{str(ctx.author.id)}>"
-                times = str(int(database.zscore("users:global", str(ctx.author.id))))
+                times = str(int(database.zscore(USERS_GLOBAL, str(ctx.author.id))))
             else:
                 await ctx.send("You haven't used this bot yet! (except for this)")
                 return
@@ -82,27 +91,35 @@ class Score(commands.Cog):
     # leaderboard - returns top 1-10 users
     @commands.command(
         brief="- Top scores",
-        help="- Top scores, argument can be between 1 and 10, default is 5. " + "Scope is either global or server. (g, s)",
+        help="- Top scores, argument can be between 1 and 10 per page, default is 5. " +
+        "Scope is either global or server. (g, s) " + "Period is either all, daily, weekly, or season. (a, d, w, se) " +
+        "React with the arrows to see more pages.",
+        usage="[scope] [placings] [period]",
         aliases=["lb"]
     )
     @commands.cooldown(1, 5.0, type=commands.BucketType.channel)
-    async def leaderboard(self, ctx, scope="", placings=5):
+    async def leaderboard(self, ctx, *args):
         logger.info("command: leaderboard")
         
         await channel_setup(ctx)
         await user_setup(ctx)
         
-        try:
-            placings = int(scope)
-        except ValueError:
-            if scope is "":
-                scope = "global"
-            scope = scope.lower()
-        else:
-            scope = "global"
+        scope = "global"
+        placings = 5
+        period = "all"
+        for arg in args:
+            arg = arg.lower()
+            try:
+                placings = int(arg)
+            except ValueError:
+                if parse_period(arg) is not None:
+                    period = parse_period(arg)
+                else:
+                    scope = arg
         
-        logger.info(f"scope: {scope}")
-        logger.info(f"placings: {placings}")
+        logger.debug("scope: %s", scope)
+        logger.debug("placings: %s", placings)
+        logger.debug("period: %s", period)
         
         if not scope in ("global", "server", "g", "s"):
             logger.info("invalid scope")
@@ -117,56 +134,104 @@ class Score(commands.Cog):
         database_key = ""
         if scope in ("server", "s"):
             if ctx.guild is not None:
-                database_key = f"users.server:{ctx.guild.id}"
+                database_key = users_server_key(ctx.guild.id)
                 scope = "server"
             else:
-                logger.info("dm context")
+                logger.debug("dm context")
                 await ctx.send("**Server scopes are not avaliable in DMs.**\n*Showing global leaderboard instead.*")
                 scope = "global"
-                database_key = "users:global"
+                database_key = USERS_GLOBAL
         else:
-            database_key = "users:global"
+            database_key = USERS_GLOBAL
             scope = "global"
         
-        if database.zcard(database_key) is 0:
-            logger.info(f"no users in {database_key}")
-            await ctx.send("There are no users in the database.")
-            return
-        
-        if placings > database.zcard(database_key):
-            placings = database.zcard(database_key)
-        
-        leaderboard_list = database.zrevrangebyscore(database_key, "+inf", "-inf", 0, placings, True)
-        embed = discord.Embed(type="rich", colour=discord.Color.blurple())
-        embed.set_author(name=bot_name)
-        leaderboard = ""
+        scope_key = database_key
+        database_key = period_key(scope_key, period)
+        if period != "all":
+            scope = f"{scope}, {period}"
         
-        for i, stats in enumerate(leaderboard_list):
-            if ctx.guild is not None:
-                user = ctx.guild.get_member(int(stats[0]))
+        page = 0
+        message = None
+        while True:
+            embed, pages = await self._leaderboard_page(ctx, scope_key, database_key, scope, page, placings)
+            if embed is None:
+                logger.info(f"no users in {database_key}")
+                await ctx.send("There are no users in the database.")
+                return
+            
+            if message is None:
+                message = await ctx.send(embed=embed)
+                if pages == 1:
+                    return
+                try:
+                    for emoji in PAGE_EMOJIS:
+                        await message.add_reaction(emoji)
+                except discord.HTTPException:  # can't add reactions, the first page is all that can be shown
+                    logger.info("can't add leaderboard reactions")
+                    return
             else:
-                user = None
+                await message.edit(embed=embed)
             
-            if user is None:
-                user = self.bot.get_user(int(stats[0]))
-                if user is None:
-                    user = "**Deleted**"
-                else:
-                    user = f"**{user.name}#{user.discriminator}**"
+            def check(reaction, user):
+                return user == ctx.author and reaction.message.id == message.id and str(reaction.emoji) in PAGE_EMOJIS
+            
+            try:
+                reaction, user = await self.bot.wait_for("reaction_add", timeout=PAGE_TIMEOUT, check=check)
+            except asyncio.TimeoutError:
+                return
+            
+            if str(reaction.emoji) == PAGE_EMOJIS[0]:
+                page = max(page - 1, 0)
             else:
-                user = f"**{user.name}#{user.discriminator}** ({str(user.mention)})"
+                page = min(page + 1, pages - 1)
+            try:
+                await message.remove_reaction(reaction.emoji, user)
+            except discord.HTTPException:  # can't remove reactions without manage messages
+                pass
+    
+    # builds one page of a leaderboard, returns the embed and number of pages
+    # scope_key - all time leaderboard, database_key - leaderboard for the period
+    async def _leaderboard_page(self, ctx, scope_key, database_key, scope, page, placings):
+        guild_id = ctx.guild.id if ctx.guild is not None else None
+        page_id = (database_key, guild_id, page, placings)
+        cached = cached_page(scope_key, page_id)
+        if cached is not None:
+            leaderboard, total = cached
+            rank = database.zrevrank(database_key, str(ctx.author.id))
+        else:
+            total, leaderboard_list, rank = read_page(database_key, ctx.author.id, page, placings)
+            if total == 0:
+                return None, 0
             
-            leaderboard += f"{str(i+1)}. {user} - {str(int(stats[1]))}\n"
+            names = await name_cache.names(self.bot, [int(stats[0]) for stats in leaderboard_list])
+            leaderboard = ""
+            for i, stats in enumerate(leaderboard_list, start=page * placings + 1):
+                user_id = int(stats[0])
+                if user_id not in names:
+                    user = f"**User {user_id}**"
+                elif names[user_id] is None:
+                    user = "**Deleted**"
+                elif ctx.guild is not None and ctx.guild.get_member(user_id) is not None:
+                    user = f"**{names[user_id]}** (<@{user_id}>)"
+                else:
+                    user = f"**{names[user_id]}**"
+                leaderboard += f"{str(i)}. {user} - {str(int(stats[1]))}\n"
+            # a page with names that couldn't be fetched isn't kept, the next view tries them again
+            if len(names) == len(leaderboard_list):
+                cache_page(scope_key, page_id, (leaderboard, total))
         
-        embed.add_field(name=f"Leaderboard ({scope})", value=leaderboard, inline=False)
+        pages = (total - 1) // placings + 1
+        embed = discord.Embed(type="rich", colour=discord.Color.blurple())
+        embed.set_author(name=bot_name)
+        embed.add_field(name=f"Leaderboard ({scope})", value=leaderboard or "No users on this page.", inline=False)
         
-        if database.zscore(database_key, str(ctx.author.id)) is not None:
-            placement = int(database.zrevrank(database_key, str(ctx.author.id))) + 1
-            embed.add_field(name="You:", value=f"You are #{str(placement)} on the leaderboard.", inline=False)
+        if rank is not None:
+            embed.add_field(name="You:", value=f"You are #{str(rank + 1)} on the leaderboard.", inline=False)
         else:
             embed.add_field(name="You:", value="You haven't answered any correctly.")
-        
-        await ctx.send(embed=embed)
+        if pages > 1:
+            embed.set_footer(text=f"Page {page + 1}/{pages}")
+        return embed, pages
     
     # missed - returns top 1-10 missed fossils
     @commands.command(
@@ -191,8 +256,8 @@ class Score(commands.Cog):
         else:
             scope = "global"
         
-        logger.info(f"scope: {scope}")
-        logger.info(f"placings: {placings}")
+        logger.debug("scope: %s", scope)
+        logger.debug("placings: %s", placings)
         
         if not scope in ("global", "server", "me", "g", "s", "m"):
             logger.info("invalid scope")
@@ -207,18 +272,18 @@ class Score(commands.Cog):
         database_key = ""
         if scope in ("server", "s"):
             if ctx.guild is not None:
-                database_key = f"incorrect.server:{ctx.guild.id}"
+                database_key = incorrect_server_key(ctx.guild.id)
                 scope = "server"
             else:
-                logger.info("dm context")
+                logger.debug("dm context")
                 await ctx.send("**Server scopes are not avaliable in DMs.**\n*Showing global leaderboard instead.*")
                 scope = "global"
-                database_key = "incorrect:global"
+                database_key = INCORRECT_GLOBAL
         elif scope in ("me", "m"):
-            database_key = f"incorrect.user:{ctx.author.id}"
+            database_key = incorrect_user_key(ctx.author.id)
             scope = "me"
         else:
-            database_key = "incorrect:global"
+            database_key = INCORRECT_GLOBAL
             scope = "global"
         
         if database.zcard(database_key) is 0:
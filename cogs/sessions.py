@@ -14,44 +14,57 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import asyncio
 import datetime
 import time
 
-from discord.ext import commands
+from discord.ext import commands, tasks
 
-from data.data import database, logger
+from data.data import logger
 from functions import channel_setup, user_setup
+from session_store import finalize_idle_sessions, session_history, session_stats, start_session, stop_session
+
+# seconds between finalizing timed out sessions
+FINALIZE_INTERVAL = 60.0
 
 class Sessions(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.finalize.start()
     
-    async def _send_stats(self, ctx):
-        start, correct, incorrect, total = map(
-            int, database.hmget(f"session.data:{str(ctx.author.id)}", ["start", "correct", "incorrect", "total"])
-        )
-        elapsed = str(datetime.timedelta(seconds=round(time.time()) - start))
+    def cog_unload(self):
+        self.finalize.cancel()
+    
+    @tasks.loop(seconds=FINALIZE_INTERVAL)
+    async def finalize(self):
+        try:
+            await asyncio.get_event_loop().run_in_executor(None, finalize_idle_sessions)
+        except Exception:
+            logger.exception("finalizing sessions failed")
+    
+    async def _send_stats(self, ctx, stats):
+        elapsed = str(datetime.timedelta(seconds=stats["stop"] - stats["start"]))
         try:
-            accuracy = round(100 * (correct / (correct + incorrect)), 2)
+            accuracy = round(100 * (stats["correct"] / (stats["correct"] + stats["incorrect"])), 2)
         except ZeroDivisionError:
             accuracy = 0
         await ctx.send(
             f"""**Session Stats:**
 *Duration:* {elapsed}
-*# Correct:* {correct}
-*# Incorrect:* {incorrect}
-*Total Fossils:* {total}
+*# Correct:* {stats["correct"]}
+*# Incorrect:* {stats["incorrect"]}
+*Total Fossils:* {stats["total"]}
 *Accuracy:* {accuracy}%"""
         )
     
     @commands.group(
         brief="- Base session command",
         help="- Base session command\n" + "Sessions will record your activity for an amount of time and " +
-        "will give you stats on how your performance. "
+        "will give you stats on how your performance. Sessions stop after an hour without activity."
     )
     async def session(self, ctx):
         if ctx.invoked_subcommand is None:
-            await ctx.send('**Invalid subcommand passed.**\n*Valid Subcommands:* `start, view, stop`')
+            await ctx.send('**Invalid subcommand passed.**\n*Valid Subcommands:* `start, view, stop, history`')
     
     # starts session
     @session.command(help="- Starts session", aliases=["st"], usage="")
@@ -62,21 +75,11 @@ class Sessions(commands.Cog):
         await channel_setup(ctx)
         await user_setup(ctx)
         
-        if database.exists(f"session.data:{str(ctx.author.id)}"):
+        if start_session(ctx.author.id):
+            await ctx.send("**Session started. Your stats are now being tracked**")
+        else:
             logger.info("already session")
             await ctx.send("**There is already a session running.** *View stats with `f!session`*")
-            return
-        else:
-            database.hmset(
-                f"session.data:{str(ctx.author.id)}", {
-                    "start": round(time.time()),
-                    "stop": 0,
-                    "correct": 0,
-                    "incorrect": 0,
-                    "total": 0
-                }
-            )
-            await ctx.send("**Session started. Your stats are now being tracked**")
     
     # views session
     @session.command(
@@ -92,8 +95,9 @@ class Sessions(commands.Cog):
         await channel_setup(ctx)
         await user_setup(ctx)
         
-        if database.exists(f"session.data:{str(ctx.author.id)}"):
-            await self._send_stats(ctx)
+        stats = session_stats(ctx.author.id)
+        if stats is not None:
+            await self._send_stats(ctx, stats)
         else:
             await ctx.send("**There is no session running.** *You can start one with `f!session start`*")
     
@@ -106,13 +110,31 @@ class Sessions(commands.Cog):
         await channel_setup(ctx)
         await user_setup(ctx)
         
-        if database.exists(f"session.data:{str(ctx.author.id)}"):
-            database.hset(f"session.data:{str(ctx.author.id)}", "stop", round(time.time()))
-            
-            await self._send_stats(ctx)
-            database.delete(f"session.data:{str(ctx.author.id)}")
+        stats = stop_session(ctx.author.id)
+        if stats is not None:
+            await self._send_stats(ctx, stats)
         else:
             await ctx.send("**There is no session running.** *You can start one with `f!session start`*")
+    
+    # shows finished sessions
+    @session.command(help="- Shows your recent sessions", aliases=["h"], usage="")
+    @commands.cooldown(1, 3.0, type=commands.BucketType.channel)
+    async def history(self, ctx):
+        logger.info("command: session history")
+        
+        await channel_setup(ctx)
+        await user_setup(ctx)
+        
+        sessions = session_history(ctx.author.id, 10)
+        if not sessions:
+            await ctx.send("**You don't have any finished sessions.** *You can start one with `f!session start`*")
+            return
+        lines = []
+        for stats in sessions:
+            started = time.strftime("%Y-%m-%d %H:%M", time.gmtime(stats["start"]))
+            elapsed = str(datetime.timedelta(seconds=stats["stop"] - stats["start"]))
+            lines.append(f"{started} UTC - {elapsed}, {stats['correct']}/{stats['total']} correct")
+        await ctx.send("**Recent Sessions:**\n" + "\n".join(lines))
 
 def setup(bot):
     bot.add_cog(Sessions(bot))
@@ -14,10 +14,11 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-import wikipedia
 from discord.ext import commands
 from data.data import database, logger
 from functions import channel_setup, user_setup
+from keys import channel_key
+from wiki import get_wiki_url
 
 class Skip(commands.Cog):
     def __init__(self, bot):
@@ -32,12 +33,12 @@ class Skip(commands.Cog):
         await channel_setup(ctx)
         await user_setup(ctx)
         
-        current_fossil = str(database.hget(f"channel:{str(ctx.channel.id)}", "fossil"))[2:-1]
-        database.hset(f"channel:{str(ctx.channel.id)}", "fossil", "")
-        database.hset(f"channel:{str(ctx.channel.id)}", "answered", "1")
+        current_fossil = str(database.hget(channel_key(ctx.channel.id), "fossil"))[2:-1]
+        database.hset(channel_key(ctx.channel.id), "fossil", "")
+        database.hset(channel_key(ctx.channel.id), "answered", "1")
         if current_fossil != "":  # check if there is fossil
-            fossil_page = wikipedia.page(current_fossil)
-            await ctx.send(f"Ok, skipping {current_fossil.title()}\n{fossil_page.url}")  # sends wiki page
+            url = await get_wiki_url(current_fossil)
+            await ctx.send(f"Ok, skipping {current_fossil.title()}\n{url}")  # sends wiki page
         else:
             await ctx.send("You need to ask for a fossil first!")
 
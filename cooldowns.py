@@ -0,0 +1,160 @@
+# cooldowns.py | command cooldowns shared by every process through redis
+# Copyright (C) 2019  EraserBird, person_v1.32, hmmm
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import math
+import os
+import time
+
+from discord.ext import commands
+
+from data.data import database
+from keys import cooldown_key
+
+# set SHARED_COOLDOWNS=1 when more than one process runs the bot,
+# otherwise each process has its own cooldowns and a channel can use a command once in each
+SHARED_COOLDOWNS = bool(os.getenv("SHARED_COOLDOWNS"))
+
+# cooldown format = {
+#    "cooldown:command name:bucket":{"tokens", "updated"}, expires once the bucket is full again
+# }
+# Buckets are token buckets holding up to rate tokens, refilling at rate per per seconds.
+# Running a command takes a token, so @commands.cooldown(1, 5.0, ...) still means once every 5 seconds.
+
+# the bucket script for the memory database
+def _take(client, keys, args):
+    rate, per, now = int(args[0]), float(args[1]), float(args[2])
+    tokens, updated = client.hmget(keys[0], ("tokens", "updated"))
+    tokens = rate if tokens is None else min(rate, float(tokens) + max(now - float(updated), 0.0) * rate / per)
+    allowed = 0
+    if tokens >= 1:
+        tokens -= 1
+        allowed = 1
+        # lua's tostring keeps 14 significant digits
+        client.hset(keys[0], mapping={"tokens": "%.14g" % tokens, "updated": args[2]})
+        client.expire(keys[0], math.ceil(per))
+    wait = math.ceil((1 - tokens) * per / rate * 1000) if tokens < 1 else 0
+    return [allowed, wait]
+
+# takes a token from a bucket if it has one, in one atomic call
+# KEYS[1] - bucket
+# ARGV[1] - rate, ARGV[2] - per, ARGV[3] - current time
+# returns {1 if a token was taken, milliseconds until the bucket has a token again}
+TAKE_SCRIPT = database.register_script(
+    """
+local rate = tonumber(ARGV[1])
+local per = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "updated")
+local tokens = rate
+if bucket[1] then
+    tokens = math.min(rate, tonumber(bucket[1]) + math.max(now - tonumber(bucket[2]), 0) * rate / per)
+end
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+    redis.call("HMSET", KEYS[1], "tokens", tostring(tokens), "updated", ARGV[3])
+    redis.call("EXPIRE", KEYS[1], math.ceil(per))
+end
+local wait = 0
+if tokens < 1 then
+    wait = math.ceil((1 - tokens) * per / rate * 1000)
+end
+return {allowed, wait}
+""",
+    fallback=_take
+)
+
+# A bucket in redis, made by SharedCooldownMapping.
+# It has the attributes and methods of commands.Cooldown that commands use.
+class SharedBucket:
+    def __init__(self, mapping, key):
+        self.rate = mapping._cooldown.rate
+        self.per = mapping._cooldown.per
+        self.type = mapping._cooldown.type
+        self._mapping = mapping
+        self._key = key
+    
+    def get_tokens(self, current=None):
+        if self._mapping._blocked_for(self._key, time.time()):
+            return 0
+        tokens, updated = database.hmget(self._key, ("tokens", "updated"))
+        if tokens is None:
+            return self.rate
+        return int(min(self.rate, float(tokens) + max(time.time() - float(updated), 0.0) * self.rate / self.per))
+    
+    # takes a token, returns the seconds to wait if there wasn't one
+    # current is the message's discord timestamp, the buckets use this machine's clock like the other processes
+    def update_rate_limit(self, current=None):
+        now = time.time()
+        retry_after = self._mapping._blocked_for(self._key, now)
+        if retry_after:
+            return retry_after
+        allowed, wait = TAKE_SCRIPT(keys=[self._key], args=[self.rate, self.per, repr(now)])
+        if wait:
+            self._mapping._blocked[self._key] = now + wait / 1000
+        return None if allowed else wait / 1000
+    
+    def reset(self):
+        self._mapping._blocked.pop(self._key, None)
+        database.delete(self._key)
+
+# The cooldowns of a command, kept in redis so they hold across processes.
+# Buckets only ever lose tokens to other processes, so while this process knows a bucket is empty
+# it turns commands away without asking redis. Otherwise a command costs one script call.
+# DMs keep the per-process buckets, the dm_cooldown check lifts their cooldowns anyway.
+class SharedCooldownMapping(commands.CooldownMapping):
+    def __init__(self, name, original):
+        super().__init__(original._cooldown)
+        self._cache = original._cache
+        self.name = name
+        # redis key: time the bucket has a token again
+        self._blocked = {}
+    
+    def copy(self):
+        return SharedCooldownMapping(self.name, self)
+    
+    def _blocked_for(self, key, now):
+        until = self._blocked.get(key)
+        if until is None:
+            return None
+        if until <= now:
+            del self._blocked[key]
+            return None
+        return until - now
+    
+    def _prune(self, now):
+        for key in [key for key, until in self._blocked.items() if until <= now]:
+            del self._blocked[key]
+    
+    def get_bucket(self, message, current=None):
+        if message.guild is None:
+            return super().get_bucket(message, current)
+        if self._cooldown.type is commands.BucketType.default:
+            key = "global"
+        else:
+            key = self._bucket_key(message)
+            if isinstance(key, tuple):
+                key = ":".join(map(str, key))
+        self._prune(time.time())
+        return SharedBucket(self, cooldown_key(self.name, key))
+
+# moves the cooldowns of every command of bot to redis, call it after the extensions are loaded
+def share_cooldowns(bot):
+    for command in bot.walk_commands():
+        # aliases come up more than once
+        if command._buckets.valid and not isinstance(command._buckets, SharedCooldownMapping):
+            command._buckets = SharedCooldownMapping(command.qualified_name, command._buckets)
@@ -14,17 +14,84 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import atexit
 import logging
 import logging.handlers
 import os
+import queue
 import string
 import sys
+import time
 
 import redis
 from discord.ext import commands
 
+from keys import CLUSTER_MODE
+from matching import FuzzyIndex
+from memory_database import MemoryDatabase
+
+# DATABASE_BACKEND is "redis" (the default, at REDIS_URL) or "memory", an in-process database for tests and benchmarks
+DATABASE_BACKEND = os.getenv("DATABASE_BACKEND") or "redis"
+
+def connect(backend=DATABASE_BACKEND):
+    if backend == "memory":
+        return MemoryDatabase()
+    if backend != "redis":
+        raise ValueError(f"unknown database backend: {backend}")
+    if CLUSTER_MODE:
+        return redis.RedisCluster.from_url(os.getenv("REDIS_URL"))
+    return redis.from_url(os.getenv("REDIS_URL"))
+
+# the database client, connected on first use so modules can be imported without a database
+class Database:
+    def __init__(self):
+        self._client = None
+    
+    def client(self):
+        if self._client is None:
+            self._client = connect()
+        return self._client
+    
+    # switches to another client, like a memory database in a benchmark
+    def use(self, client):
+        self._client = client
+    
+    # scripts need a Python fallback doing the same thing for the memory database, add it to benchmarks/scripts.py
+    # it is required here, so a missing one fails at import instead of in a command on the memory database
+    def register_script(self, script, *, fallback):
+        if not callable(fallback):
+            raise ValueError("scripts need a Python fallback for the memory database")
+        return Script(self, script, fallback)
+    
+    def __getattr__(self, name):
+        return getattr(self.client(), name)
+
+# a script registered with whichever client the database has when it is first called
+class Script:
+    def __init__(self, database, script, fallback):
+        self.database = database
+        self.script = script
+        self.fallback = fallback
+        self._client = None
+        self._registered = None
+    
+    def __call__(self, keys=[], args=[], client=None):
+        current = self.database.client()
+        if current is not self._client:
+            if isinstance(current, MemoryDatabase):
+                self._registered = current.register_script(self.script, self.fallback)
+            else:
+                self._registered = current.register_script(self.script)
+            self._client = current
+        return self._registered(keys=keys, args=args, client=client)
+
 # define database for one connection
-database = redis.from_url(os.getenv("REDIS_URL"))
+database = Database()
+
+# client to run a script with that is part of pipe
+# cluster pipelines can't run scripts, so in cluster mode they are sent right away instead
+def script_client(pipe):
+    return None if CLUSTER_MODE else pipe
 
 # Database Format Definitions
 
@@ -33,13 +100,21 @@ database = redis.from_url(os.getenv("REDIS_URL"))
 # prevS - makes sure it sends a diff fossil (sounds)
 # prevK - makes sure it sends a diff sound
 
+# key names are built in keys.py, the names here are without cluster hash tags
+
 # server format = {
-# channel:channel_id : { "fossil", "answered","prevJ", "prevB"}
+# channel:channel_id : { "fossil", "answered","prevJ", "prevB", "cursor", "sent", "batch", "batch_sent"}
 # }
+# "batch" is the channel's unanswered batch of fossils, separated by newlines
+# "sent" and "batch_sent" are when the fossil and batch were sent (unix time)
+
+# deck format:
+# deck:channel_id : shuffled fossils_list indices, 2 bytes each (big endian)
+# "cursor" in channel data is the position of the next fossil in the deck
 
 # session format:
-# session.data:user_id : {"start": 0, "stop": 0,
-#                         "correct": 0, "incorrect": 0, "total": 0}
+# session.data:user_id : {"start": 0, "correct": 0, "incorrect": 0, "total": 0}
+# sessions time out when idle, see session_store.py
 
 # leaderboard format = {
 #    "users:global":[user id, # of correct]
@@ -57,9 +132,59 @@ database = redis.from_url(os.getenv("REDIS_URL"))
 # }
 
 # setup logging
+# LOG_LEVEL is the level for all modules (INFO by default),
+# LOG_LEVELS overrides it for some, by file name without .py - "functions=DEBUG,check=WARNING"
+# levels are names or numbers, settings that aren't are skipped with a warning
+DEFAULT_LOG_LEVEL = "INFO"
+
+# level settings that couldn't be read, logged once the logger is set up
+log_level_errors = []
+
+# a level name like "debug" or a number like "10", or None if it isn't one
+def _parse_level(level):
+    level = level.strip().upper()
+    if level.isdigit():
+        return int(level)
+    value = logging.getLevelName(level)
+    return value if isinstance(value, int) else None
+
+def _log_level(level):
+    parsed = _parse_level(level)
+    if parsed is None:
+        log_level_errors.append(f"LOG_LEVEL={level!r} isn't a level, using {DEFAULT_LOG_LEVEL}")
+        return logging.getLevelName(DEFAULT_LOG_LEVEL)
+    return parsed
+
+def _log_levels(levels):
+    parsed = {}
+    for item in filter(None, (part.strip() for part in levels.split(","))):
+        module, _, level = item.partition("=")
+        value = _parse_level(level)
+        if not module.strip() or value is None:
+            log_level_errors.append(f"skipped {item!r} in LOG_LEVELS, use module=LEVEL")
+            continue
+        parsed[module.strip()] = value
+    return parsed
+
+# drops records below the level of the module that logged them
+class ModuleLevelFilter(logging.Filter):
+    def __init__(self, default, levels):
+        super().__init__()
+        self.default = default
+        self.levels = levels
+    
+    def filter(self, record):
+        return record.levelno >= self.levels.get(record.module, self.default)
+
+log_level = _log_level(os.getenv("LOG_LEVEL") or DEFAULT_LOG_LEVEL)
+module_log_levels = _log_levels(os.getenv("LOG_LEVELS") or "")
+
 logger = logging.getLogger("fossils-id")
-logger.setLevel(logging.DEBUG)
+# the logger lets through the lowest level any module wants, so disabled messages are dropped before a record is made
+logger.setLevel(min([log_level] + list(module_log_levels.values())))
 logger.propagate = False
+if module_log_levels:
+    logger.addFilter(ModuleLevelFilter(log_level, module_log_levels))
 os.makedirs("logs", exist_ok=True)
 
 file_handler = logging.handlers.TimedRotatingFileHandler("logs/log.txt", backupCount=4, when="midnight")
@@ -70,8 +195,31 @@ stream_handler.setLevel(logging.DEBUG)
 file_handler.setFormatter(logging.Formatter("{asctime} - {filename:10} -  {levelname:8} - {message}", style="{"))
 stream_handler.setFormatter(logging.Formatter("{filename:10} -  {levelname:8} - {message}", style="{"))
 
-logger.addHandler(file_handler)
-logger.addHandler(stream_handler)
+# seconds between writes of queued records
+LOG_FLUSH_INTERVAL = 0.2
+
+# Writes queued records from a background thread, so the event loop never waits on the file or stdout.
+# The thread looks at the queue every LOG_FLUSH_INTERVAL instead of waiting on it,
+# waking up for every record would take the GIL from the event loop each time something is logged.
+class BatchedQueueListener(logging.handlers.QueueListener):
+    def dequeue(self, block):
+        while True:
+            try:
+                return self.queue.get_nowait()
+            except queue.Empty:
+                if not block:
+                    raise
+                time.sleep(LOG_FLUSH_INTERVAL)
+
+log_queue = queue.SimpleQueue()
+log_listener = BatchedQueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+logger.addHandler(logging.handlers.QueueHandler(log_queue))
+log_listener.start()
+# writes out what is left in the queue at exit
+atexit.register(log_listener.stop)
+for error in log_level_errors:
+    logger.warning(error)
+
 # log uncaught exceptions
 
 def handle_exception(exc_type, exc_value, exc_traceback):
@@ -102,3 +250,4 @@ def _fossils_list():
         return [string.capwords(line.strip()) for line in f]
 
 fossils_list = _fossils_list()
+fossils_index = FuzzyIndex(fossils_list)
@@ -7,10 +7,12 @@ import logging
 import os
 from concurrent.futures import ProcessPoolExecutor
 
-import aiofiles
 import aiohttp
-import magic
-from bs4 import BeautifulSoup, SoupStrainer
+
+from tracing import span
+
+# aiofiles, magic, bs4 and lxml are imported where they are used,
+# they are only needed when images are downloaded and bs4 with lxml takes a while to import
 
 GOOGLE_URL = "https://www.google.com/search?q={}&source=lnms&tbm=isch"
 GOOGLE_HEADERS = {
@@ -56,6 +58,8 @@ async def get_idigbio_urls(keyword, limit=15, session=None, executor=None, logge
             return itertools.islice(urls, limit)
 
 def _parse_image_html(text, limit=15):
+    from bs4 import BeautifulSoup, SoupStrainer
+    
     only_image_info = SoupStrainer("div")
     soup = BeautifulSoup(text, "lxml", parse_only=only_image_info)
     return tuple(json.loads(str(info.string))["ou"] for info in soup.find_all(class_="rg_meta", limit=limit))
@@ -83,27 +87,35 @@ async def get_google_urls(keyword, limit=15, session=None, executor=None, logger
 async def _download_helper(path, url, session, logger=None):
     if logger is None:
         logger = logging
-    logger.info("downloading image at " + url)
+    logger.debug("downloading image at %s", url)
     try:
-        async with session.get(url) as response:
-            # from https://stackoverflow.com/questions/38358521/alternative-of-urllib-urlretrieve-in-python-3-5
-            async with aiofiles.open(path, 'wb') as out_file:
-                block_size = 1024 * 8
-                while True:
-                    block = await response.content.read(block_size)  # pylint: disable=no-member
-                    if not block:
-                        break
-                    await out_file.write(block)
-            ext = magic.from_file(path, mime=True).partition("/")[2]
-            if ext not in VALID_IMAGE_EXTENSIONS:
-                logger.error(f"Invalid Extension {ext} for {url}")
-                return
-            new_path = f"{path}.{ext}"
-            os.rename(path, new_path)
-            return new_path
+        with span("download_image", url=url):
+            return await _download(path, url, session, logger)
     except aiohttp.client_exceptions.ClientConnectionError as e:
         logger.exception(e)
 
+async def _download(path, url, session, logger):
+    import aiofiles
+    import magic
+    
+    async with session.get(url) as response:
+        # from https://stackoverflow.com/questions/38358521/alternative-of-urllib-urlretrieve-in-python-3-5
+        async with aiofiles.open(path, 'wb') as out_file:
+            block_size = 1024 * 8
+            while True:
+                block = await response.content.read(block_size)  # pylint: disable=no-member
+                if not block:
+                    break
+                await out_file.write(block)
+    with span("magic"):
+        ext = magic.from_file(path, mime=True).partition("/")[2]
+    if ext not in VALID_IMAGE_EXTENSIONS:
+        logger.error(f"Invalid Extension {ext} for {url}")
+        return
+    new_path = f"{path}.{ext}"
+    os.rename(path, new_path)
+    return new_path
+
 async def download_images(directory, keyword, limit=5, session=None, executor=None, logger=None, use_google_images=True):
     if use_google_images:
         get_urls = get_google_urls
@@ -119,7 +131,8 @@ async def download_images(directory, keyword, limit=5, session=None, executor=No
             session = await stack.enter_async_context(aiohttp.ClientSession())
         if executor is None:
             executor = stack.enter_context(ProcessPoolExecutor(max_workers=1))
-        urls = await get_urls(keyword, limit, session, executor)
+        with span("image_urls"):
+            urls = await get_urls(keyword, limit, session, executor)
         paths = (_download_helper(f"{directory}/{i}", url, session, logger) for i, url in enumerate(urls))
         return await asyncio.gather(*(path for path in paths if path is not None))
 
@@ -15,18 +15,33 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import asyncio
+import collections
 import contextlib
-import difflib
+import io
 import os
-import string
 import pickle
+import random
+import string
 from concurrent.futures import ProcessPoolExecutor
 
 import aiohttp
 import discord
 
-from data.data import GenericError, database, fossils_list, logger
-from download_images import download_images
+from data.data import GenericError, database, fossils_list, logger, script_client
+from image_cache import image_cache
+from keys import (
+    CLUSTER_MODE, INCORRECT_GLOBAL, SCORE_GLOBAL, USERS_GLOBAL, channel_key, deck_key, incorrect_server_key, incorrect_user_key,
+    users_server_key
+)
+from leaderboards import bucket_increment, invalidate_pages
+from matching import answer_variants, normalize, within_distance
+from metrics import record_download_failure, record_downloads
+from practice import record_miss
+from session_store import increment_session
+from tracing import span
+
+# seconds to wait for an image before sending a "Fetching" message
+FETCHING_THRESHOLD = 1.5
 
 # Valid file types
 valid_image_extensions = {"jpg", "png", "jpeg", "gif"}
@@ -34,103 +49,188 @@ valid_audio_extensions = {"mp3"}
 
 # sets up new channel
 async def channel_setup(ctx):
-    logger.info("checking channel setup")
-    if database.exists(f"channel:{str(ctx.channel.id)}"):
-        logger.info("channel data ok")
+    logger.debug("checking channel setup")
+    if database.exists(channel_key(ctx.channel.id)):
+        logger.debug("channel data ok")
     else:
-        database.hmset(f"channel:{str(ctx.channel.id)}", {"fossil": "", "answered": 1, "prevJ": 20, "prevB": ""})
+        database.hmset(channel_key(ctx.channel.id), {"fossil": "", "answered": 1, "prevJ": 20, "prevB": ""})
         # true = 1, false = 0, index 0 is last arg, prevJ is 20 to define as integer
-        logger.info("channel data added")
+        logger.debug("channel data added")
         await ctx.send("Ok, setup! I'm all ready to use!")
     
-    if database.zscore("score:global", str(ctx.channel.id)) is not None:
-        logger.info("channel score ok")
+    if database.zscore(SCORE_GLOBAL, str(ctx.channel.id)) is not None:
+        logger.debug("channel score ok")
     else:
-        database.zadd("score:global", {str(ctx.channel.id): 0})
-        logger.info("channel score added")
+        database.zadd(SCORE_GLOBAL, {str(ctx.channel.id): 0})
+        logger.debug("channel score added")
 
 # sets up new user
 async def user_setup(ctx):
-    logger.info("checking user data")
-    if database.zscore("users:global", str(ctx.author.id)) is not None:
-        logger.info("user global ok")
+    logger.debug("checking user data")
+    if database.zscore(USERS_GLOBAL, str(ctx.author.id)) is not None:
+        logger.debug("user global ok")
     else:
-        database.zadd("users:global", {str(ctx.author.id): 0})
-        logger.info("user global added")
+        database.zadd(USERS_GLOBAL, {str(ctx.author.id): 0})
+        logger.debug("user global added")
         await ctx.send("Welcome <@" + str(ctx.author.id) + ">!")
     
     if ctx.guild is not None:
-        logger.info("no dm")
-        if database.zscore(f"users.server:{ctx.guild.id}", str(ctx.author.id)) is not None:
-            server_score = database.zscore(f"users.server:{ctx.guild.id}", str(ctx.author.id))
-            global_score = database.zscore("users:global", str(ctx.author.id))
+        logger.debug("no dm")
+        if database.zscore(users_server_key(ctx.guild.id), str(ctx.author.id)) is not None:
+            server_score = database.zscore(users_server_key(ctx.guild.id), str(ctx.author.id))
+            global_score = database.zscore(USERS_GLOBAL, str(ctx.author.id))
             if server_score is global_score:
-                logger.info("user server ok")
+                logger.debug("user server ok")
             else:
-                database.zadd(f"users.server:{ctx.guild.id}", {str(ctx.author.id): global_score})
+                database.zadd(users_server_key(ctx.guild.id), {str(ctx.author.id): global_score})
         else:
-            score = int(database.zscore("users:global", str(ctx.author.id)))
-            database.zadd(f"users.server:{ctx.guild.id}", {str(ctx.author.id): score})
-            logger.info("user server added")
+            score = int(database.zscore(USERS_GLOBAL, str(ctx.author.id)))
+            database.zadd(users_server_key(ctx.guild.id), {str(ctx.author.id): score})
+            logger.debug("user server added")
     else:
-        logger.info("dm context")
+        logger.debug("dm context")
 
 # sets up new fossils
 async def fossil_setup(ctx, fossil):
-    logger.info("checking fossil data")
-    if database.zscore("incorrect:global", string.capwords(str(fossil))) is not None:
-        logger.info("fossil global ok")
+    logger.debug("checking fossil data")
+    if database.zscore(INCORRECT_GLOBAL, string.capwords(str(fossil))) is not None:
+        logger.debug("fossil global ok")
     else:
-        database.zadd("incorrect:global", {string.capwords(str(fossil)): 0})
-        logger.info("fossil global added")
+        database.zadd(INCORRECT_GLOBAL, {string.capwords(str(fossil)): 0})
+        logger.debug("fossil global added")
     
-    if database.zscore(f"incorrect.user:{ctx.author.id}", string.capwords(str(fossil))) is not None:
-        logger.info("fossil user ok")
+    if database.zscore(incorrect_user_key(ctx.author.id), string.capwords(str(fossil))) is not None:
+        logger.debug("fossil user ok")
     else:
-        database.zadd(f"incorrect.user:{ctx.author.id}", {string.capwords(str(fossil)): 0})
-        logger.info("fossil user added")
+        database.zadd(incorrect_user_key(ctx.author.id), {string.capwords(str(fossil)): 0})
+        logger.debug("fossil user added")
     
     if ctx.guild is not None:
-        logger.info("no dm")
-        if database.zscore(f"incorrect.server:{ctx.guild.id}", string.capwords(str(fossil))) is not None:
-            logger.info("fossil server ok")
+        logger.debug("no dm")
+        if database.zscore(incorrect_server_key(ctx.guild.id), string.capwords(str(fossil))) is not None:
+            logger.debug("fossil server ok")
         else:
-            database.zadd(f"incorrect.server:{ctx.guild.id}", {string.capwords(str(fossil)): 0})
-            logger.info("fossil server added")
+            database.zadd(incorrect_server_key(ctx.guild.id), {string.capwords(str(fossil)): 0})
+            logger.debug("fossil server added")
     else:
-        logger.info("dm context")
+        logger.debug("dm context")
+
+# the deck draw script for the memory database
+def _deck_draw(client, keys, args):
+    size = int(args[0])
+    cursor = size
+    if len(client.get(keys[0]) or b"") == size * 2:
+        cursor = client.hincrby(keys[1], "cursor", 1) - 1
+    if cursor < size:
+        return client.get(keys[0])[cursor * 2:cursor * 2 + 2]
+    if len(args) < 2:
+        return None
+    client.set(keys[0], args[1])
+    client.hset(keys[1], "cursor", 1)
+    return args[1][:2]
+
+# draws the next fossil from a channel's deck in one atomic call
+# KEYS[1] - deck (shuffled fossil indices, 2 bytes each), KEYS[2] - channel data
+# ARGV[1] - number of fossils, ARGV[2] - a new deck, optional
+# When the deck is used up or out of date, the new deck replaces it and its first fossil is drawn,
+# without one it returns nil. A deck another command shuffled in the meantime is drawn from instead.
+DECK_DRAW_SCRIPT = database.register_script(
+    """
+local size = tonumber(ARGV[1])
+local cursor = size
+if redis.call("STRLEN", KEYS[1]) == size * 2 then
+    cursor = redis.call("HINCRBY", KEYS[2], "cursor", 1) - 1
+end
+if cursor < size then
+    return redis.call("GETRANGE", KEYS[1], cursor * 2, cursor * 2 + 1)
+end
+if not ARGV[2] then
+    return false
+end
+redis.call("SET", KEYS[1], ARGV[2])
+redis.call("HSET", KEYS[2], "cursor", 1)
+return string.sub(ARGV[2], 1, 2)
+""",
+    fallback=_deck_draw
+)
+
+# Gets a new fossil for the channel, no repeats until every fossil has been seen
+def draw_fossil(ctx):
+    keys = [deck_key(ctx.channel.id), channel_key(ctx.channel.id)]
+    drawn = DECK_DRAW_SCRIPT(keys=keys, args=[len(fossils_list)])
+    if drawn is None:
+        logger.info("shuffling new deck")
+        order = list(range(len(fossils_list)))
+        random.shuffle(order)
+        # don't repeat the last fossil of the old deck
+        prevB = str(database.hget(keys[1], "prevB"))[2:-1]
+        if len(order) > 1 and fossils_list[order[0]] == prevB:
+            order[0], order[-1] = order[-1], order[0]
+        new_deck = b"".join(index.to_bytes(2, "big") for index in order)
+        # only replaces the deck if no other command shuffled one since the draw above
+        drawn = DECK_DRAW_SCRIPT(keys=keys, args=[len(fossils_list), new_deck])
+    return fossils_list[int.from_bytes(drawn, "big")]
+
+# Gets amount different fossils for the channel, pipelining the deck draws
+def draw_fossils(ctx, amount):
+    keys = [deck_key(ctx.channel.id), channel_key(ctx.channel.id)]
+    pipe = database.pipeline(transaction=False)
+    indices = [DECK_DRAW_SCRIPT(keys=keys, args=[len(fossils_list)], client=script_client(pipe)) for _ in range(amount)]
+    if not CLUSTER_MODE:
+        indices = pipe.execute()
+    drawn = [fossils_list[int.from_bytes(index, "big")] for index in indices if index is not None]
+    fossils = list(dict.fromkeys(drawn))
+    # the deck ran out, or a new deck repeated a fossil
+    while len(fossils) < min(amount, len(fossils_list)):
+        fossil = draw_fossil(ctx)
+        if fossil not in fossils:
+            fossils.append(fossil)
+    return fossils
 
 # Function to run on error
 def error_skip(ctx):
-    logger.info("ok")
-    database.hset(f"channel:{str(ctx.channel.id)}", "fossil", "")
-    database.hset(f"channel:{str(ctx.channel.id)}", "answered", "1")
+    logger.debug("ok")
+    database.hset(channel_key(ctx.channel.id), "fossil", "")
+    database.hset(channel_key(ctx.channel.id), "answered", "1")
 
-def session_increment(ctx, item, amount):
-    logger.info(f"incrementing {item} by {amount}")
-    value = int(database.hget(f"session.data:{ctx.author.id}", item))
-    value += int(amount)
-    database.hset(f"session.data:{ctx.author.id}", item, str(value))
+# does nothing if the user doesn't have a session running
+# pipe - pipeline to add the write to, otherwise it is sent right away
+def session_increment(ctx, item, amount, pipe=None):
+    logger.debug("incrementing %s by %s", item, amount)
+    increment_session(ctx.author.id, item, amount, pipe)
 
-def incorrect_increment(ctx, fossil, amount):
-    logger.info(f"incrementing incorrect {fossil} by {amount}")
-    database.zincrby("incorrect:global", amount, str(fossil))
-    database.zincrby(f"incorrect.user:{ctx.author.id}", amount, str(fossil))
+# pipe - pipeline to add the writes to, otherwise they are sent right away
+def incorrect_increment(ctx, fossil, amount, pipe=None):
+    logger.debug("incrementing incorrect %s by %s", fossil, amount)
+    writes = database.pipeline(transaction=False) if pipe is None else pipe
+    writes.zincrby(INCORRECT_GLOBAL, amount, str(fossil))
+    writes.zincrby(incorrect_user_key(ctx.author.id), amount, str(fossil))
+    record_miss(incorrect_user_key(ctx.author.id), str(fossil), amount)
     if ctx.guild is not None:
-        logger.info("no dm")
-        database.zincrby(f"incorrect.server:{ctx.guild.id}", amount, str(fossil))
+        logger.debug("no dm")
+        writes.zincrby(incorrect_server_key(ctx.guild.id), amount, str(fossil))
+        record_miss(incorrect_server_key(ctx.guild.id), str(fossil), amount)
     else:
-        logger.info("dm context")
+        logger.debug("dm context")
+    if pipe is None:
+        writes.execute()
 
-def score_increment(ctx, amount):
-    logger.info(f"incrementing score by {amount}")
-    database.zincrby("score:global", amount, str(ctx.channel.id))
-    database.zincrby("users:global", amount, str(ctx.author.id))
+def score_increment(ctx, amount, pipe=None):
+    logger.debug("incrementing score by %s", amount)
+    writes = database.pipeline(transaction=False) if pipe is None else pipe
+    writes.zincrby(SCORE_GLOBAL, amount, str(ctx.channel.id))
+    writes.zincrby(USERS_GLOBAL, amount, str(ctx.author.id))
+    bucket_increment(writes, USERS_GLOBAL, amount, str(ctx.author.id))
+    invalidate_pages(USERS_GLOBAL)
     if ctx.guild is not None:
-        logger.info("no dm")
-        database.zincrby(f"users.server:{ctx.guild.id}", amount, str(ctx.author.id))
+        logger.debug("no dm")
+        writes.zincrby(users_server_key(ctx.guild.id), amount, str(ctx.author.id))
+        bucket_increment(writes, users_server_key(ctx.guild.id), amount, str(ctx.author.id))
+        invalidate_pages(users_server_key(ctx.guild.id))
     else:
-        logger.info("dm context")
+        logger.debug("dm context")
+    if pipe is None:
+        writes.execute()
 
 def owner_check(ctx):
     owners = set(str(os.getenv("ids")).split(","))
@@ -140,7 +240,7 @@ def owner_check(ctx):
 # ctx - context for message (discord thing)
 # fossil - fossil picture to send (str)
 # on_error - function to run when an error occurs (function)
-# message - text message to send before fossil picture (str)
+# message - text message to send with the fossil picture (str)
 async def send_fossil(ctx, fossil, on_error=None, message=None):
     if fossil == "":
         logger.error("error - fossil is blank")
@@ -149,62 +249,69 @@ async def send_fossil(ctx, fossil, on_error=None, message=None):
             on_error(ctx)
         return
     
-    delete = await ctx.send("**Fetching.** This may take a while.")
-    # trigger "typing" discord message
-    await ctx.trigger_typing()
+    # only show a progress message if the image isn't ready quickly
+    fetch = asyncio.ensure_future(load_image(ctx, fossil))
+    done, _ = await asyncio.wait({fetch}, timeout=FETCHING_THRESHOLD)
+    delete = None
+    if not done:
+        delete = await ctx.send("**Fetching.** This may take a while.")
     
     try:
-        response = await get_image(ctx, fossil)
+        image, extension = await fetch
     except GenericError as e:
         logger.exception(e)
-        await delete.delete()
+        if delete is not None:
+            await delete.delete()
         await ctx.send(f"**An error has occurred while fetching images.**\n*Please try again.*\n**Reason:** {str(e)}")
         if on_error is not None:
             on_error(ctx)
         return
     
-    filename = str(response[0])
-    extension = str(response[1])
-    statInfo = os.stat(filename)
-    if statInfo.st_size > 8000000:  # another filesize check
-        await delete.delete()
+    if len(image) > 8000000:  # another filesize check
         await ctx.send("**Oops! File too large :(**\n*Please try again.*")
     else:
-        if message is not None:
-            await ctx.send(message)
-        
         # change filename to avoid spoilers
-        file_obj = discord.File(filename, filename=f"fossil.{extension}")
-        await ctx.send(file=file_obj)
+        file_obj = discord.File(io.BytesIO(image), filename=f"fossil.{extension}")
+        with span("upload", bytes=len(image)):
+            await ctx.send(message, file=file_obj)
+    if delete is not None:
         await delete.delete()
 
+# Gets the bytes and extension of an image of fossil
+async def load_image(ctx, fossil):
+    with span("get_image"):
+        filename, extension = await get_image(ctx, fossil)
+    with span("image_cache"):
+        image = await image_cache.get(str(filename))
+    return image, str(extension)
+
 # Function that gets fossil images to run in pool (blocking prevention)
 # Chooses one image to send
 async def get_image(ctx, fossil):
     # fetch scientific names of fossils
     images = await get_files(fossil, "images")
-    logger.info("images: " + str(images))
-    prevJ = int(str(database.hget(f"channel:{str(ctx.channel.id)}", "prevJ"))[2:-1])
+    logger.debug("images: %s", images)
+    prevJ = int(str(database.hget(channel_key(ctx.channel.id), "prevJ"))[2:-1])
     # Randomize start (choose beginning 4/5ths in case it fails checks)
     if images:
         j = (prevJ + 1) % len(images)
-        logger.debug("prevJ: " + str(prevJ))
-        logger.debug("j: " + str(j))
+        logger.debug("prevJ: %s", prevJ)
+        logger.debug("j: %s", j)
         
         for x in range(j, len(images)):  # check file type and size
             image_link = images[x]
             extension = image_link.split('.')[-1]
-            logger.debug("extension: " + str(extension))
+            logger.debug("extension: %s", extension)
             statInfo = os.stat(image_link)
-            logger.debug("size: " + str(statInfo.st_size))
+            logger.debug("size: %s", statInfo.st_size)
             if extension.lower() in valid_image_extensions and statInfo.st_size < 8000000:  # 8mb discord limit
-                logger.info("found one!")
+                logger.debug("found one!")
                 break
             elif x == len(images) - 1:
                 j = (j + 1) % (len(images))
                 raise GenericError("No Valid Images Found", code=999)
         
-        database.hset(f"channel:{str(ctx.channel.id)}", "prevJ", str(j))
+        database.hset(channel_key(ctx.channel.id), "prevJ", str(j))
     else:
         raise GenericError("No Images Found", code=100)
     
@@ -214,20 +321,25 @@ async def get_image(ctx, fossil):
 async def get_files(fossil, media_type):
     directory = f"cache/{media_type}/{fossil}/"
     try:
-        logger.info("trying")
-        files_dir = os.listdir(directory)
-        logger.info(directory)
+        logger.debug("trying")
+        with span("listdir"):
+            files_dir = os.listdir(directory)
+        logger.debug(directory)
         if not files_dir:
             raise GenericError("No Files", code=100)
         return [f"{directory}{path}" for path in files_dir]
     except (FileNotFoundError, GenericError):
-        logger.info("fetching files")
+        logger.debug("fetching files")
         # if not found, fetch images
-        logger.info("fossil: " + str(fossil))
-        paths = await fetch_images(fossil)
+        logger.info("fossil: %s", fossil)
+        with span("fetch_images", fossil=fossil):
+            paths = await fetch_images(fossil)
         return paths
 
 async def fetch_images(name, session=None, executor=None):
+    # the scraper is only needed on cache misses, so it isn't imported with the bot
+    from download_images import download_images
+    
     async with contextlib.AsyncExitStack() as stack:
         if session is None:
             session = await stack.enter_async_context(aiohttp.ClientSession())
@@ -236,7 +348,13 @@ async def fetch_images(name, session=None, executor=None):
         directory = f"cache/images"
         if name.lower() == "acer":
             name = "acer fossil"
-        return await download_images(directory, name, session=session, executor=executor, logger=logger)
+        try:
+            paths = await download_images(directory, name, session=session, executor=executor, logger=logger)
+        except Exception:
+            record_download_failure()
+            raise
+        record_downloads(paths)
+        return paths
 
 async def precache():
     logger.info("Starting caching")
@@ -250,7 +368,7 @@ def cleanup(str_):
 def backup_all():
     logger.info("Starting Backup")
     logger.info("Creating Dump")
-    keys = list(map(cleanup, database.keys()))
+    keys = list(map(cleanup, database.scan_iter(count=1000)))
     dump = []
     for key in keys:
         dump.append(database.dump(key))
@@ -271,10 +389,18 @@ def backup_all():
 # spellcheck - allows one letter off/extra
 # cutoff - allows for difference of that amount
 def spellcheck(worda, wordb, cutoff=3):
-    worda = worda.lower().replace("-", " ").replace("'", "")
-    wordb = wordb.lower().replace("-", " ").replace("'", "")
-    shorterword = min(worda, wordb, key=len)
-    if worda != wordb:
-        if len(list(difflib.Differ().compare(worda, wordb))) - len(shorterword) >= cutoff:
-            return False
-    return True
+    return within_distance(normalize(worda), normalize(wordb), cutoff)
+
+# genera with only one fossil on the list, the genus alone is a fine answer for these
+_genus_counts = collections.Counter(normalize(fossil).split(" ")[0] for fossil in fossils_list)
+
+# checks a guess against the answer
+# variants - also accept the full name and other forms of genus/species names
+def check_answer(guess, answer, cutoff=3, variants=True):
+    if spellcheck(guess.split(" ")[-1], answer.split(" ")[-1], cutoff):
+        return True
+    if not variants:
+        return False
+    unique_genus = _genus_counts[normalize(answer).split(" ")[0]] == 1
+    guess = normalize(guess)
+    return any(within_distance(guess, variant, cutoff) for variant in answer_variants(answer, genus=unique_genus))
@@ -0,0 +1,80 @@
+# image_cache.py | in-memory cache of image files for uploads
+# Copyright (C) 2019  EraserBird, person_v1.32, hmmm
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import collections
+import os
+
+# default budget is 50 MB, set IMAGE_CACHE_BYTES to change
+DEFAULT_MAX_BYTES = 50000000
+
+def _read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+# least recently used cache of file contents, limited by total size
+# files are read in the default executor so the event loop never waits on disk
+class ImageCache:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._files = collections.OrderedDict()
+    
+    async def get(self, path):
+        try:
+            data = self._files[path]
+        except KeyError:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._files.move_to_end(path)
+            return data
+        
+        loop = asyncio.get_event_loop()
+        data = await loop.run_in_executor(None, _read_file, path)
+        self.put(path, data)
+        return data
+    
+    def put(self, path, data):
+        if len(data) > self.max_bytes:
+            return
+        if path in self._files:
+            self.size -= len(self._files.pop(path))
+        self._files[path] = data
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, evicted = self._files.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+    
+    def clear(self):
+        self._files.clear()
+        self.size = 0
+    
+    def stats(self):
+        return {
+            "files": len(self._files),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+image_cache = ImageCache(int(os.getenv("IMAGE_CACHE_BYTES") or DEFAULT_MAX_BYTES))
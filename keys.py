@@ -0,0 +1,141 @@
+# keys.py | names of database keys, and a tool to rename them for a cluster
+# Copyright (C) 2019  EraserBird, person_v1.32, hmmm
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import re
+import sys
+
+# set REDIS_CLUSTER=1 to use a Redis Cluster at REDIS_URL
+CLUSTER_MODE = bool(os.getenv("REDIS_CLUSTER"))
+
+# In a cluster, a key is stored on the slot of the part between the first { and }.
+# Keys a command uses together share that part, so scripts and pipelines touching them stay on one node:
+#    channel keys are tagged with the channel id - "channel:{channel_id}", "deck:{channel_id}"
+#    user keys with the user id - "incorrect.user:{user_id}", "review:{user_id}", ...
+#    server keys with the server id - "users.server:{server_id}", "incorrect.server:{server_id}", ...
+#    "{users:global}" with its leaderboard buckets - "{users:global}:day:YYYY-MM-DD", ...
+# Outside cluster mode the names are the same without the braces.
+
+def _tag(part):
+    return f"{{{part}}}" if CLUSTER_MODE else str(part)
+
+def channel_key(channel_id):
+    return f"channel:{_tag(channel_id)}"
+
+def deck_key(channel_id):
+    return f"deck:{_tag(channel_id)}"
+
+def incorrect_user_key(user_id):
+    return f"incorrect.user:{_tag(user_id)}"
+
+def review_key(user_id):
+    return f"review:{_tag(user_id)}"
+
+def review_interval_key(user_id):
+    return f"review.interval:{_tag(user_id)}"
+
+def session_data_key(user_id):
+    return f"session.data:{_tag(user_id)}"
+
+def session_history_key(user_id):
+    return f"session.history:{_tag(user_id)}"
+
+def users_server_key(guild_id):
+    return f"users.server:{_tag(guild_id)}"
+
+def incorrect_server_key(guild_id):
+    return f"incorrect.server:{_tag(guild_id)}"
+
+def confusion_server_key(guild_id):
+    return f"confusion.server:{_tag(guild_id)}"
+
+# bucket is the channel, user or server id the command's cooldown is counted for
+def cooldown_key(command, bucket):
+    return f"cooldown:{command}:{_tag(bucket)}"
+
+USERS_GLOBAL = _tag("users:global")
+SCORE_GLOBAL = "score:global"
+INCORRECT_GLOBAL = "incorrect:global"
+CONFUSION_GLOBAL = "confusion:global"
+
+# Migration between the plain and cluster key names
+
+# prefixes of keys tagged with an id
+_ID_PREFIXES = (
+    "channel", "deck", "incorrect.user", "review", "review.interval", "session.data", "session.history", "users.server",
+    "incorrect.server", "confusion.server"
+)
+_PLAIN_ID = re.compile(r"^(" + "|".join(map(re.escape, _ID_PREFIXES)) + r"):(\d+)(.*)$", re.S)
+_TAGGED_ID = re.compile(r"^(" + "|".join(map(re.escape, _ID_PREFIXES)) + r"):\{(\d+)\}(.*)$", re.S)
+_PLAIN_GLOBAL = re.compile(r"^(users:global)(|:.*)$", re.S)
+_TAGGED_GLOBAL = re.compile(r"^\{(users:global)\}(.*)$", re.S)
+
+# cluster name of a plain key, or None if it doesn't change
+def cluster_name(key):
+    match = _PLAIN_ID.match(key)
+    if match:
+        return f"{match[1]}:{{{match[2]}}}{match[3]}"
+    match = _PLAIN_GLOBAL.match(key)
+    if match:
+        return f"{{{match[1]}}}{match[2]}"
+    return None
+
+# plain name of a cluster key, or None if it doesn't change
+def plain_name(key):
+    match = _TAGGED_ID.match(key)
+    if match:
+        return f"{match[1]}:{match[2]}{match[3]}"
+    match = _TAGGED_GLOBAL.match(key)
+    if match:
+        return f"{match[1]}{match[2]}"
+    return None
+
+# renames every key in database to its cluster name (or back, with to_cluster=False)
+# run it on the old single node with the bot stopped, before moving the data to a cluster
+# returns the number of keys renamed
+def migrate(database, to_cluster=True, batch_size=1000, dry_run=False):
+    rename = cluster_name if to_cluster else plain_name
+    renamed = 0
+    pending = []
+    # renamed keys can show up again later in the scan, but they don't match a second time
+    for key in database.scan_iter(count=batch_size):
+        new_name = rename(key.decode("utf-8"))
+        if new_name is not None:
+            pending.append((key, new_name))
+        if len(pending) >= batch_size:
+            renamed += _rename(database, pending, dry_run)
+            pending = []
+    return renamed + _rename(database, pending, dry_run)
+
+def _rename(database, pending, dry_run):
+    if dry_run:
+        for key, new_name in pending:
+            print(f"{key.decode('utf-8')} -> {new_name}")
+        return len(pending)
+    pipe = database.pipeline(transaction=False)
+    for key, new_name in pending:
+        pipe.rename(key, new_name)
+    pipe.execute()
+    return len(pending)
+
+# python keys.py [--plain] [--dry-run]
+# renames the keys at REDIS_URL to the cluster names, or back to the plain names with --plain
+if __name__ == "__main__":
+    import redis
+    
+    database = redis.from_url(os.getenv("REDIS_URL"))
+    count = migrate(database, to_cluster="--plain" not in sys.argv, dry_run="--dry-run" in sys.argv)
+    print(f"{'would rename' if '--dry-run' in sys.argv else 'renamed'} {count} keys")
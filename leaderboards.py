@@ -0,0 +1,205 @@
+# leaderboards.py | daily, weekly and season leaderboards
+# Copyright (C) 2019  EraserBird, person_v1.32, hmmm
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import collections
+import datetime
+import os
+import time
+
+import discord
+
+from data.data import database
+
+# bucket format, for both "users:global" and "users.server:server_id" = {
+#    "users:global:day:YYYY-MM-DD":[user id, # of correct that day (UTC)]
+#    "users:global:week:YYYY-WW":[user id, # of correct that ISO week]
+#    "users:global:weekly":[user id, # of correct in the last 7 days], cached union of day buckets
+#    "users:global:season":[user id, # of correct this season], cached union of week buckets
+# }
+# A season starting midweek uses the day buckets for its first week, the rest of that week was last season.
+# Those day buckets are kept as long as week buckets.
+
+DAY_EXPIRY = 8 * 86400  # long enough for the last 7 days
+WEEK_EXPIRY = 400 * 86400  # long enough for a season
+WEEKLY_CACHE_EXPIRY = 60
+SEASON_CACHE_EXPIRY = 300
+
+# period name: aliases
+PERIODS = {
+    "all": ("all", "a"),
+    "daily": ("daily", "day", "today", "d"),
+    "weekly": ("weekly", "week", "w"),
+    "season": ("season", "se")
+}
+
+def _today():
+    return datetime.datetime.utcnow().date()
+
+def _day_key(key, day):
+    return f"{key}:day:{day.isoformat()}"
+
+def _week_key(key, day):
+    year, week, _ = day.isocalendar()
+    return f"{key}:week:{year}-{week:02}"
+
+# start of the season, set SEASON_START=YYYY-MM-DD or it starts every September 1st
+def season_start():
+    if os.getenv("SEASON_START"):
+        return datetime.date.fromisoformat(os.getenv("SEASON_START"))
+    today = _today()
+    start = datetime.date(today.year, 9, 1)
+    return start if start <= today else datetime.date(today.year - 1, 9, 1)
+
+# last day of the season's first ISO week, or None if the season started on a Monday
+def _first_week_end(start):
+    if start.isoweekday() == 1:
+        return None
+    return start + datetime.timedelta(days=7 - start.isoweekday())
+
+# period name for an argument, or None if it isn't one
+def parse_period(arg):
+    for period, aliases in PERIODS.items():
+        if arg in aliases:
+            return period
+    return None
+
+# adds today's bucket writes for a score change to pipe
+def bucket_increment(pipe, key, amount, member):
+    today = _today()
+    start = season_start()
+    first_week_end = _first_week_end(start)
+    # the season reads these day buckets until it ends
+    in_first_week = first_week_end is not None and start <= today <= first_week_end
+    day_expiry = WEEK_EXPIRY if in_first_week else DAY_EXPIRY
+    for bucket, expiry in ((_day_key(key, today), day_expiry), (_week_key(key, today), WEEK_EXPIRY)):
+        pipe.zincrby(bucket, amount, member)
+        pipe.expire(bucket, expiry)
+
+# sorted set to read the leaderboard for a period from
+# key - all time leaderboard, like "users:global"
+def period_key(key, period):
+    if period == "all":
+        return key
+    today = _today()
+    if period == "daily":
+        return _day_key(key, today)
+    
+    if period == "weekly":
+        cached = f"{key}:weekly"
+        buckets = [_day_key(key, today - datetime.timedelta(days=i)) for i in range(7)]
+        expiry = WEEKLY_CACHE_EXPIRY
+    else:
+        cached = f"{key}:season"
+        start = season_start()
+        first_week_end = _first_week_end(start)
+        buckets = []
+        week = start
+        if first_week_end is not None:
+            days = (min(first_week_end, today) - start).days + 1
+            buckets.extend(_day_key(key, start + datetime.timedelta(days=i)) for i in range(days))
+            week = first_week_end + datetime.timedelta(days=1)
+        while week <= today:
+            buckets.append(_week_key(key, week))
+            week += datetime.timedelta(weeks=1)
+        expiry = SEASON_CACHE_EXPIRY
+    
+    # a SEASON_START in the future
+    if not buckets:
+        database.delete(cached)
+        return cached
+    if not database.exists(cached):
+        pipe = database.pipeline(transaction=False)
+        pipe.zunionstore(cached, buckets)
+        pipe.expire(cached, expiry)
+        pipe.execute()
+    return cached
+
+# Paginated leaderboards
+
+PAGE_CACHE_EXPIRY = 30  # pages can be changed by other processes too
+MAX_PAGES = 1000
+MAX_NAMES = 10000
+
+# all time leaderboard: number of score changes, so old pages are skipped
+_versions = collections.Counter()
+# (all time leaderboard, page details): (version, time rendered, page)
+_pages = collections.OrderedDict()
+
+# marks the rendered pages of an all time leaderboard and its periods as old
+def invalidate_pages(key):
+    _versions[key] += 1
+
+# a rendered page, or None if it isn't cached or is out of date
+# key - all time leaderboard the page is from, page_id - anything else that changes the page
+def cached_page(key, page_id):
+    entry = _pages.get((key, page_id))
+    if entry is None:
+        return None
+    version, rendered, page = entry
+    if version != _versions[key] or time.time() - rendered > PAGE_CACHE_EXPIRY:
+        return None
+    return page
+
+def cache_page(key, page_id, page):
+    _pages[(key, page_id)] = (_versions[key], time.time(), page)
+    _pages.move_to_end((key, page_id))
+    if len(_pages) > MAX_PAGES:
+        _pages.popitem(last=False)
+
+# number of users, entries on the page, and the user's rank in one round trip
+def read_page(key, user_id, page, size):
+    pipe = database.pipeline(transaction=False)
+    pipe.zcard(key)
+    pipe.zrevrange(key, page * size, page * size + size - 1, withscores=True)
+    pipe.zrevrank(key, str(user_id))
+    return pipe.execute()
+
+# least recently used names of users by id, None for deleted users
+class NameCache:
+    def __init__(self, max_size=MAX_NAMES):
+        self.max_size = max_size
+        self._names = collections.OrderedDict()
+    
+    def _put(self, user_id, name):
+        self._names[user_id] = name
+        self._names.move_to_end(user_id)
+        if len(self._names) > self.max_size:
+            self._names.popitem(last=False)
+    
+    # names for user_ids, users the bot can't see are fetched all at once
+    # users that couldn't be fetched, from rate limits or discord errors, are left out and fetched next time
+    async def names(self, bot, user_ids):
+        missing = []
+        for user_id in user_ids:
+            if user_id in self._names:
+                self._names.move_to_end(user_id)
+                continue
+            user = bot.get_user(user_id)
+            if user is None:
+                missing.append(user_id)
+            else:
+                self._put(user_id, f"{user.name}#{user.discriminator}")
+        
+        fetched = await asyncio.gather(*(bot.fetch_user(user_id) for user_id in missing), return_exceptions=True)
+        for user_id, user in zip(missing, fetched):
+            if isinstance(user, discord.NotFound):
+                self._put(user_id, None)
+            elif not isinstance(user, Exception):
+                self._put(user_id, f"{user.name}#{user.discriminator}")
+        return {user_id: self._names[user_id] for user_id in user_ids if user_id in self._names}
+
+name_cache = NameCache()
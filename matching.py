@@ -0,0 +1,136 @@
+# matching.py | fuzzy matching for answers and fossil names
+# Copyright (C) 2019  EraserBird, person_v1.32, hmmm
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import collections
+import difflib
+
+# lowercases and removes punctuation that shouldn't count as a mistake
+def normalize(text):
+    return " ".join(text.lower().replace("-", " ").replace("'", "").replace(".", " ").split())
+
+# unrestricted Damerau-Levenshtein distance (Lowrance-Wagner), only computed within limit of the diagonal
+# returns limit + 1 once the distance is over limit
+def _damerau_distance(a, b, limit):
+    n, m = len(a), len(b)
+    over = limit + 1
+    # cells are capped at over, a cell further than limit from the diagonal is always over
+    rows = [[over] * (m + 2) for _ in range(n + 2)]
+    for i in range(min(n, limit) + 1):
+        rows[i + 1][1] = i
+    for j in range(min(m, limit) + 1):
+        rows[1][j + 1] = j
+    last_row = {}
+    for i in range(1, n + 1):
+        above, row = rows[i], rows[i + 1]
+        char_a = a[i - 1]
+        best = row[1]
+        last_column = 0
+        for j in range(max(1, i - limit), min(m, i + limit) + 1):
+            char_b = b[j - 1]
+            k = last_row.get(char_b, 0)
+            l = last_column
+            if char_a == char_b:
+                value = above[j]
+                last_column = j
+            else:
+                value = above[j] + 1
+            if row[j] + 1 < value:
+                value = row[j] + 1
+            if above[j + 1] + 1 < value:
+                value = above[j + 1] + 1
+            if k and l:
+                transposed = rows[k][l] + (i - k - 1) + 1 + (j - l - 1)
+                if transposed < value:
+                    value = transposed
+            row[j + 1] = value if value < over else over
+            if value < best:
+                best = value
+        # a path to a later row, even with a transposition, goes through a cell of this row costing no more
+        if best > limit:
+            return over
+        last_row[char_a] = i
+    return rows[n + 1][m + 1]
+
+# Damerau-Levenshtein distance between a and b
+# limit - stops early and returns limit + 1 once the distance is over limit
+def edit_distance(a, b, limit):
+    if a == b:
+        return 0
+    # a shared start or end never changes the distance
+    shortest = min(len(a), len(b))
+    start = 0
+    while start < shortest and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < shortest - start and a[-1 - end] == b[-1 - end]:
+        end += 1
+    a = a[start:len(a) - end]
+    b = b[start:len(b) - end]
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    return _damerau_distance(a, b, limit)
+
+# True if a and b are less than cutoff edits apart
+def within_distance(a, b, cutoff):
+    return edit_distance(a, b, cutoff - 1) < cutoff
+
+# other acceptable ways of writing a fossil name:
+# "carcharocles megalodon" -> "megalodon", "c megalodon", and "carcharocles" if genus is True
+def answer_variants(answer, genus=False):
+    words = normalize(answer).split(" ")
+    variants = {" ".join(words)}
+    if len(words) > 1:
+        variants.add(words[-1])
+        variants.add(f"{words[0][0]} {' '.join(words[1:])}")
+        if genus:
+            variants.add(words[0])
+    return variants
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+# index of names for quick fuzzy lookups, built once for a list
+# candidates share character trigrams with the query, and only those are scored
+class FuzzyIndex:
+    def __init__(self, names):
+        self.names = list(names)
+        self._normalized = [normalize(name) for name in self.names]
+        self._postings = collections.defaultdict(list)
+        for i, name in enumerate(self._normalized):
+            for trigram in _trigrams(name):
+                self._postings[trigram].append(i)
+    
+    # up to k names closest to query, best first, like difflib.get_close_matches
+    # cutoff - minimum similarity (0 to 1) for a name to be returned
+    def lookup(self, query, k=1, cutoff=0.6):
+        query = normalize(query)
+        shared = collections.Counter()
+        for trigram in _trigrams(query):
+            shared.update(self._postings.get(trigram, ()))
+        
+        matcher = difflib.SequenceMatcher()
+        matcher.set_seq2(query)
+        scored = []
+        # names sharing the most trigrams are the only ones likely to score well
+        for i, _ in shared.most_common(max(20, 3 * k)):
+            matcher.set_seq1(self._normalized[i])
+            if matcher.real_quick_ratio() >= cutoff and matcher.quick_ratio() >= cutoff:
+                score = matcher.ratio()
+                if score >= cutoff:
+                    scored.append((score, i))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [self.names[i] for _, i in scored[:k]]
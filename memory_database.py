@@ -0,0 +1,462 @@
+# memory_database.py | in-process database with the redis commands the bot uses
+# Copyright (C) 2019  EraserBird, person_v1.32, hmmm
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import bisect
+import fnmatch
+import functools
+import pickle
+import threading
+import time
+
+from redis.exceptions import ResponseError
+
+# Replies match redis-py's defaults: strings come back as bytes, scores as floats.
+# Lua scripts can't run here, so each script is registered with a Python function doing the same thing,
+# called as fallback(client, keys, args) with the database as the client.
+# benchmarks/scripts.py checks each fallback against its script on redis.
+
+def _encode(value):
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, float):
+        return repr(value).encode("utf-8")
+    return str(value).encode("utf-8")
+
+def _score_bound(value):
+    value = _encode(value).decode("utf-8")
+    if value.startswith("("):
+        return float(value[1:]), True
+    return float(value), False
+
+# runs a command with the database locked, so executor threads can use it too
+def _command(method):
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    
+    locked.is_command = True
+    return locked
+
+# compares greater than every member, so (score, _AFTER_ALL) sorts after all entries with that score
+class _AfterAll:
+    def __eq__(self, other):
+        return other is self
+    
+    def __lt__(self, other):
+        return False
+    
+    def __gt__(self, other):
+        return True
+
+_AFTER_ALL = _AfterAll()
+
+class _SortedSet:
+    def __init__(self, scores=None):
+        self.scores = dict(scores or {})
+        # (score, member) sorted by score then member like redis, kept in order on every write,
+        # so ranks and ranges are a binary search like redis' skiplist instead of a sort
+        self.order = sorted((score, member) for member, score in self.scores.items())
+    
+    def set(self, member, score):
+        old = self.scores.get(member)
+        if old is not None:
+            del self.order[bisect.bisect_left(self.order, (old, member))]
+        self.scores[member] = score
+        bisect.insort(self.order, (score, member))
+    
+    def remove(self, member):
+        score = self.scores.pop(member, None)
+        if score is None:
+            return False
+        del self.order[bisect.bisect_left(self.order, (score, member))]
+        return True
+    
+    # the part of order with scores between low and high
+    def between(self, low, low_open, high, high_open):
+        first = bisect.bisect_left(self.order, (low, _AFTER_ALL if low_open else b""))
+        last = bisect.bisect_left(self.order, (high, b"" if high_open else _AFTER_ALL))
+        return first, last
+
+class MemoryScript:
+    def __init__(self, database, fallback):
+        self.database = database
+        self.fallback = fallback
+    
+    def __call__(self, keys=(), args=(), client=None):
+        client = self.database if client is None else client
+        return client.run_script(self.fallback, list(keys), list(args))
+
+class MemoryDatabase:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._data = {}
+        self._expiry = {}
+    
+    def _get(self, name, kind=None):
+        name = _encode(name)
+        expiry = self._expiry.get(name)
+        if expiry is not None and expiry <= time.time():
+            del self._data[name]
+            del self._expiry[name]
+        value = self._data.get(name)
+        if value is not None and kind is not None and not isinstance(value, kind):
+            raise ResponseError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+    
+    def _create(self, name, kind):
+        value = self._get(name, kind)
+        if value is None:
+            value = self._data[_encode(name)] = kind()
+        return value
+    
+    def _remove_if_empty(self, name, value):
+        if not (value.scores if isinstance(value, _SortedSet) else value):
+            self._data.pop(_encode(name), None)
+            self._expiry.pop(_encode(name), None)
+    
+    def pipeline(self, transaction=True, shard_hint=None):
+        return MemoryPipeline(self)
+    
+    def register_script(self, script, fallback):
+        return MemoryScript(self, fallback)
+    
+    @_command
+    def run_script(self, fallback, keys, args):
+        return fallback(self, keys, args)
+    
+    # Keys
+    
+    @_command
+    def exists(self, *names):
+        return sum(self._get(name) is not None for name in names)
+    
+    @_command
+    def delete(self, *names):
+        deleted = 0
+        for name in names:
+            if self._get(name) is not None:
+                del self._data[_encode(name)]
+                self._expiry.pop(_encode(name), None)
+                deleted += 1
+        return deleted
+    
+    @_command
+    def expire(self, name, time_):
+        if self._get(name) is None:
+            return False
+        self._expiry[_encode(name)] = time.time() + int(time_)
+        return True
+    
+    @_command
+    def ttl(self, name):
+        if self._get(name) is None:
+            return -2
+        expiry = self._expiry.get(_encode(name))
+        return -1 if expiry is None else round(expiry - time.time())
+    
+    @_command
+    def rename(self, src, dst):
+        value = self._get(src)
+        if value is None:
+            raise ResponseError("no such key")
+        expiry = self._expiry.pop(_encode(src), None)
+        del self._data[_encode(src)]
+        self._data[_encode(dst)] = value
+        self._expiry.pop(_encode(dst), None)
+        if expiry is not None:
+            self._expiry[_encode(dst)] = expiry
+        return True
+    
+    @_command
+    def keys(self, pattern="*"):
+        return [name for name in list(self._data) if self._get(name) is not None and fnmatch.fnmatchcase(name, _encode(pattern))]
+    
+    def scan_iter(self, match=None, count=None):
+        yield from self.keys(match or "*")
+    
+    @_command
+    def ping(self):
+        return True
+    
+    @_command
+    def dbsize(self):
+        return len(self.keys())
+    
+    @_command
+    def flushall(self):
+        self._data.clear()
+        self._expiry.clear()
+        return True
+    
+    # not the redis format, only restores into a memory database
+    @_command
+    def dump(self, name):
+        value = self._get(name)
+        return None if value is None else pickle.dumps(value)
+    
+    # Strings
+    
+    @_command
+    def get(self, name):
+        return self._get(name, bytes)
+    
+    @_command
+    def set(self, name, value, ex=None, nx=False, xx=False):
+        exists = self._get(name) is not None
+        if (nx and exists) or (xx and not exists):
+            return None
+        self._data[_encode(name)] = _encode(value)
+        self._expiry.pop(_encode(name), None)
+        if ex is not None:
+            self._expiry[_encode(name)] = time.time() + int(ex)
+        return True
+    
+    # Hashes
+    
+    @_command
+    def hget(self, name, key):
+        return (self._get(name, dict) or {}).get(_encode(key))
+    
+    @_command
+    def hmget(self, name, keys, *args):
+        keys = [keys] if isinstance(keys, (str, bytes)) else list(keys)
+        values = self._get(name, dict) or {}
+        return [values.get(_encode(key)) for key in keys + list(args)]
+    
+    @_command
+    def hgetall(self, name):
+        return dict(self._get(name, dict) or {})
+    
+    @_command
+    def hset(self, name, key=None, value=None, mapping=None):
+        items = dict(mapping or {})
+        if key is not None:
+            items[key] = value
+        values = self._create(name, dict)
+        added = 0
+        for key, value in items.items():
+            added += _encode(key) not in values
+            values[_encode(key)] = _encode(value)
+        return added
+    
+    @_command
+    def hmset(self, name, mapping):
+        self.hset(name, mapping=mapping)
+        return True
+    
+    @_command
+    def hincrby(self, name, key, amount=1):
+        values = self._create(name, dict)
+        value = int(values.get(_encode(key), 0)) + int(amount)
+        values[_encode(key)] = _encode(value)
+        return value
+    
+    # Sorted sets
+    
+    @_command
+    def zscore(self, name, value):
+        return (self._get(name, _SortedSet) or _SortedSet()).scores.get(_encode(value))
+    
+    @_command
+    def zadd(self, name, mapping, nx=False, xx=False):
+        zset = self._create(name, _SortedSet)
+        added = 0
+        for member, score in mapping.items():
+            exists = _encode(member) in zset.scores
+            if (nx and exists) or (xx and not exists):
+                continue
+            added += not exists
+            zset.set(_encode(member), float(score))
+        self._remove_if_empty(name, zset)
+        return added
+    
+    @_command
+    def zincrby(self, name, amount, value):
+        zset = self._create(name, _SortedSet)
+        score = zset.scores.get(_encode(value), 0.0) + float(amount)
+        zset.set(_encode(value), score)
+        return score
+    
+    @_command
+    def zrem(self, name, *values):
+        zset = self._get(name, _SortedSet)
+        if zset is None:
+            return 0
+        removed = sum(zset.remove(_encode(value)) for value in values)
+        self._remove_if_empty(name, zset)
+        return removed
+    
+    @_command
+    def zcard(self, name):
+        return len((self._get(name, _SortedSet) or _SortedSet()).scores)
+    
+    @staticmethod
+    def _reply(entries, withscores):
+        return [(member, score) for score, member in entries] if withscores else [member for _, member in entries]
+    
+    @_command
+    def zrange(self, name, start, end, desc=False, withscores=False):
+        order = (self._get(name, _SortedSet) or _SortedSet()).order
+        size = len(order)
+        end = min(size + end if end < 0 else end, size - 1)
+        start = max(size + start if start < 0 else start, 0)
+        if start > end:
+            return []
+        # only the requested entries are copied, descending ranges count from the end
+        entries = order[size - 1 - end:size - start][::-1] if desc else order[start:end + 1]
+        return self._reply(entries, withscores)
+    
+    @_command
+    def zrevrange(self, name, start, end, withscores=False):
+        return self.zrange(name, start, end, desc=True, withscores=withscores)
+    
+    @_command
+    def zrevrank(self, name, value):
+        zset = self._get(name, _SortedSet) or _SortedSet()
+        score = zset.scores.get(_encode(value))
+        if score is None:
+            return None
+        return len(zset.scores) - 1 - bisect.bisect_left(zset.order, (score, _encode(value)))
+    
+    def _by_score(self, name, low, high, start, num, withscores, reverse):
+        zset = self._get(name, _SortedSet) or _SortedSet()
+        first, last = zset.between(*_score_bound(low), *_score_bound(high))
+        start = start or 0
+        count = last - first if num is None or num < 0 else num
+        if reverse:
+            end = max(last - start, first)
+            entries = zset.order[max(end - count, first):end][::-1]
+        else:
+            begin = min(first + start, last)
+            entries = zset.order[begin:min(begin + count, last)]
+        return self._reply(entries, withscores)
+    
+    @_command
+    def zrangebyscore(self, name, min, max, start=None, num=None, withscores=False):
+        return self._by_score(name, min, max, start, num, withscores, False)
+    
+    @_command
+    def zrevrangebyscore(self, name, max, min, start=None, num=None, withscores=False):
+        return self._by_score(name, min, max, start, num, withscores, True)
+    
+    @_command
+    def zunionstore(self, dest, keys):
+        scores = {}
+        for key in keys:
+            for member, score in (self._get(key, _SortedSet) or _SortedSet()).scores.items():
+                scores[member] = scores.get(member, 0.0) + score
+        union = _SortedSet(scores)
+        self.delete(dest)
+        if union.scores:
+            self._data[_encode(dest)] = union
+        return len(union.scores)
+    
+    # Lists
+    
+    @_command
+    def lpush(self, name, *values):
+        items = self._create(name, list)
+        for value in values:
+            items.insert(0, _encode(value))
+        return len(items)
+    
+    @_command
+    def lrange(self, name, start, end):
+        items = self._get(name, list) or []
+        end = len(items) + end if end < 0 else end
+        return items[max(len(items) + start if start < 0 else start, 0):end + 1]
+    
+    @_command
+    def ltrim(self, name, start, end):
+        items = self._get(name, list)
+        if items is not None:
+            items[:] = self.lrange(name, start, end)
+            self._remove_if_empty(name, items)
+        return True
+    
+    # Streams, as lists of (id, fields) with ids "milliseconds-sequence"
+    
+    @_command
+    def xadd(self, name, fields, id="*", maxlen=None, approximate=True):
+        entries = self._create(name, _Stream)
+        milliseconds = int(time.time() * 1000)
+        if entries and entries.last[0] >= milliseconds:
+            milliseconds, sequence = entries.last[0], entries.last[1] + 1
+        else:
+            sequence = 0
+        entries.last = (milliseconds, sequence)
+        entry_id = f"{milliseconds}-{sequence}".encode("utf-8")
+        entries.append((entry_id, {_encode(key): _encode(value) for key, value in fields.items()}))
+        if maxlen is not None and len(entries) > maxlen:
+            del entries[:len(entries) - maxlen]
+        return entry_id
+    
+    @staticmethod
+    def _stream_id(entry_id, default_sequence):
+        entry_id = _encode(entry_id).decode("utf-8")
+        milliseconds, _, sequence = entry_id.partition("-")
+        return int(milliseconds), int(sequence) if sequence else default_sequence
+    
+    @_command
+    def xrange(self, name, min="-", max="+", count=None):
+        entries = self._get(name, _Stream) or _Stream()
+        low = (0, 0) if _encode(min) == b"-" else self._stream_id(min, 0)
+        high = (float("inf"), 0) if _encode(max) == b"+" else self._stream_id(max, float("inf"))
+        found = [entry for entry in entries if low <= self._stream_id(entry[0], 0) <= high]
+        return found if count is None else found[:count]
+    
+    @_command
+    def xread(self, streams, count=None, block=None):
+        replies = []
+        for name, last in streams.items():
+            entries = self._get(name, _Stream) or _Stream()
+            after = self._stream_id(last, 0)
+            found = [entry for entry in entries if self._stream_id(entry[0], 0) > after]
+            if found:
+                replies.append([_encode(name), found if count is None else found[:count]])
+        return replies
+
+class _Stream(list):
+    last = (0, 0)
+
+# queues commands and runs them all on execute, like a redis pipeline
+class MemoryPipeline:
+    def __init__(self, database):
+        self._database = database
+        self._commands = []
+    
+    def __getattr__(self, name):
+        command = getattr(self._database, name)
+        if not getattr(command, "is_command", False):
+            raise AttributeError(f"{name} can't be pipelined")
+        
+        def queue(*args, **kwargs):
+            self._commands.append((command, args, kwargs))
+            return self
+        
+        return queue
+    
+    def execute(self, raise_on_error=True):
+        commands, self._commands = self._commands, []
+        with self._database._lock:
+            return [command(*args, **kwargs) for command, args, kwargs in commands]
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self._commands = []
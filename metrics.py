@@ -0,0 +1,255 @@
+# metrics.py | counters for bot activity
+# Copyright (C) 2019  EraserBird, person_v1.32, hmmm
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import collections
+import contextvars
+import math
+import os
+import threading
+import time
+
+import redis
+
+import startup
+from image_cache import image_cache
+from tracing import finish_trace, record_redis, start_trace
+
+# command running in the current task, copied into tasks it starts
+current_command = contextvars.ContextVar("current_command", default="none")
+
+# command name: number of times run
+invocations = collections.Counter()
+# command name: number of discord api requests made
+api_calls = collections.Counter()
+# command name: number of runs that raised an error
+command_errors = collections.Counter()
+
+# seconds between event loop lag measurements
+LAG_INTERVAL = 0.5
+
+# Histograms are counted into fixed buckets, like prometheus does.
+# They are also updated from executor threads, so they have a lock.
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets) + (math.inf, )
+        self._lock = threading.Lock()
+        # label: [count in each bucket, sum]
+        self._series = {}
+    
+    def observe(self, value, label=None):
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                series = self._series[label] = [[0] * len(self.buckets), 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+    
+    # label: (cumulative count for each bucket, sum, count)
+    def snapshot(self):
+        with self._lock:
+            snapshot = {}
+            for label, (counts, total) in self._series.items():
+                cumulative = []
+                running = 0
+                for count in counts:
+                    running += count
+                    cumulative.append(running)
+                snapshot[label] = (cumulative, total, running)
+            return snapshot
+
+command_seconds = Histogram((0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+# time from sending to redis to the first reply
+redis_seconds = Histogram((0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1))
+loop_lag_seconds = Histogram((0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5))
+
+# redis commands, pipelines and script calls each count as one round trip
+redis_round_trips = 0
+download_bytes = 0
+download_failures = 0
+
+async def _before_invoke(ctx):
+    name = ctx.command.qualified_name
+    current_command.set(name)
+    invocations[name] += 1
+    ctx.metrics_start = time.perf_counter()
+    ctx.trace = start_trace(name)
+
+# runs after the command even if it raised
+async def _after_invoke(ctx):
+    name = ctx.command.qualified_name
+    command_seconds.observe(time.perf_counter() - ctx.metrics_start, name)
+    if ctx.command_failed:
+        command_errors[name] += 1
+    finish_trace(ctx.trace)
+
+# times round trips at the redis connection, which every client and pipeline sends through
+def _instrument_redis():
+    send = redis.connection.Connection.send_packed_command
+    read = redis.connection.Connection.read_response
+    
+    def timed_send(connection, command, *args, **kwargs):
+        global redis_round_trips
+        redis_round_trips += 1
+        connection.metrics_sent = time.perf_counter()
+        return send(connection, command, *args, **kwargs)
+    
+    def timed_read(connection, *args, **kwargs):
+        response = read(connection, *args, **kwargs)
+        sent = getattr(connection, "metrics_sent", None)
+        if sent is not None:
+            elapsed = time.perf_counter() - sent
+            redis_seconds.observe(elapsed)
+            record_redis(elapsed)
+            connection.metrics_sent = None
+        return response
+    
+    redis.connection.Connection.send_packed_command = timed_send
+    redis.connection.Connection.read_response = timed_read
+
+async def _monitor_lag():
+    loop = asyncio.get_event_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(LAG_INTERVAL)
+        loop_lag_seconds.observe(max(loop.time() - start - LAG_INTERVAL, 0.0))
+
+# starts counting commands, the discord api requests they make, redis round trips and event loop lag,
+# and tracing sampled commands
+def setup_metrics(bot):
+    bot.before_invoke(_before_invoke)
+    bot.after_invoke(_after_invoke)
+    
+    request = bot.http.request
+    
+    async def counted_request(route, **kwargs):
+        api_calls[current_command.get()] += 1
+        return await request(route, **kwargs)
+    
+    bot.http.request = counted_request
+    _instrument_redis()
+    bot.loop.create_task(_monitor_lag())
+
+# counts the images a download wrote, failed downloads are None
+def record_downloads(paths):
+    global download_bytes, download_failures
+    for path in paths:
+        if path is None:
+            download_failures += 1
+        else:
+            download_bytes += os.path.getsize(path)
+
+# a download that failed before writing any images
+def record_download_failure():
+    global download_failures
+    download_failures += 1
+
+# average discord api requests per run of each command
+def api_calls_per_command():
+    return {name: api_calls[name] / count for name, count in invocations.items()}
+
+# Prometheus text format
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(labels):
+    labels = {name: value for name, value in labels.items() if value is not None}
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and math.isnan(value):
+        return "NaN"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Exposition:
+    def __init__(self):
+        self.lines = []
+    
+    def metric(self, name, kind, help_text, samples):
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            self.lines.append(f"{name}{_labels(labels)} {_number(value)}")
+    
+    def histogram(self, name, help_text, histogram, label_name=None):
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} histogram")
+        for label, (cumulative, total, count) in sorted(histogram.snapshot().items(), key=lambda item: str(item[0])):
+            for bound, bucket in zip(histogram.buckets, cumulative):
+                labels = _labels({label_name: label, "le": _number(bound)})
+                self.lines.append(f"{name}_bucket{labels} {bucket}")
+            self.lines.append(f"{name}_sum{_labels({label_name: label})} {_number(total)}")
+            self.lines.append(f"{name}_count{_labels({label_name: label})} {count}")
+    
+    def text(self):
+        return "\n".join(self.lines) + "\n"
+
+# all metrics in the prometheus text format
+def render_metrics(bot):
+    out = _Exposition()
+    out.metric(
+        "fossils_commands_total", "counter", "Commands run.",
+        (({"command": name}, count) for name, count in sorted(invocations.items()))
+    )
+    out.metric(
+        "fossils_command_errors_total", "counter", "Commands that raised an error.",
+        (({"command": name}, count) for name, count in sorted(command_errors.items()))
+    )
+    out.histogram("fossils_command_seconds", "Time to run a command.", command_seconds, "command")
+    out.metric(
+        "fossils_discord_api_calls_total", "counter", "Discord API requests, by the command that made them.",
+        (({"command": name}, count) for name, count in sorted(api_calls.items()))
+    )
+    out.metric(
+        "fossils_redis_round_trips_total", "counter", "Redis commands, pipelines and script calls sent.",
+        (({}, redis_round_trips), )
+    )
+    out.histogram("fossils_redis_seconds", "Time from sending to Redis to the first reply.", redis_seconds)
+    
+    stats = image_cache.stats()
+    out.metric("fossils_image_cache_hits_total", "counter", "Image cache hits.", (({}, stats["hits"]), ))
+    out.metric("fossils_image_cache_misses_total", "counter", "Image cache misses.", (({}, stats["misses"]), ))
+    out.metric("fossils_image_cache_evictions_total", "counter", "Images evicted.", (({}, stats["evictions"]), ))
+    out.metric("fossils_image_cache_bytes", "gauge", "Bytes of images cached.", (({}, stats["bytes"]), ))
+    out.metric("fossils_image_cache_files", "gauge", "Images cached.", (({}, stats["files"]), ))
+    out.metric(
+        "fossils_image_download_bytes_total", "counter", "Bytes of images downloaded.", (({}, download_bytes), )
+    )
+    out.metric(
+        "fossils_image_download_failures_total", "counter", "Image downloads that failed.",
+        (({}, download_failures), )
+    )
+    
+    out.histogram("fossils_event_loop_lag_seconds", "How late the event loop runs a timer.", loop_lag_seconds)
+    latency = bot.latency
+    out.metric(
+        "fossils_gateway_latency_seconds", "gauge", "Discord gateway heartbeat latency.",
+        (({}, latency if math.isfinite(latency) else math.nan), )
+    )
+    out.metric("fossils_guilds", "gauge", "Servers the bot is in.", (({}, len(bot.guilds)), ))
+    out.metric(
+        "fossils_startup_seconds", "gauge", "Time each phase of startup took.",
+        (({"phase": name}, seconds) for name, seconds in startup.phases)
+    )
+    return out.text()
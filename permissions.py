@@ -0,0 +1,95 @@
+# permissions.py | cached checks of the bot's permissions in channels
+# Copyright (C) 2019  EraserBird, person_v1.32, hmmm
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import discord
+
+# permissions the bot needs in a channel to run commands
+REQUIRED_PERMISSIONS = {"send_messages": True, "embed_links": True, "attach_files": True}
+
+# the required permissions the bot doesn't have in channel
+# code copied from @commands.bot_has_permissions(send_messages=True, embed_links=True, attach_files=True)
+def missing_permissions(guild, channel):
+    permissions = channel.permissions_for(guild.me)
+    return tuple(perm for perm, value in REQUIRED_PERMISSIONS.items() if getattr(permissions, perm, None) != value)
+
+# The bot's permissions only change when a role, a channel's overwrites, the bot's roles or the server owner change.
+# The listeners in setup_permissions forget what those events could have changed, the next command works it out again.
+class PermissionCache:
+    def __init__(self):
+        # guild id: {channel id: missing permissions}
+        self._guilds = {}
+    
+    def missing(self, guild, channel):
+        channels = self._guilds.get(guild.id)
+        if channels is None:
+            channels = self._guilds[guild.id] = {}
+        missing = channels.get(channel.id)
+        if missing is None:
+            missing = channels[channel.id] = missing_permissions(guild, channel)
+        return missing
+    
+    def forget_guild(self, guild):
+        self._guilds.pop(guild.id, None)
+    
+    def forget_channel(self, channel):
+        channels = self._guilds.get(channel.guild.id)
+        if channels is not None:
+            channels.pop(channel.id, None)
+    
+    def clear(self):
+        self._guilds.clear()
+
+permission_cache = PermissionCache()
+
+# role update events pass the role before and after
+async def _on_role_change(role, after=None):
+    permission_cache.forget_guild(role.guild)
+
+async def _on_channel_update(before, after):
+    # channels synced with a category get their overwrites from it
+    if isinstance(after, discord.CategoryChannel):
+        permission_cache.forget_guild(after.guild)
+    else:
+        permission_cache.forget_channel(after)
+
+async def _on_channel_delete(channel):
+    permission_cache.forget_channel(channel)
+
+async def _on_guild_update(before, after):
+    permission_cache.forget_guild(after)
+
+async def _on_guild_remove(guild):
+    permission_cache.forget_guild(guild)
+
+# on_ready comes again after a new gateway session, the events missed before it are gone
+async def _on_ready():
+    permission_cache.clear()
+
+# caches the permission checks of bot, call it before the bot starts
+def setup_permissions(bot):
+    async def on_member_update(before, after):
+        if after.id == bot.user.id:
+            permission_cache.forget_guild(after.guild)
+    
+    bot.add_listener(_on_role_change, "on_guild_role_create")
+    bot.add_listener(_on_role_change, "on_guild_role_delete")
+    bot.add_listener(_on_role_change, "on_guild_role_update")
+    bot.add_listener(_on_channel_update, "on_guild_channel_update")
+    bot.add_listener(_on_channel_delete, "on_guild_channel_delete")
+    bot.add_listener(_on_guild_update, "on_guild_update")
+    bot.add_listener(_on_guild_remove, "on_guild_remove")
+    bot.add_listener(on_member_update, "on_member_update")
+    bot.add_listener(_on_ready, "on_ready")
@@ -0,0 +1,103 @@
+# practice.py | picking fossils weighted by how often they are missed
+# Copyright (C) 2019  EraserBird, person_v1.32, hmmm
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import collections
+import random
+import time
+
+from data.data import database, fossils_list, logger
+
+# every fossil gets this much weight on top of its misses, so none are left out
+BASE_WEIGHT = 1
+# weights are reloaded from the database after this many seconds,
+# to pick up misses recorded by other processes
+REFRESH_AFTER = 300
+# most weight tables kept in memory
+MAX_TABLES = 2000
+
+_fossil_indexes = {fossil: i for i, fossil in enumerate(fossils_list)}
+
+# Fenwick tree over integer weights, O(log n) to change a weight and to sample.
+# A miss only changes one weight, so nothing is rebuilt between draws.
+class WeightTree:
+    def __init__(self, weights):
+        self.weights = list(weights)
+        self.total = sum(self.weights)
+        # tree[i] is the sum of the i & -i weights ending at weights[i - 1]
+        self.tree = [0] + self.weights
+        for i in range(1, len(self.tree)):
+            parent = i + (i & -i)
+            if parent < len(self.tree):
+                self.tree[parent] += self.tree[i]
+    
+    def set(self, i, weight):
+        change = weight - self.weights[i]
+        self.weights[i] = weight
+        self.total += change
+        i += 1
+        while i < len(self.tree):
+            self.tree[i] += change
+            i += i & -i
+    
+    # index of a weight picked in proportion to its size, weights need to be at least 1
+    def sample(self, rng=random):
+        target = rng.randrange(self.total)
+        position = 0
+        step = 1 << (len(self.weights).bit_length() - 1)
+        while step:
+            following = position + step
+            if following < len(self.tree) and self.tree[following] <= target:
+                position = following
+                target -= self.tree[following]
+            step >>= 1
+        return position
+
+# weights for an incorrect sorted set, kept up to date by record_miss
+class _Weights:
+    def __init__(self, key):
+        weights = [BASE_WEIGHT] * len(fossils_list)
+        for fossil, misses in database.zrange(key, 0, -1, withscores=True):
+            i = _fossil_indexes.get(fossil.decode("utf-8"))
+            if i is not None:
+                weights[i] += max(0, int(misses))
+        self.tree = WeightTree(weights)
+        self.loaded = time.time()
+
+_cache = collections.OrderedDict()
+
+# updates the weights of a loaded set instead of reloading it
+def record_miss(key, fossil, amount):
+    entry = _cache.get(key)
+    i = _fossil_indexes.get(fossil)
+    if entry is not None and i is not None:
+        entry.tree.set(i, max(BASE_WEIGHT, entry.tree.weights[i] + int(amount)))
+
+# picks a fossil, more likely the more it appears in the incorrect set at key
+def practice_fossil(key, exclude=None):
+    entry = _cache.get(key)
+    if entry is None or time.time() - entry.loaded > REFRESH_AFTER:
+        logger.info(f"loading practice weights for {key}")
+        entry = _Weights(key)
+        _cache[key] = entry
+        if len(_cache) > MAX_TABLES:
+            _cache.popitem(last=False)
+    _cache.move_to_end(key)
+    
+    fossil = fossils_list[entry.tree.sample()]
+    # don't send the same fossil twice in a row
+    while fossil == exclude and len(fossils_list) > 1:
+        fossil = fossils_list[entry.tree.sample()]
+    return fossil
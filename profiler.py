@@ -0,0 +1,187 @@
+# profiler.py | sampling profiler for the running bot
+# Copyright (C) 2019  EraserBird, person_v1.32, hmmm
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import collections
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+# seconds between stack samples, 100 a second keeps the sampling thread cheap
+SAMPLE_INTERVAL = 0.01
+# frames of a stack looked at
+MAX_DEPTH = 64
+# frames kept for each allocation, more frames make allocations slower while it runs
+ALLOCATION_FRAMES = 1
+# callbacks that run longer than this block the event loop
+SLOW_CALLBACK = 0.05
+# longest profile
+MAX_SECONDS = 60.0
+# lines in each section of the report
+TOP = 25
+
+class ProfilerBusy(Exception):
+    pass
+
+_running = threading.Lock()
+_root = os.getcwd()
+
+def _where(code):
+    filename = code.co_filename
+    if filename.startswith(_root):
+        filename = os.path.relpath(filename)
+    else:
+        # the path inside site-packages or the standard library is enough
+        filename = os.sep.join(filename.split(os.sep)[-2:])
+    return f"{filename}:{code.co_firstlineno}({code.co_name})"
+
+# what a callback run by the event loop is, tasks by their coroutine
+def _describe(callback):
+    task = getattr(callback, "__self__", None)
+    if isinstance(task, asyncio.Task):
+        coro = task._coro
+        return f"task {getattr(coro, '__qualname__', repr(coro))}"
+    return getattr(callback, "__qualname__", repr(callback))
+
+class Profiler:
+    def __init__(self, loop_thread):
+        self.loop_thread = loop_thread
+        self.samples = 0
+        # function: samples it was running in, samples it was on the stack in
+        self.own = collections.Counter()
+        self.total = collections.Counter()
+        # callback: [times it blocked, total seconds, longest]
+        self.slow_callbacks = {}
+        # code object: where it is, so samples don't format names again
+        self._names = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="profiler", daemon=True)
+        self._run = None
+        self._started_tracemalloc = False
+        self._started = None
+        self.seconds = 0.0
+    
+    def _sample(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self.loop_thread)
+            if frame is None:
+                continue
+            self.samples += 1
+            self.own[self._name(frame.f_code)] += 1
+            seen = set()
+            for _ in range(MAX_DEPTH):
+                if frame is None:
+                    break
+                # the callback timing wrapper is on every stack while profiling
+                if frame.f_code.co_filename != __file__:
+                    seen.add(self._name(frame.f_code))
+                frame = frame.f_back
+            self.total.update(seen)
+    
+    def _name(self, code):
+        name = self._names.get(code)
+        if name is None:
+            name = self._names[code] = _where(code)
+        return name
+    
+    # times every callback the event loop runs, like asyncio's debug mode does for its warnings
+    def _patch_handles(self):
+        run = self._run = asyncio.events.Handle._run
+        slow_callbacks = self.slow_callbacks
+        
+        def timed_run(handle):
+            start = time.perf_counter()
+            try:
+                return run(handle)
+            finally:
+                elapsed = time.perf_counter() - start
+                if elapsed > SLOW_CALLBACK:
+                    name = _describe(handle._callback)
+                    stats = slow_callbacks.setdefault(name, [0, 0.0, 0.0])
+                    stats[0] += 1
+                    stats[1] += elapsed
+                    stats[2] = max(stats[2], elapsed)
+        
+        asyncio.events.Handle._run = timed_run
+    
+    def start(self):
+        self._started = time.perf_counter()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(ALLOCATION_FRAMES)
+            self._started_tracemalloc = True
+        self._patch_handles()
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        asyncio.events.Handle._run = self._run
+        self.seconds = time.perf_counter() - self._started
+    
+    # blocking, run it in an executor
+    def report(self):
+        # only allocations made while profiling and still alive are in the snapshot
+        snapshot = tracemalloc.take_snapshot()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+        
+        lines = [f"Profiled for {self.seconds:.1f} s, {self.samples} samples of the event loop thread", ""]
+        
+        lines.append("Functions running (own samples, % of samples)")
+        for function, count in self.own.most_common(TOP):
+            lines.append(f"{count:>7} {count / max(self.samples, 1):>6.1%}  {function}")
+        lines.append("")
+        
+        lines.append("Functions on the stack (samples, % of samples)")
+        for function, count in self.total.most_common(TOP):
+            lines.append(f"{count:>7} {count / max(self.samples, 1):>6.1%}  {function}")
+        lines.append("")
+        
+        lines.append(f"Callbacks blocking the event loop over {SLOW_CALLBACK * 1000:.0f} ms (times, total ms, longest ms)")
+        ranked = sorted(self.slow_callbacks.items(), key=lambda item: item[1][1], reverse=True)
+        for name, (count, total, longest) in ranked[:TOP]:
+            lines.append(f"{count:>7} {total * 1000:>9.1f} {longest * 1000:>9.1f}  {name}")
+        if not ranked:
+            lines.append("none")
+        lines.append("")
+        
+        statistics = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        )).statistics("lineno")
+        lines.append(f"Allocations still alive (KiB, blocks), {sum(stat.size for stat in statistics) / 1024:.0f} KiB in all")
+        for stat in statistics[:TOP]:
+            frame = stat.traceback[0]
+            lines.append(f"{stat.size / 1024:>9.1f} {stat.count:>7}  {frame.filename}:{frame.lineno}")
+        return "\n".join(lines) + "\n"
+
+# profiles the event loop for seconds and returns the report
+# raises ProfilerBusy if a profile is already running
+async def run_profile(seconds):
+    if not _running.acquire(blocking=False):
+        raise ProfilerBusy()
+    try:
+        profiler = Profiler(threading.get_ident())
+        profiler.start()
+        try:
+            await asyncio.sleep(min(seconds, MAX_SECONDS))
+        finally:
+            profiler.stop()
+        return await asyncio.get_event_loop().run_in_executor(None, profiler.report)
+    finally:
+        _running.release()
@@ -0,0 +1,76 @@
+# review.py | spaced repetition schedule for each user
+# Copyright (C) 2019  EraserBird, person_v1.32, hmmm
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import time
+
+from data.data import database, script_client
+from keys import review_interval_key, review_key
+
+# review format = {
+#    "review:user_id":[fossil, time it is due for review]
+#    "review.interval:user_id":{fossil: seconds until the next review}
+# }
+
+# a missed fossil comes back after 10 minutes,
+# a right answer waits at least an hour and doubles the wait, up to 60 days
+MISSED_INTERVAL = 600
+FIRST_INTERVAL = 3600
+MAX_INTERVAL = 5184000
+
+# the record script for the memory database
+def _record(client, keys, args):
+    interval = int(client.hget(keys[1], args[0]) or 0)
+    if str(args[1]) == "1":
+        interval = min(max(interval * 2, FIRST_INTERVAL), MAX_INTERVAL)
+    else:
+        interval = MISSED_INTERVAL
+    client.hset(keys[1], args[0], interval)
+    client.zadd(keys[0], {args[0]: int(args[2]) + interval})
+    return interval
+
+# reschedules one fossil in a single call
+# KEYS[1] - review schedule, KEYS[2] - intervals
+# ARGV[1] - fossil, ARGV[2] - 1 if correct, ARGV[3] - current time
+RECORD_SCRIPT = database.register_script(
+    f"""
+local interval = tonumber(redis.call("HGET", KEYS[2], ARGV[1]) or 0)
+if ARGV[2] == "1" then
+    interval = math.min(math.max(interval * 2, {FIRST_INTERVAL}), {MAX_INTERVAL})
+else
+    interval = {MISSED_INTERVAL}
+end
+redis.call("HSET", KEYS[2], ARGV[1], interval)
+redis.call("ZADD", KEYS[1], tonumber(ARGV[3]) + interval, ARGV[1])
+return interval
+""",
+    fallback=_record
+)
+
+# schedules the next review of fossil after an answer
+# pipe - pipeline to add the write to, otherwise it is sent right away
+def record_review(user_id, fossil, correct, pipe=None):
+    return RECORD_SCRIPT(
+        keys=[review_key(user_id), review_interval_key(user_id)],
+        args=[str(fossil), int(correct), round(time.time())],
+        client=script_client(pipe)
+    )
+
+# the fossil most overdue for review, or None if nothing is due
+def next_review(user_id):
+    due = database.zrangebyscore(review_key(user_id), "-inf", round(time.time()), start=0, num=1)
+    if due:
+        return due[0].decode("utf-8")
+    return None
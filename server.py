@@ -0,0 +1,71 @@
+# server.py | http endpoints for uptime pings, readiness and metrics
+# Copyright (C) 2019  EraserBird, person_v1.32, hmmm
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+
+from aiohttp import web
+
+from data.data import database, logger
+from metrics import render_metrics
+
+# seconds the database has to answer a readiness check
+READY_TIMEOUT = 2.0
+
+# what keeps the bot from serving commands, empty if it is ready
+async def readiness_problems(bot):
+    problems = []
+    if bot.is_closed():
+        problems.append("gateway: closed")
+    elif not bot.is_ready():
+        problems.append("gateway: not connected")
+    
+    loop = asyncio.get_event_loop()
+    try:
+        await asyncio.wait_for(loop.run_in_executor(None, database.ping), READY_TIMEOUT)
+    except asyncio.TimeoutError:
+        problems.append("database: no answer")
+    except Exception as e:
+        problems.append(f"database: {e}")
+    return problems
+
+def make_app(bot):
+    async def alive(request):
+        return web.Response(text="Bot is alive!")
+    
+    async def ready(request):
+        problems = await readiness_problems(bot)
+        if problems:
+            return web.Response(status=503, text="\n".join(problems) + "\n")
+        return web.Response(text="ready\n")
+    
+    async def metrics(request):
+        return web.Response(text=render_metrics(bot), content_type="text/plain", charset="utf-8")
+    
+    app = web.Application()
+    app.router.add_get("/", alive)
+    app.router.add_get("/ready", ready)
+    app.router.add_get("/metrics", metrics)
+    return app
+
+# serves the endpoints on the bot's event loop, call it before the bot starts
+def start_server(bot, port):
+    async def serve():
+        runner = web.AppRunner(make_app(bot), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "0.0.0.0", port).start()
+        logger.info(f"serving metrics on port {port}")
+    
+    bot.loop.create_task(serve())
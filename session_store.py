@@ -0,0 +1,248 @@
+# session_store.py | session bookkeeping with idle timeouts
+# Copyright (C) 2019  EraserBird, person_v1.32, hmmm
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import time
+
+from data.data import database, logger, script_client
+from keys import CLUSTER_MODE, session_data_key, session_history_key
+
+# session format = {
+#    "session.data:user_id":{"start", "last", "correct", "incorrect", "total"}, "last" is the time of the last activity
+#    "session.history:user_id":list of "start stop correct incorrect total", newest first
+#    "sessions.active":[user id, time the session could time out from], for finding timed out sessions
+# }
+# the scripts only touch one user's keys, so they work on a cluster, "sessions.active" is updated separately
+
+# a session with no activity for an hour is over
+IDLE_TIMEOUT = 3600
+# session data outlives the timeout by a day so the finalizer can still summarize it,
+# if the finalizer isn't running the data still expires
+DATA_EXPIRY = IDLE_TIMEOUT + 86400
+# finished sessions kept per user
+MAX_HISTORY = 20
+# idle sessions finalized per database call
+FINALIZE_BATCH = 500
+
+FIELDS = ("start", "last", "correct", "incorrect", "total")
+
+# ends the session in KEYS[1] and adds it to the history in KEYS[2],
+# a timed out session stops at its last activity, "idle" is true if it timed out
+# sessions from before idle timeouts have no "last" or expiry, convert makes them running from now
+_FINISH = f"""
+local function convert(now, data)
+    if data[1] and not data[2] then
+        data[2] = tostring(now)
+        redis.call("HSET", KEYS[1], "last", now)
+        redis.call("EXPIRE", KEYS[1], {DATA_EXPIRY})
+    end
+end
+
+local function finish(now, data)
+    local idle = now - tonumber(data[2]) > {IDLE_TIMEOUT}
+    local record = {{data[1], idle and data[2] or tostring(now), data[3] or "0", data[4] or "0", data[5] or "0"}}
+    redis.call("DEL", KEYS[1])
+    redis.call("LPUSH", KEYS[2], table.concat(record, " "))
+    redis.call("LTRIM", KEYS[2], 0, {MAX_HISTORY - 1})
+    table.insert(record, idle and 1 or 0)
+    return record
+end
+"""
+
+# the scripts below for the memory database
+
+def _convert(client, keys, now, data):
+    if data[0] and not data[1]:
+        data[1] = str(now).encode("utf-8")
+        client.hset(keys[0], "last", now)
+        client.expire(keys[0], DATA_EXPIRY)
+
+def _finish(client, keys, now, data):
+    idle = now - int(data[1]) > IDLE_TIMEOUT
+    record = [data[0], data[1] if idle else str(now).encode("utf-8")] + [value or b"0" for value in data[2:]]
+    client.delete(keys[0])
+    client.lpush(keys[1], b" ".join(record))
+    client.ltrim(keys[1], 0, MAX_HISTORY - 1)
+    return record + [int(idle)]
+
+def _start(client, keys, args):
+    now = int(args[0])
+    data = client.hmget(keys[0], FIELDS)
+    _convert(client, keys, now, data)
+    if data[0] and data[1]:
+        if now - int(data[1]) <= IDLE_TIMEOUT:
+            return 0
+        _finish(client, keys, now, data)
+    client.hset(keys[0], mapping={"start": now, "last": now, "correct": 0, "incorrect": 0, "total": 0})
+    client.expire(keys[0], DATA_EXPIRY)
+    return 1
+
+def _increment(client, keys, args):
+    last = client.hget(keys[0], "last")
+    if not last:
+        if client.hget(keys[0], "start") is None:
+            return None
+        last = args[2]
+    if int(args[2]) - int(last) > IDLE_TIMEOUT:
+        return None
+    value = client.hincrby(keys[0], args[0], args[1])
+    client.hset(keys[0], "last", args[2])
+    client.expire(keys[0], DATA_EXPIRY)
+    return value
+
+def _finish_session(client, keys, args):
+    now = int(args[0])
+    data = client.hmget(keys[0], FIELDS)
+    _convert(client, keys, now, data)
+    if not data[0] or not data[1]:
+        return None
+    if str(args[1]) == "1" and now - int(data[1]) <= IDLE_TIMEOUT:
+        return int(data[1])
+    return _finish(client, keys, now, data)
+
+# starts a session unless one is running, returns 1 if it started
+# a timed out session that hasn't been finalized yet goes to the history first
+# KEYS[1] - session data, KEYS[2] - session history
+# ARGV[1] - current time
+START_SCRIPT = database.register_script(
+    _FINISH + f"""
+local now = tonumber(ARGV[1])
+local data = redis.call("HMGET", KEYS[1], "start", "last", "correct", "incorrect", "total")
+convert(now, data)
+if data[1] and data[2] then
+    if now - tonumber(data[2]) <= {IDLE_TIMEOUT} then
+        return 0
+    end
+    finish(now, data)
+end
+redis.call("HMSET", KEYS[1], "start", now, "last", now, "correct", 0, "incorrect", 0, "total", 0)
+redis.call("EXPIRE", KEYS[1], {DATA_EXPIRY})
+return 1
+""",
+    fallback=_start
+)
+
+# increments a field of a running session and extends it, returns nil if there is no session
+# a session from before idle timeouts gets its "last" and expiry here
+# KEYS[1] - session data
+# ARGV[1] - field, ARGV[2] - amount, ARGV[3] - current time
+INCREMENT_SCRIPT = database.register_script(
+    f"""
+local last = redis.call("HGET", KEYS[1], "last")
+if not last then
+    if redis.call("HEXISTS", KEYS[1], "start") == 0 then
+        return nil
+    end
+    last = ARGV[3]
+end
+if tonumber(ARGV[3]) - tonumber(last) > {IDLE_TIMEOUT} then
+    return nil
+end
+local value = redis.call("HINCRBY", KEYS[1], ARGV[1], ARGV[2])
+redis.call("HSET", KEYS[1], "last", ARGV[3])
+redis.call("EXPIRE", KEYS[1], {DATA_EXPIRY})
+return value
+""",
+    fallback=_increment
+)
+
+# ends a session and adds it to the history, returns its stats and 1 if it timed out,
+# the time of its last activity if it is still running and ARGV[2] is "1", or nil if there isn't one
+# KEYS[1] - session data, KEYS[2] - session history
+# ARGV[1] - current time, ARGV[2] - "1" to only end it if it timed out
+FINISH_SCRIPT = database.register_script(
+    _FINISH + f"""
+local now = tonumber(ARGV[1])
+local data = redis.call("HMGET", KEYS[1], "start", "last", "correct", "incorrect", "total")
+convert(now, data)
+if not data[1] or not data[2] then
+    return nil
+end
+if ARGV[2] == "1" and now - tonumber(data[2]) <= {IDLE_TIMEOUT} then
+    return tonumber(data[2])
+end
+return finish(now, data)
+""",
+    fallback=_finish_session
+)
+
+def _keys(user_id):
+    return [session_data_key(user_id), session_history_key(user_id)]
+
+def _record(values):
+    start, stop, correct, incorrect, total = map(int, map(float, values))
+    return {"start": start, "stop": stop, "correct": correct, "incorrect": incorrect, "total": total}
+
+# starts a session, returns False if one is already running
+def start_session(user_id):
+    if not START_SCRIPT(keys=_keys(user_id), args=[round(time.time())]):
+        # a session from before idle timeouts isn't in "sessions.active" yet
+        database.zadd("sessions.active", {str(user_id): round(time.time())}, nx=True)
+        return False
+    database.zadd("sessions.active", {str(user_id): round(time.time())})
+    return True
+
+# adds amount to a field of the user's session, does nothing without a running session
+# pipe - pipeline to add the write to, otherwise it is sent right away
+def increment_session(user_id, field, amount, pipe=None):
+    return INCREMENT_SCRIPT(keys=_keys(user_id)[:1], args=[field, int(amount), round(time.time())], client=script_client(pipe))
+
+# stats of the running session, or None if there isn't one
+def session_stats(user_id):
+    data = database.hmget(session_data_key(user_id), FIELDS)
+    # without "last" it is from before idle timeouts, and running until it is next used
+    if data[0] is None or (data[1] is not None and time.time() - float(data[1]) > IDLE_TIMEOUT):
+        return None
+    return _record([data[0], round(time.time())] + [value or 0 for value in data[2:]])
+
+# stops the user's session, returns its stats or None if there wasn't one running
+def stop_session(user_id):
+    record = FINISH_SCRIPT(keys=_keys(user_id), args=[round(time.time()), 0])
+    database.zrem("sessions.active", str(user_id))
+    if record is None or record[5] == 1:
+        return None
+    return _record(record[:5])
+
+# the user's finished sessions, newest first
+def session_history(user_id, amount=MAX_HISTORY):
+    return [_record(record.split()) for record in database.lrange(session_history_key(user_id), 0, amount - 1)]
+
+# moves timed out sessions into their users' histories, returns how many were finalized
+# blocking, run it in an executor
+def finalize_idle_sessions():
+    finalized = 0
+    while True:
+        now = round(time.time())
+        # sessions active exactly IDLE_TIMEOUT ago are still running, the bound is exclusive like in the finish script
+        users = database.zrangebyscore("sessions.active", "-inf", f"({now - IDLE_TIMEOUT}", start=0, num=FINALIZE_BATCH)
+        if not users:
+            return finalized
+        pipe = database.pipeline(transaction=False)
+        results = [
+            FINISH_SCRIPT(keys=_keys(user_id.decode("utf-8")), args=[now, 1], client=script_client(pipe)) for user_id in users
+        ]
+        if not CLUSTER_MODE:
+            results = pipe.execute()
+        
+        pipe = database.pipeline(transaction=False)
+        for user_id, result in zip(users, results):
+            if isinstance(result, int):
+                # still running, check it again when it could time out
+                pipe.zadd("sessions.active", {user_id: result})
+            else:
+                pipe.zrem("sessions.active", user_id)
+                finalized += result is not None
+        pipe.execute()
+        logger.info(f"finalized idle sessions, {finalized} so far")
@@ -0,0 +1,55 @@
+# startup.py | how long the bot takes to start
+# Copyright (C) 2019  EraserBird, person_v1.32, hmmm
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# bot.py imports this first, so the clock starts before the other imports
+import time
+
+_started = time.perf_counter()
+_last = _started
+
+# (phase, seconds it took), in order
+phases = []
+# extension: seconds to load it
+extensions = {}
+# seconds from the start to the first on_ready, None until then
+ready_after = None
+
+# ends a phase that started when the last one ended
+def phase(name):
+    global _last
+    now = time.perf_counter()
+    phases.append((name, now - _last))
+    _last = now
+
+def extension_loaded(name, seconds):
+    extensions[name] = seconds
+
+# ends the last phase and returns the report, only the first time the bot is ready
+def ready():
+    global ready_after
+    if ready_after is not None:
+        return None
+    phase("gateway")
+    ready_after = time.perf_counter() - _started
+    return report()
+
+def report():
+    lines = [f"ready after {ready_after:.2f} s"]
+    lines.extend(f"  {name:<12} {seconds:>6.2f} s" for name, seconds in phases)
+    slowest = sorted(extensions.items(), key=lambda item: item[1], reverse=True)[:3]
+    if slowest:
+        lines.append("  slowest extensions: " + ", ".join(f"{name} {seconds:.2f} s" for name, seconds in slowest))
+    return "\n".join(lines)
@@ -0,0 +1,148 @@
+# tracing.py | sampled timing trees for commands
+# Copyright (C) 2019  EraserBird, person_v1.32, hmmm
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import atexit
+import collections
+import contextlib
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import time
+
+from data.data import BatchedQueueListener
+
+# part of commands traced, set TRACE_SAMPLE_RATE to change
+DEFAULT_SAMPLE_RATE = 0.05
+SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE") or DEFAULT_SAMPLE_RATE)
+
+TRACE_FILE = "logs/traces.jsonl"
+# the trace file is moved to traces.jsonl.1 when it gets this big
+MAX_FILE_BYTES = 10000000
+# finished traces kept in memory for the traces command
+RECENT_TRACES = 500
+
+# span the current task is in, tasks started inside a span add their spans to it
+# executor threads don't get the context, so work there is part of the span that waits for it
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+recent_traces = collections.deque(maxlen=RECENT_TRACES)
+
+# traces are written by a background thread like the logs, the event loop only queues them
+trace_handler = logging.handlers.RotatingFileHandler(TRACE_FILE, maxBytes=MAX_FILE_BYTES, backupCount=1, delay=True)
+trace_handler.setFormatter(logging.Formatter("%(message)s"))
+trace_queue = queue.SimpleQueue()
+trace_listener = BatchedQueueListener(trace_queue, trace_handler)
+trace_logger = logging.getLogger("fossils-id.traces")
+trace_logger.setLevel(logging.INFO)
+trace_logger.propagate = False
+trace_logger.addHandler(logging.handlers.QueueHandler(trace_queue))
+trace_listener.start()
+atexit.register(trace_listener.stop)
+
+class Span:
+    __slots__ = ("name", "tags", "start", "duration", "children", "redis_calls", "redis_seconds")
+    
+    def __init__(self, name, tags):
+        self.name = name
+        self.tags = tags
+        self.start = time.perf_counter()
+        self.duration = None
+        self.children = []
+        self.redis_calls = 0
+        self.redis_seconds = 0.0
+    
+    def finish(self):
+        self.duration = time.perf_counter() - self.start
+    
+    # start is milliseconds after the root span started, an unfinished span has no duration
+    def to_dict(self, root_start):
+        span = {
+            "name": self.name,
+            "start_ms": round((self.start - root_start) * 1000, 3),
+            "ms": None if self.duration is None else round(self.duration * 1000, 3),
+        }
+        if self.tags:
+            span["tags"] = self.tags
+        if self.redis_calls:
+            span["redis_calls"] = self.redis_calls
+            span["redis_ms"] = round(self.redis_seconds * 1000, 3)
+        if self.children:
+            span["children"] = [child.to_dict(root_start) for child in self.children]
+        return span
+
+# starts tracing a command if it is sampled, returns the root span or None
+def start_trace(name, **tags):
+    if random.random() >= SAMPLE_RATE:
+        _current_span.set(None)
+        return None
+    root = Span(name, tags)
+    _current_span.set(root)
+    return root
+
+# finishes the trace started by start_trace and saves it
+def finish_trace(root):
+    _current_span.set(None)
+    if root is None:
+        return
+    root.finish()
+    trace = root.to_dict(root.start)
+    trace["time"] = time.time()
+    recent_traces.append(trace)
+    trace_logger.info("%s", json.dumps(trace))
+
+# times a part of a traced command, does nothing outside a trace
+# with span("get_files", fossil=fossil):
+@contextlib.contextmanager
+def span(name, **tags):
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, tags)
+    parent.children.append(child)
+    token = _current_span.set(child)
+    try:
+        yield child
+    finally:
+        child.finish()
+        _current_span.reset(token)
+
+# adds a redis round trip to the current span, not to the spans around it
+def record_redis(seconds):
+    current = _current_span.get()
+    if current is not None:
+        current.redis_calls += 1
+        current.redis_seconds += seconds
+
+# the slowest finished traces in memory, slowest first
+def slowest_traces(amount, name=None):
+    traces = [trace for trace in recent_traces if name is None or trace["name"] == name]
+    return sorted(traces, key=lambda trace: trace["ms"], reverse=True)[:amount]
+
+# a trace as an indented tree of spans
+def format_trace(trace, depth=0):
+    line = f"{'  ' * depth}{trace['name']} {trace['ms'] if trace['ms'] is not None else '?'} ms"
+    if depth > 0:
+        line += f" (at {trace['start_ms']} ms)"
+    if "redis_calls" in trace:
+        line += f", redis {trace['redis_calls']}x {trace['redis_ms']} ms"
+    if "tags" in trace:
+        line += " " + " ".join(f"{key}={value}" for key, value in trace["tags"].items())
+    return "\n".join([line] + [format_trace(child, depth + 1) for child in trace.get("children", ())])
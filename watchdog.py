@@ -0,0 +1,162 @@
+# watchdog.py | finds code that blocks the event loop
+# Copyright (C) 2019  EraserBird, person_v1.32, hmmm
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import collections
+import os
+import sys
+import threading
+import time
+import traceback
+
+from data.data import logger
+from metrics import current_command
+
+# seconds the event loop can be stuck before it counts as blocked, set BLOCKING_THRESHOLD to change
+DEFAULT_THRESHOLD = 0.25
+# seconds between heartbeats from the event loop
+HEARTBEAT_INTERVAL = 0.1
+# seconds between the watchdog thread's checks
+CHECK_INTERVAL = 0.05
+# frames of a blocking stack kept
+STACK_LIMIT = 15
+
+_root = os.getcwd()
+# files that only wrap the calls that block, the call site is where they were called from
+_wrappers = {
+    os.path.abspath(__file__),
+    os.path.join(_root, "metrics.py"),
+    os.path.join(_root, "tracing.py"),
+    os.path.join(_root, "data", "data.py"),
+    os.path.join(_root, "memory_database.py"),
+}
+
+# the handle the event loop is running, set once the watchdog starts
+# its context is the task's, so it has the command even in a task the command started with ensure_future
+_running = None
+_handle_run = asyncio.events.Handle._run
+
+def _run_tracked(handle):
+    global _running
+    _running = handle
+    try:
+        _handle_run(handle)
+    finally:
+        _running = None
+
+class BlockingSite:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.longest = 0.0
+        self.commands = collections.Counter()
+        self.stack = ""
+
+# Every heartbeat the event loop tells a thread it is still running.
+# When the heartbeats stop for longer than the threshold, the thread looks at the loop thread's stack
+# and the command of the handle the loop is running.
+# The heartbeat after the block records how long it was, on the loop thread, so the counters need no lock.
+class Watchdog:
+    def __init__(self, threshold=DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        # call site: BlockingSite
+        self.sites = {}
+        self.blocks = 0
+        self._loop_thread = None
+        self._last_beat = time.monotonic()
+        # heartbeat the block started after, and the (call site, command, stack) the thread saw in it
+        self._pending = None
+        self._thread = None
+    
+    def start(self, loop):
+        asyncio.events.Handle._run = _run_tracked
+        loop.create_task(self._heartbeat())
+    
+    async def _heartbeat(self):
+        self._loop_thread = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._thread = threading.Thread(target=self._watch, name="watchdog", daemon=True)
+        self._thread.start()
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            now = time.monotonic()
+            previous = self._last_beat
+            gap = now - previous - HEARTBEAT_INTERVAL
+            self._last_beat = now
+            if gap > self.threshold:
+                self._record(gap, previous)
+    
+    def _watch(self):
+        seen = None
+        while True:
+            time.sleep(CHECK_INTERVAL)
+            last_beat = self._last_beat
+            if time.monotonic() - last_beat - HEARTBEAT_INTERVAL > self.threshold and seen != last_beat:
+                # once for each block, while it is stuck in the code to blame
+                seen = last_beat
+                command = _command(_running)
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is not None:
+                    site, stack = _describe(frame)
+                    self._pending = (last_beat, (site, command, stack))
+    
+    def _record(self, gap, previous):
+        pending, self._pending = self._pending, None
+        # the thread can look a moment after the loop got going again, then the stack isn't the block's
+        if pending is not None and pending[0] == previous:
+            site, command, stack = pending[1]
+        else:
+            site, command, stack = "unknown", "none", ""
+        self.blocks += 1
+        stats = self.sites.get(site)
+        if stats is None:
+            stats = self.sites[site] = BlockingSite()
+        stats.count += 1
+        stats.total += gap
+        stats.longest = max(stats.longest, gap)
+        stats.commands[command] += 1
+        stats.stack = stack
+        logger.warning(f"event loop blocked for {gap * 1000:.0f} ms at {site}, command: {command}\n{stack}")
+    
+    # call sites that blocked the longest in all, longest first
+    def worst(self, amount):
+        return sorted(self.sites.items(), key=lambda item: item[1].total, reverse=True)[:amount]
+
+def _relative(filename):
+    return os.path.relpath(filename, _root) if filename.startswith(_root) else filename
+
+# the command a handle's task is running, from the context it runs in
+def _command(handle):
+    context = getattr(handle, "_context", None)
+    return "none" if context is None else context.get(current_command, "none")
+
+# the call site to blame and the stack of a blocked loop
+# the call site is the innermost frame in the bot's own code
+def _describe(frame):
+    summary = traceback.extract_stack(frame, limit=STACK_LIMIT)
+    site = None
+    current = frame
+    while current is not None and site is None:
+        filename = os.path.abspath(current.f_code.co_filename)
+        if filename.startswith(_root) and filename not in _wrappers and "site-packages" not in filename:
+            site = f"{_relative(filename)}:{current.f_lineno} ({current.f_code.co_name})"
+        current = current.f_back
+    if site is None:
+        innermost = summary[-1]
+        site = f"{_relative(innermost.filename)}:{innermost.lineno} ({innermost.name})"
+    return site, "".join(summary.format())
+
+watchdog = Watchdog(float(os.getenv("BLOCKING_THRESHOLD") or DEFAULT_THRESHOLD))
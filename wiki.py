@@ -0,0 +1,137 @@
+# wiki.py | wikipedia page lookups
+# Copyright (C) 2019  EraserBird, person_v1.32, hmmm
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import os
+
+from data.data import database, fossils_list, logger
+from tracing import span
+
+# precomputed urls for fossils_list, run this file to regenerate
+URLS_FILE = "data/wikipedia_urls.txt"
+
+# cache format = {
+#    "wikipedia:title":url, or "!disambiguation"/"!missing" if there is no page
+# }
+# pages are cached for 30 days, missing pages for a day in case they are fixed
+FOUND_EXPIRY = 2592000
+MISSING_EXPIRY = 86400
+
+def _load_urls():
+    if not os.path.exists(URLS_FILE):
+        return {}
+    with open(URLS_FILE) as f:
+        return dict(line.rstrip("\n").split("\t", 1) for line in f if line.strip())
+
+fossil_urls = _load_urls()
+
+# get_wiki_url raises these instead of wikipedia's errors,
+# so catching them doesn't need the wikipedia package, which imports requests and bs4
+class WikiError(Exception):
+    pass
+
+class WikiDisambiguationError(WikiError):
+    pass
+
+class WikiPageError(WikiError):
+    pass
+
+# runs in an executor, so the first lookup imports wikipedia there instead of on the event loop
+def _fetch_url(title):
+    import requests
+    import wikipedia
+    
+    try:
+        return wikipedia.page(title).url
+    except wikipedia.exceptions.DisambiguationError as e:
+        raise WikiDisambiguationError(title) from e
+    except wikipedia.exceptions.PageError as e:
+        raise WikiPageError(title) from e
+    except wikipedia.exceptions.WikipediaException as e:
+        raise WikiError(str(e)) from e
+    # wikipedia doesn't wrap connection errors, timeouts and bad responses
+    except requests.RequestException as e:
+        raise WikiError(f"couldn't reach wikipedia: {e}") from e
+
+# Gets the url of the wikipedia page for title without blocking the event loop
+# raises WikiDisambiguationError or WikiPageError if there is no page, WikiError if wikipedia fails
+async def get_wiki_url(title):
+    if title in fossil_urls:
+        return fossil_urls[title]
+    
+    key = f"wikipedia:{title.lower()}"
+    cached = database.get(key)
+    if cached is not None:
+        cached = cached.decode("utf-8")
+        if cached == "!disambiguation":
+            raise WikiDisambiguationError(title)
+        if cached == "!missing":
+            raise WikiPageError(title)
+        return cached
+    
+    logger.info(f"fetching wikipedia page for {title}")
+    loop = asyncio.get_event_loop()
+    try:
+        with span("wikipedia", title=title):
+            url = await loop.run_in_executor(None, _fetch_url, title)
+    except WikiDisambiguationError:
+        database.set(key, "!disambiguation", ex=MISSING_EXPIRY)
+        raise
+    except WikiPageError:
+        database.set(key, "!missing", ex=MISSING_EXPIRY)
+        raise
+    database.set(key, url, ex=FOUND_EXPIRY)
+    return url
+
+# lookups precache_urls runs at once
+PRECACHE_CONCURRENCY = 4
+
+# fills the cache for fossils missing from the precomputed urls
+# stops if wikipedia can't be reached, the lookups after would fail too
+async def precache_urls():
+    logger.info("Starting wikipedia caching")
+    limit = asyncio.Semaphore(PRECACHE_CONCURRENCY)
+    unreachable = []
+    
+    async def cache_url(fossil):
+        async with limit:
+            if unreachable:
+                return
+            try:
+                await get_wiki_url(fossil)
+            except (WikiDisambiguationError, WikiPageError):
+                logger.info("no wikipedia page for %s", fossil)
+            except WikiError as e:
+                # the other lookups running at the time fail too
+                if not unreachable:
+                    logger.warning("stopped wikipedia caching at %s: %s", fossil, e)
+                unreachable.append(fossil)
+    
+    await asyncio.gather(*(cache_url(fossil) for fossil in fossils_list if fossil not in fossil_urls))
+    logger.info("Finished wikipedia caching")
+
+if __name__ == "__main__":
+    lines = []
+    for fossil in fossils_list:
+        try:
+            lines.append(f"{fossil}\t{_fetch_url(fossil)}\n")
+        except (WikiDisambiguationError, WikiPageError) as e:
+            print(f"no page for {fossil}: {e}")
+        except WikiError as e:
+            # a partial file would hide the missing fossils until their pages are fetched one by one
+            raise SystemExit(f"not writing {URLS_FILE}: {e}")
+    with open(URLS_FILE, "w") as f:
+        f.writelines(lines)